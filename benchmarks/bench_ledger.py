@@ -0,0 +1,190 @@
+# 记账数据层和页面构建的基准测试
+# 用法：python benchmarks/bench_ledger.py --sizes 1000,10000,100000 --out bench.json
+# 每个规模都在临时目录里生成一份合成账本，结果以 JSON 输出，方便前后两次对比
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from roro_core import DataManager, SqliteDataManager, count_controls  # noqa: E402
+
+# 分类按大致的真实比例抽；收入条目少、金额大
+EXPENSE_WEIGHTS = {"餐饮": 45, "交通": 20, "购物": 15, "娱乐": 8, "居住": 4, "其他": 8}
+INCOME_WEIGHTS = {"工资": 60, "奖金": 10, "兼职": 25, "其他": 5}
+NOTES = ["", "", "", "早饭", "午饭", "晚饭", "打车", "地铁", "超市", "房租", "电影", "咖啡"]
+
+
+def synthetic_records(count, years, seed=0):
+    # 从今天往前 years 年里均匀撒日期，最近一天一定有记录
+    rng = random.Random(seed)
+    today = date.today()
+    span = max(int(years * 365), 1)
+    expense = list(EXPENSE_WEIGHTS), list(EXPENSE_WEIGHTS.values())
+    income = list(INCOME_WEIGHTS), list(INCOME_WEIGHTS.values())
+    for i in range(count):
+        day = today if i % 50 == 0 else today - timedelta(days=rng.randrange(span))
+        if rng.random() < 0.1:
+            rtype, (names, weights), amount = "收入", income, rng.lognormvariate(7, 0.8)
+        else:
+            rtype, (names, weights), amount = "支出", expense, rng.lognormvariate(3, 1)
+        yield {
+            "type": rtype,
+            "amount": round(amount, 2),
+            "category": rng.choices(names, weights)[0],
+            "icon": "",
+            "note": rng.choice(NOTES),
+            "date": day.strftime("%Y-%m-%d"),
+        }
+
+
+def timed(fn, repeat=1):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def summarize(samples):
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "runs": len(ms),
+        "min_ms": round(ms[0], 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+class BenchPage:
+    # 只记录 main() 用到的页面属性，不连 Flet 会话
+    def __init__(self):
+        self.window = types.SimpleNamespace()
+        self.controls = []
+        self.overlay = []
+        self.snack_bar = None
+        self.updates = 0
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def update(self, *controls):
+        self.updates += 1
+
+
+def bench_size(size, years, repeat, backend, with_pages):
+    os.environ["RORO_STORAGE"] = backend
+    results = {"size": size, "backend": backend}
+    manager = SqliteDataManager if backend == "sqlite" else DataManager
+
+    # 生成账本：整批插入，最后写一次
+    dm = manager()
+    samples, _ = timed(lambda: dm.insert_records(synthetic_records(size, years)))
+    results["generate"] = summarize(samples)
+    dm.flush()
+
+    # 冷启动：只读清单和当月
+    samples, dm = timed(manager, repeat)
+    results["load_data"] = summarize(samples)
+    if backend == "json":
+        samples, _ = timed(dm.ensure_months)
+        results["load_all_months"] = summarize(samples)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    month = today[:7]
+    samples, _ = timed(dm.get_today_records, repeat)
+    results["get_today_records"] = summarize(samples)
+    samples, _ = timed(lambda: dm.get_month_summary(month), repeat)
+    results["get_month_summary"] = summarize(samples)
+    samples, _ = timed(dm.get_totals, repeat)
+    results["get_totals"] = summarize(samples)
+    samples, _ = timed(lambda: dm.get_category_totals(month), repeat)
+    results["get_category_totals"] = summarize(samples)
+    # 统计页：不走缓存，每次都对全部历史重新分组
+    samples, _ = timed(lambda: dm.compute_stats(None, None), repeat)
+    results["range_stats_all"] = summarize(samples)
+
+    # 单条增删：没有后台写线程，每次都同步追加日志，计的是落盘后的耗时
+    samples, _ = timed(lambda: dm.add_record("支出", 12.5, "餐饮", "🍜", "bench", today), repeat)
+    results["add_record"] = summarize(samples)
+    ids = iter([r["id"] for r in dm.get_today_records() if r["note"] == "bench"])
+    samples, _ = timed(lambda: dm.delete_record(next(ids)), repeat)
+    results["delete_record"] = summarize(samples)
+
+    # 完整快照：所有月份都记为脏再写
+    if backend == "json":
+        def full_save():
+            dm.dirty_months |= set(dm.by_month)
+            dm.save_data()
+            dm.flush()
+    else:
+        def full_save():
+            dm.save_data()
+    samples, _ = timed(full_save, repeat)
+    results["save_data"] = summarize(samples)
+
+    if with_pages:
+        results["pages"] = bench_pages(repeat)
+    return results
+
+
+def bench_pages(repeat):
+    import main as app
+    page = BenchPage()
+    samples, built = timed(lambda: app.main(page))
+    if built is None:
+        raise RuntimeError("main() 没有正常返回，页面构建失败")
+    pages = {"main": summarize(samples)}
+    _, builders = built
+    for name, build in builders.items():
+        samples, tree = timed(build, repeat)
+        pages[name] = dict(summarize(samples), controls=count_controls(tree))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roro记账数据层基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的记录条数，例如 1000,1000000")
+    parser.add_argument("--years", type=float, default=3, help="记录分布的年数")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--no-pages", action="store_true", help="只测数据层，跳过页面构建（不需要 flet）")
+    parser.add_argument("--out", help="结果写到这个文件，默认打印到标准输出")
+    args = parser.parse_args()
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        workdir = tempfile.mkdtemp(prefix="roro_bench_")
+        os.environ["FLET_APP_STORAGE_DATA"] = workdir
+        try:
+            report["results"].append(bench_size(size, args.years, args.repeat, args.backend, not args.no_pages))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# 网页模式多会话压测：模拟很多个浏览器会话同时打开、同时记账
+# 用法：python benchmarks/bench_sessions.py --records 100000 --sessions 1,10,50 --adds 20 --out sessions.json
+# 看两件事：每多一个会话多占多少内存（应该只是页面控件，和账本大小无关），并发记账有没有丢记录
+import argparse
+import gc
+import json
+import os
+import platform
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ledger import BenchPage, synthetic_records  # noqa: E402
+from roro_core import create_data_manager, shared_managers  # noqa: E402
+
+
+class SessionPage(BenchPage):
+    # 像 Flet 会话一样提供 run_thread：交给它的任务在这个会话自己的线程里按顺序跑
+    def __init__(self):
+        super().__init__()
+        self.tasks = queue.Queue()
+        self.error = None
+        threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            fn = self.tasks.get()
+            try:
+                fn()
+            except Exception as e:
+                self.error = self.error or e
+            self.tasks.task_done()
+
+    def run_thread(self, fn):
+        self.tasks.put(fn)
+
+    def wait(self):
+        self.tasks.join()
+
+
+def traced(fn):
+    # 返回 (结果, 新增的内存字节数, 耗时秒)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before, elapsed
+
+
+def bench_sessions(records, years, counts, adds):
+    import main as app
+    report = {"records": records, "backend": os.environ.get("RORO_STORAGE") or "json"}
+
+    seed = create_data_manager()
+    seed.insert_records(synthetic_records(records, years))
+    seed.flush()
+    del seed
+    shared_managers.clear()
+
+    tracemalloc.start()
+    # 以前每个会话自己建一个 DataManager，这就是每个会话要多付的那份
+    _, report["store_bytes"], elapsed = traced(create_data_manager)
+    report["store_load_ms"] = round(elapsed * 1000, 3)
+
+    pages = []
+    runs = []
+    for target in counts:
+        def open_sessions():
+            while len(pages) < target:
+                page = SessionPage()
+                if app.main(page) is None:
+                    raise RuntimeError("main() 没有正常返回，页面构建失败")
+                page.wait()
+                if page.error is not None:
+                    raise page.error
+                pages.append(page)
+        added = target - len(pages)
+        _, grown, elapsed = traced(open_sessions)
+        current = tracemalloc.get_traced_memory()[0]
+        runs.append({
+            "sessions": target,
+            "open_ms_per_session": round(elapsed * 1000 / max(added, 1), 3),
+            "bytes_per_session": grown // max(added, 1),
+            "total_bytes": current,
+        })
+    tracemalloc.stop()
+    report["runs"] = runs
+    report["managers"] = len(shared_managers)
+
+    # 每个会话一个线程同时记账，结束后各会话都应该收到过推送，落盘的条数一条不少。
+    # 各会话重画放在自己的线程里，记账的耗时不该随会话数变长
+    dm = next(iter(shared_managers.values()))
+    before = dm.get_totals()["count"]
+    updates = [p.updates for p in pages]
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    def writer(index):
+        for i in range(adds):
+            dm.add_record("支出", 1 + i, "餐饮", "🍜", f"session-{index}", today)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(len(pages))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    for page in pages:
+        page.wait()
+    dm.flush()
+    expected = before + adds * len(pages)
+    shared_managers.clear()
+    reloaded = create_data_manager().get_totals()["count"]
+    pushed = [p.updates - u for p, u in zip(pages, updates)]
+    report["concurrent"] = {
+        "sessions": len(pages),
+        "adds_per_session": adds,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "ms_per_add": round(elapsed * 1000 / max(adds * len(pages), 1), 3),
+        "expected": expected,
+        "in_memory": dm.get_totals()["count"],
+        "reloaded": reloaded,
+        "min_updates_per_session": min(pushed),
+    }
+    # 连续的改动会合并成一次重画，每个会话至少刷新过一次就行
+    if reloaded != expected or min(pushed) < 1:
+        report["concurrent"]["error"] = "有记录丢失或有会话没收到推送"
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roro记账多会话压测")
+    parser.add_argument("--records", type=int, default=100000, help="账本里预先生成的记录条数")
+    parser.add_argument("--years", type=float, default=3, help="记录分布的年数")
+    parser.add_argument("--sessions", default="1,10,50", help="逗号分隔、递增的会话数")
+    parser.add_argument("--adds", type=int, default=20, help="并发阶段每个会话记几笔")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--out", help="结果写到这个文件，默认打印到标准输出")
+    args = parser.parse_args()
+
+    os.environ["RORO_STORAGE"] = args.backend
+    workdir = tempfile.mkdtemp(prefix="roro_sessions_")
+    os.environ["FLET_APP_STORAGE_DATA"] = workdir
+    try:
+        counts = sorted(int(s) for s in args.sessions.split(",") if s.strip())
+        result = bench_sessions(args.records, args.years, counts, args.adds)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "result": result,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,640 +1,1222 @@
-import flet as ft
-from datetime import datetime
-import json
-import os
-import traceback
-
-
-def main(page: ft.Page):
-    page.title = "Roro记账"
-    page.bgcolor = "#F5F5F5"
-    page.padding = 0
-    page.spacing = 0
-    
-    # 适配手机全屏
-    page.window.width = 400
-    page.window.height = 800
-    
-    PRIMARY = "#6C5CE7"
-    INCOME = "#00B894"
-    EXPENSE = "#E17055"
-    
-    # 获取安全区域（适配刘海屏）
-    safe_area_top = 40  # 顶部安全距离
-    safe_area_bottom = 20  # 底部安全距离
-    
-    def show_error(e):
-        page.controls.clear()
-        page.add(
-            ft.Container(
-                ft.Column([
-                    ft.Text("出错了", size=24, color="white"),
-                    ft.Container(height=20),
-                    ft.Text(str(e), size=12, color="white"),
-                ], scroll=ft.ScrollMode.AUTO),
-                bgcolor="#E74C3C",
-                padding=20,
-                expand=True,
-            )
-        )
-        page.update()
-    
-    try:
-        class DataManager:
-            def __init__(self):
-                self.data_file = "roro_data.json"
-                self.data = self.load_data()
-            
-            def get_data_path(self):
-                try:
-                    storage = os.environ.get('FLET_APP_STORAGE_DATA')
-                    if storage:
-                        os.makedirs(storage, exist_ok=True)
-                        return os.path.join(storage, self.data_file)
-                except:
-                    pass
-                return self.data_file
-            
-            def load_data(self):
-                try:
-                    path = self.get_data_path()
-                    if os.path.exists(path):
-                        with open(path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            if "records" not in data:
-                                data["records"] = []
-                            if "categories" not in data:
-                                data["categories"] = self.default_categories()
-                            return data
-                except:
-                    pass
-                return {"records": [], "categories": self.default_categories()}
-            
-            def default_categories(self):
-                return {
-                    "支出": [
-                        {"name": "餐饮", "icon": "🍜", "color": "#FF6B6B"},
-                        {"name": "交通", "icon": "🚗", "color": "#4ECDC4"},
-                        {"name": "购物", "icon": "🛒", "color": "#45B7D1"},
-                        {"name": "娱乐", "icon": "🎮", "color": "#96CEB4"},
-                        {"name": "居住", "icon": "🏠", "color": "#FFEAA7"},
-                        {"name": "其他", "icon": "💡", "color": "#95A5A6"},
-                    ],
-                    "收入": [
-                        {"name": "工资", "icon": "💰", "color": "#4ECDC4"},
-                        {"name": "奖金", "icon": "🎁", "color": "#F39C12"},
-                        {"name": "兼职", "icon": "💼", "color": "#3498DB"},
-                        {"name": "其他", "icon": "💡", "color": "#95A5A6"},
-                    ]
-                }
-            
-            def save_data(self):
-                try:
-                    path = self.get_data_path()
-                    with open(path, 'w', encoding='utf-8') as f:
-                        json.dump(self.data, f, ensure_ascii=False)
-                except:
-                    pass
-            
-            def add_record(self, rtype, amount, category, icon, note, date):
-                self.data["records"].append({
-                    "id": datetime.now().timestamp(),
-                    "type": rtype,
-                    "amount": amount,
-                    "category": category,
-                    "icon": icon,
-                    "note": note,
-                    "date": date,
-                })
-                self.save_data()
-            
-            def delete_record(self, rid):
-                self.data["records"] = [r for r in self.data["records"] if r.get("id") != rid]
-                self.save_data()
-            
-            def get_today_records(self):
-                today = datetime.now().strftime("%Y-%m-%d")
-                return [r for r in self.data["records"] if r.get("date") == today]
-            
-            def get_month_summary(self):
-                now = datetime.now()
-                prefix = f"{now.year}-{now.month:02d}"
-                records = [r for r in self.data["records"] if r.get("date", "").startswith(prefix)]
-                income = sum(r.get("amount", 0) for r in records if r.get("type") == "收入")
-                expense = sum(r.get("amount", 0) for r in records if r.get("type") == "支出")
-                return {"income": income, "expense": expense, "balance": income - expense}
-        
-        dm = DataManager()
-        
-        current_type = "支出"
-        current_cat = None
-        current_icon = None
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        
-        # ========== 首页 ==========
-        def build_home():
-            summary = dm.get_month_summary()
-            records = dm.get_today_records()
-            
-            def delete_r(rid):
-                dm.delete_record(rid)
-                refresh_all()
-            
-            record_items = []
-            for r in reversed(records):
-                is_exp = r.get("type") == "支出"
-                record_items.append(
-                    ft.Container(
-                        ft.Row([
-                            ft.Container(
-                                ft.Text(r.get("icon", "💰"), size=20),
-                                width=40,
-                                height=40,
-                                bgcolor="#F5F5F5",
-                                border_radius=10,
-                                alignment=ft.Alignment(0, 0),
-                            ),
-                            ft.Container(width=10),
-                            ft.Column([
-                                ft.Text(r.get("category", ""), size=14, weight=ft.FontWeight.W_500),
-                                ft.Text(r.get("note", "") or "无备注", size=11, color="#888"),
-                            ], spacing=2, expand=True),
-                            ft.Text(
-                                f"{'−' if is_exp else '+'} ¥{r.get('amount', 0):.2f}",
-                                color=EXPENSE if is_exp else INCOME,
-                                weight=ft.FontWeight.BOLD,
-                                size=15,
-                            ),
-                            ft.IconButton(
-                                icon="close",
-                                icon_size=16,
-                                icon_color="#CCC",
-                                on_click=lambda e, rid=r.get("id"): delete_r(rid),
-                            ),
-                        ]),
-                        bgcolor="white",
-                        padding=ft.Padding(12, 10, 8, 10),
-                        border_radius=12,
-                        margin=ft.Margin(0, 0, 0, 8),
-                    )
-                )
-            
-            if not record_items:
-                record_items = [
-                    ft.Container(
-                        ft.Column([
-                            ft.Text("📝", size=40),
-                            ft.Container(height=10),
-                            ft.Text("今日暂无记录", color="#999", size=14),
-                            ft.Text("点击下方按钮开始记账", color="#CCC", size=12),
-                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=5),
-                        padding=50,
-                        alignment=ft.Alignment(0, 0),
-                    )
-                ]
-            
-            return ft.Container(
-                ft.Column([
-                    # 顶部卡片区域
-                    ft.Container(
-                        ft.Column([
-                            # 安全区域占位
-                            ft.Container(height=safe_area_top),
-                            # 标题
-                            ft.Row([
-                                ft.Column([
-                                    ft.Text("Roro记账", size=24, weight=ft.FontWeight.BOLD, color="white"),
-                                    ft.Text(datetime.now().strftime("%Y年%m月"), size=13, color="#FFFFFFBB"),
-                                ], spacing=2),
-                            ]),
-                            ft.Container(height=20),
-                            # 汇总卡片
-                            ft.Container(
-                                ft.Row([
-                                    ft.Column([
-                                        ft.Text("支出", size=12, color="#888"),
-                                        ft.Container(height=5),
-                                        ft.Text(f"¥{summary['expense']:.2f}", size=20, weight=ft.FontWeight.BOLD),
-                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                                    ft.Container(width=1, height=40, bgcolor="#EEE"),
-                                    ft.Column([
-                                        ft.Text("收入", size=12, color="#888"),
-                                        ft.Container(height=5),
-                                        ft.Text(f"¥{summary['income']:.2f}", size=20, weight=ft.FontWeight.BOLD, color=INCOME),
-                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                                    ft.Container(width=1, height=40, bgcolor="#EEE"),
-                                    ft.Column([
-                                        ft.Text("结余", size=12, color="#888"),
-                                        ft.Container(height=5),
-                                        ft.Text(f"¥{summary['balance']:.2f}", size=20, weight=ft.FontWeight.BOLD,
-                                               color=INCOME if summary['balance'] >= 0 else EXPENSE),
-                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                                ]),
-                                bgcolor="white",
-                                padding=ft.Padding(15, 20, 15, 20),
-                                border_radius=16,
-                            ),
-                        ]),
-                        gradient=ft.LinearGradient(
-                            colors=[PRIMARY, "#A29BFE"],
-                            begin=ft.Alignment(-1, -1),
-                            end=ft.Alignment(1, 1),
-                        ),
-                        padding=ft.Padding(20, 0, 20, 25),
-                        border_radius=ft.BorderRadius(0, 0, 30, 30),
-                    ),
-                    # 今日记录标题
-                    ft.Container(
-                        ft.Row([
-                            ft.Text("今日记录", size=16, weight=ft.FontWeight.BOLD),
-                            ft.Text(datetime.now().strftime("%m/%d"), size=13, color="#999"),
-                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                        padding=ft.Padding(20, 20, 20, 10),
-                    ),
-                    # 记录列表
-                    ft.Container(
-                        ft.Column(record_items, spacing=0),
-                        padding=ft.Padding(15, 0, 15, 0),
-                        expand=True,
-                    ),
-                    # 底部占位（导航栏高度 + 安全区域）
-                    ft.Container(height=70 + safe_area_bottom),
-                ], spacing=0),
-                expand=True,
-                bgcolor="#F5F5F5",
-            )
-        
-        # ========== 记账页 ==========
-        def build_add():
-            nonlocal current_type, current_cat, current_icon, current_date
-            
-            amount_field = ft.TextField(
-                hint_text="0.00",
-                text_align=ft.TextAlign.CENTER,
-                text_size=36,
-                keyboard_type=ft.KeyboardType.NUMBER,
-                border=ft.InputBorder.NONE,
-                color="white",
-                hint_style=ft.TextStyle(color="#FFFFFF66", size=36),
-            )
-            note_field = ft.TextField(
-                hint_text="添加备注...",
-                border_radius=12,
-                bgcolor="white",
-                border_color="#EEE",
-            )
-            date_text = ft.Text(current_date, color="white", size=14)
-            
-            exp_text = ft.Text("支出", size=16, weight=ft.FontWeight.BOLD, color="white")
-            inc_text = ft.Text("收入", size=16, color="#FFFFFF88")
-            
-            cat_grid = ft.GridView(
-                runs_count=4,
-                spacing=15,
-                run_spacing=15,
-                child_aspect_ratio=0.85,
-                expand=True,
-                padding=10,
-            )
-            
-            def switch_type(t):
-                nonlocal current_type, current_cat, current_icon
-                current_type = t
-                current_cat = None
-                current_icon = None
-                if t == "支出":
-                    exp_text.color = "white"
-                    exp_text.weight = ft.FontWeight.BOLD
-                    inc_text.color = "#FFFFFF88"
-                    inc_text.weight = None
-                else:
-                    inc_text.color = "white"
-                    inc_text.weight = ft.FontWeight.BOLD
-                    exp_text.color = "#FFFFFF88"
-                    exp_text.weight = None
-                load_categories()
-                page.update()
-            
-            def load_categories():
-                cats = dm.data["categories"].get(current_type, [])
-                cat_grid.controls.clear()
-                for c in cats:
-                    if not isinstance(c, dict):
-                        continue
-                    selected = current_cat == c.get("name")
-                    cat_grid.controls.append(
-                        ft.Container(
-                            ft.Column([
-                                ft.Container(
-                                    ft.Text(c.get("icon", "💰"), size=28),
-                                    width=55,
-                                    height=55,
-                                    bgcolor=c.get("color", "#999") if selected else c.get("color", "#999") + "25",
-                                    border_radius=15,
-                                    alignment=ft.Alignment(0, 0),
-                                ),
-                                ft.Container(height=5),
-                                ft.Text(
-                                    c.get("name", ""),
-                                    size=12,
-                                    color="#333" if selected else "#888",
-                                    weight=ft.FontWeight.W_500 if selected else None,
-                                ),
-                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=0),
-                            on_click=lambda e, cat=c: select_cat(cat),
-                        )
-                    )
-            
-            def select_cat(c):
-                nonlocal current_cat, current_icon
-                current_cat = c.get("name")
-                current_icon = c.get("icon")
-                load_categories()
-                page.update()
-            
-            def save_record(e):
-                nonlocal current_cat, current_icon
-                if not amount_field.value:
-                    page.snack_bar = ft.SnackBar(ft.Text("请输入金额", color="white"), bgcolor=EXPENSE)
-                    page.snack_bar.open = True
-                    page.update()
-                    return
-                if not current_cat:
-                    page.snack_bar = ft.SnackBar(ft.Text("请选择分类", color="white"), bgcolor=EXPENSE)
-                    page.snack_bar.open = True
-                    page.update()
-                    return
-                try:
-                    amt = float(amount_field.value)
-                except:
-                    page.snack_bar = ft.SnackBar(ft.Text("金额无效", color="white"), bgcolor=EXPENSE)
-                    page.snack_bar.open = True
-                    page.update()
-                    return
-                
-                dm.add_record(current_type, amt, current_cat, current_icon or "💰", note_field.value or "", current_date)
-                
-                amount_field.value = ""
-                note_field.value = ""
-                current_cat = None
-                current_icon = None
-                load_categories()
-                
-                page.snack_bar = ft.SnackBar(ft.Text("✓ 保存成功", color="white"), bgcolor=INCOME)
-                page.snack_bar.open = True
-                refresh_all()
-            
-            # 快捷金额按钮
-            quick_amounts = [10, 20, 50, 100, 200]
-            
-            def add_quick(amt):
-                try:
-                    current = float(amount_field.value or 0)
-                    amount_field.value = str(current + amt)
-                except:
-                    amount_field.value = str(amt)
-                page.update()
-            
-            quick_btns = ft.Row(
-                [
-                    ft.Container(
-                        ft.Text(f"+{a}", size=13, color="white"),
-                        bgcolor="#FFFFFF30",
-                        padding=ft.Padding(12, 6, 12, 6),
-                        border_radius=15,
-                        on_click=lambda e, amt=a: add_quick(amt),
-                    ) for a in quick_amounts
-                ],
-                alignment=ft.MainAxisAlignment.CENTER,
-                spacing=8,
-            )
-            
-            load_categories()
-            
-            return ft.Container(
-                ft.Column([
-                    # 顶部输入区域
-                    ft.Container(
-                        ft.Column([
-                            ft.Container(height=safe_area_top),
-                            # 类型切换
-                            ft.Row([
-                                ft.Container(exp_text, on_click=lambda e: switch_type("支出"), padding=10),
-                                ft.Container(inc_text, on_click=lambda e: switch_type("收入"), padding=10),
-                            ], alignment=ft.MainAxisAlignment.CENTER, spacing=30),
-                            ft.Container(height=20),
-                            # 金额输入
-                            ft.Row([
-                                ft.Text("¥", size=30, color="#FFFFFF88"),
-                                ft.Container(amount_field, expand=True),
-                            ], alignment=ft.MainAxisAlignment.CENTER),
-                            ft.Container(height=15),
-                            # 快捷金额
-                            quick_btns,
-                            ft.Container(height=15),
-                            # 日期显示
-                            ft.Container(
-                                ft.Row([
-                                    ft.Icon("event", size=18, color="#FFFFFF88"),
-                                    ft.Container(width=8),
-                                    date_text,
-                                ], alignment=ft.MainAxisAlignment.CENTER),
-                                bgcolor="#FFFFFF20",
-                                padding=ft.Padding(20, 10, 20, 10),
-                                border_radius=12,
-                            ),
-                        ]),
-                        gradient=ft.LinearGradient(
-                            colors=[PRIMARY, "#A29BFE"],
-                            begin=ft.Alignment(0, -1),
-                            end=ft.Alignment(0, 1),
-                        ),
-                        padding=ft.Padding(20, 0, 20, 25),
-                        border_radius=ft.BorderRadius(0, 0, 30, 30),
-                    ),
-                    # 分类选择
-                    ft.Container(
-                        ft.Column([
-                            ft.Text("选择分类", size=15, weight=ft.FontWeight.BOLD),
-                            ft.Container(height=10),
-                            cat_grid,
-                        ]),
-                        padding=ft.Padding(15, 20, 15, 0),
-                        expand=True,
-                    ),
-                    # 备注和保存
-                    ft.Container(
-                        ft.Column([
-                            note_field,
-                            ft.Container(height=15),
-                            ft.ElevatedButton(
-                                "保存",
-                                width=float("inf"),
-                                height=50,
-                                bgcolor=PRIMARY,
-                                color="white",
-                                style=ft.ButtonStyle(
-                                    shape=ft.RoundedRectangleBorder(radius=12),
-                                ),
-                                on_click=save_record,
-                            ),
-                        ]),
-                        padding=ft.Padding(20, 10, 20, 80 + safe_area_bottom),
-                    ),
-                ], spacing=0),
-                expand=True,
-                bgcolor="#F5F5F5",
-            )
-        
-        # ========== 设置页 ==========
-        def build_settings():
-            total = len(dm.data.get("records", []))
-            exp = sum(r.get("amount", 0) for r in dm.data.get("records", []) if r.get("type") == "支出")
-            inc = sum(r.get("amount", 0) for r in dm.data.get("records", []) if r.get("type") == "收入")
-            
-            def clear_data(e):
-                dm.data["records"] = []
-                dm.save_data()
-                page.snack_bar = ft.SnackBar(ft.Text("数据已清空", color="white"), bgcolor="#F39C12")
-                page.snack_bar.open = True
-                refresh_all()
-            
-            return ft.Container(
-                ft.Column([
-                    # 顶部
-                    ft.Container(
-                        ft.Column([
-                            ft.Container(height=safe_area_top),
-                            ft.Text("设置", size=22, weight=ft.FontWeight.BOLD, color="white"),
-                        ]),
-                        gradient=ft.LinearGradient(
-                            colors=[PRIMARY, "#A29BFE"],
-                            begin=ft.Alignment(-1, -1),
-                            end=ft.Alignment(1, 1),
-                        ),
-                        padding=ft.Padding(20, 0, 20, 25),
-                        border_radius=ft.BorderRadius(0, 0, 30, 30),
-                        alignment=ft.Alignment(0, 0),
-                    ),
-                    # 统计卡片
-                    ft.Container(
-                        ft.Row([
-                            ft.Column([
-                                ft.Text(f"{total}", size=26, weight=ft.FontWeight.BOLD, color=PRIMARY),
-                                ft.Text("总记录", size=12, color="#888"),
-                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                            ft.Container(width=1, height=50, bgcolor="#EEE"),
-                            ft.Column([
-                                ft.Text(f"¥{exp:.0f}", size=26, weight=ft.FontWeight.BOLD, color=EXPENSE),
-                                ft.Text("总支出", size=12, color="#888"),
-                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                            ft.Container(width=1, height=50, bgcolor="#EEE"),
-                            ft.Column([
-                                ft.Text(f"¥{inc:.0f}", size=26, weight=ft.FontWeight.BOLD, color=INCOME),
-                                ft.Text("总收入", size=12, color="#888"),
-                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
-                        ]),
-                        bgcolor="white",
-                        margin=ft.Margin(15, 20, 15, 0),
-                        padding=ft.Padding(15, 25, 15, 25),
-                        border_radius=16,
-                    ),
-                    # 设置项
-                    ft.Container(
-                        ft.Column([
-                            ft.Container(
-                                ft.Row([
-                                    ft.Container(
-                                        ft.Icon("delete_outline", color=EXPENSE, size=22),
-                                        width=45,
-                                        height=45,
-                                        bgcolor=EXPENSE + "15",
-                                        border_radius=12,
-                                        alignment=ft.Alignment(0, 0),
-                                    ),
-                                    ft.Container(width=15),
-                                    ft.Column([
-                                        ft.Text("清空数据", size=15, weight=ft.FontWeight.W_500),
-                                        ft.Text("删除所有记账记录", size=12, color="#999"),
-                                    ], spacing=2, expand=True),
-                                    ft.Icon("chevron_right", color="#CCC"),
-                                ]),
-                                bgcolor="white",
-                                padding=ft.Padding(15, 12, 10, 12),
-                                border_radius=14,
-                                on_click=clear_data,
-                            ),
-                        ]),
-                        padding=ft.Padding(15, 20, 15, 0),
-                    ),
-                    # 关于
-                    ft.Container(
-                        ft.Column([
-                            ft.Text("🐰", size=50),
-                            ft.Container(height=10),
-                            ft.Text("Roro记账", size=18, weight=ft.FontWeight.BOLD),
-                            ft.Text("v2.0.0", size=12, color="#999"),
-                            ft.Container(height=20),
-                            ft.Text("Made with ❤️", size=13, color="#999"),
-                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
-                        padding=ft.Padding(0, 40, 0, 0),
-                        alignment=ft.Alignment(0, 0),
-                    ),
-                    ft.Container(height=80 + safe_area_bottom),
-                ], spacing=0),
-                expand=True,
-                bgcolor="#F5F5F5",
-            )
-        
-        # ========== 导航 ==========
-        home_page = ft.Container(expand=True)
-        add_page = ft.Container(expand=True)
-        settings_page = ft.Container(expand=True)
-        
-        pages_list = [home_page, add_page, settings_page]
-        content = ft.Container(pages_list[0], expand=True)
-        
-        def refresh_all():
-            home_page.content = build_home()
-            add_page.content = build_add()
-            settings_page.content = build_settings()
-            page.update()
-        
-        def nav_change(e):
-            content.content = pages_list[e.control.selected_index]
-            page.update()
-        
-        nav = ft.NavigationBar(
-            selected_index=0,
-            bgcolor="white",
-            on_change=nav_change,
-            height=65,
-            elevation=10,
-            shadow_color="#00000020",
-            indicator_color=PRIMARY + "20",
-            destinations=[
-                ft.NavigationBarDestination(icon="home_outlined", selected_icon="home", label="首页"),
-                ft.NavigationBarDestination(icon="add_circle_outline", selected_icon="add_circle", label="记账"),
-                ft.NavigationBarDestination(icon="settings_outlined", selected_icon="settings", label="设置"),
-            ],
-        )
-        
-        refresh_all()
-        
-        page.add(
-            ft.Stack([
-                content,
-                ft.Container(
-                    nav,
-                    bottom=0,
-                    left=0,
-                    right=0,
-                ),
-            ], expand=True)
-        )
-    
-    except Exception as e:
-        show_error(f"{str(e)}\n\n{traceback.format_exc()}")
-
-
-ft.app(target=main)
+import flet as ft
+from datetime import datetime, timedelta
+import csv
+import sqlite3
+import threading
+import time
+import traceback
+
+from roro_core import RECURRING_FREQS, count_controls, parse_search_query, perf, shared_data_manager
+
+
+def main(page: ft.Page):
+    page.title = "Roro记账"
+    page.bgcolor = "#F5F5F5"
+    page.padding = 0
+    page.spacing = 0
+    
+    # 适配手机全屏
+    page.window.width = 400
+    page.window.height = 800
+    
+    PRIMARY = "#6C5CE7"
+    INCOME = "#00B894"
+    EXPENSE = "#E17055"
+    
+    # 获取安全区域（适配刘海屏）
+    safe_area_top = 40  # 顶部安全距离
+    safe_area_bottom = 20  # 底部安全距离
+    
+    def show_error(e):
+        page.controls.clear()
+        page.add(
+            ft.Container(
+                ft.Column([
+                    ft.Text("出错了", size=24, color="white"),
+                    ft.Container(height=20),
+                    ft.Text(str(e), size=12, color="white"),
+                ], scroll=ft.ScrollMode.AUTO),
+                bgcolor="#E74C3C",
+                padding=20,
+                expand=True,
+            )
+        )
+        page.update()
+    
+    try:
+        # 启动分两段：先画出导航栏和骨架占位，读数据、建首页放到后台；其余页面第一次切过去时才建
+        startup = time.perf_counter()
+        dm = None
+        # 每次 page.update() 的耗时和当时整页的控件数
+        page.update = perf.wrap("page.update", page.update, lambda _: {"controls": count_controls(page)})
+        
+        def on_save_error(e):
+            page.snack_bar = ft.SnackBar(ft.Text(f"保存失败：{e}", color="white"), bgcolor=EXPENSE)
+            page.snack_bar.open = True
+            page.update()
+        
+        def on_lifecycle_change(e):
+            # 切到后台或者关闭前，把还没写的改动立刻落盘
+            if e.state in (
+                ft.AppLifecycleState.INACTIVE,
+                ft.AppLifecycleState.HIDE,
+                ft.AppLifecycleState.PAUSE,
+                ft.AppLifecycleState.DETACH,
+            ):
+                dm.flush()
+            elif e.state in (ft.AppLifecycleState.RESUME, ft.AppLifecycleState.SHOW):
+                # 回到前台时看一眼命令行或同步任务有没有改过数据，离开期间到期的周期记账也补上
+                dm.check_external()
+                dm.materialize_recurring()
+
+        def on_close(e):
+            # 会话过期后不再接收别的会话的改动
+            dm.unsubscribe(on_data_change, on_save_error)
+            dm.flush()
+        
+        current_type = "支出"
+        current_cat = None
+        current_icon = None
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        
+        # ========== 首页 ==========
+        home_refs = {}
+        
+        # 记录列表按页从 DataManager 的游标里取，滚到接近底部再加载下一页
+        RECORD_PAGE_SIZE = 30
+        # 每一行（含下边距）的固定高度，ListView 靠它做虚拟化
+        RECORD_EXTENT = 68
+        
+        def delete_r(rid):
+            # 列表和汇总由 on_data_change 刷新
+            dm.delete_record(rid)
+        
+        def build_record_item(r):
+            is_exp = r.get("type") == "支出"
+            return ft.Container(
+                ft.Row([
+                    ft.Container(
+                        ft.Text(r.get("icon", "💰"), size=20),
+                        width=40,
+                        height=40,
+                        bgcolor="#F5F5F5",
+                        border_radius=10,
+                        alignment=ft.Alignment(0, 0),
+                    ),
+                    ft.Container(width=10),
+                    ft.Column([
+                        ft.Text(r.get("category", ""), size=14, weight=ft.FontWeight.W_500),
+                        ft.Text(r.get("note", "") or "无备注", size=11, color="#888"),
+                    ], spacing=2, expand=True),
+                    ft.Text(
+                        f"{'−' if is_exp else '+'} ¥{r.get('amount', 0):.2f}",
+                        color=EXPENSE if is_exp else INCOME,
+                        weight=ft.FontWeight.BOLD,
+                        size=15,
+                    ),
+                    ft.IconButton(
+                        icon="close",
+                        icon_size=16,
+                        icon_color="#CCC",
+                        on_click=lambda e, rid=r.get("id"): delete_r(rid),
+                    ),
+                ]),
+                bgcolor="white",
+                padding=ft.Padding(12, 10, 8, 10),
+                border_radius=12,
+                margin=ft.Margin(0, 0, 0, 8),
+            )
+        
+        def build_date_header(date):
+            return ft.Container(
+                ft.Text(date, size=13, color="#999", weight=ft.FontWeight.W_500),
+                height=RECORD_EXTENT,
+                padding=ft.Padding(5, 0, 0, 8),
+                alignment=ft.Alignment(-1, 1),
+            )
+        
+        def load_more_records(state, list_view):
+            # 从游标里再取一页；日期变化时插入日期标题
+            count = 0
+            for r in state["cursor"]:
+                date = r.get("date", "")
+                if date != state["last_date"]:
+                    list_view.controls.append(build_date_header(date))
+                    state["last_date"] = date
+                list_view.controls.append(build_record_item(r))
+                count += 1
+                if count >= RECORD_PAGE_SIZE:
+                    return count
+            state["done"] = True
+            return count
+        
+        def on_record_scroll(e):
+            state = home_refs["cursor"]
+            if state["done"] or e.pixels < e.max_scroll_extent - RECORD_EXTENT * 5:
+                return
+            if load_more_records(state, home_refs["records"]):
+                home_refs["records"].update()
+        
+        def on_search_change(e):
+            refresh_records()
+            home_refs["record_area"].update()
+            home_refs["list_title"].update()
+        
+        def build_empty_records(icon="📝", title="今日暂无记录", hint="点击下方按钮开始记账"):
+            return ft.Container(
+                ft.Column([
+                    ft.Text(icon, size=40),
+                    ft.Container(height=10),
+                    ft.Text(title, color="#999", size=14),
+                    ft.Text(hint, color="#CCC", size=12),
+                ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=5),
+                padding=50,
+                alignment=ft.Alignment(0, 0),
+            )
+        
+        def build_home():
+            home_refs["title_month"] = ft.Text("", size=13, color="#FFFFFFBB")
+            home_refs["today"] = ft.Text("", size=13, color="#999")
+            home_refs["expense"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD)
+            home_refs["income"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD, color=INCOME)
+            home_refs["balance"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD)
+            home_refs["records"] = ft.ListView(
+                spacing=0,
+                item_extent=RECORD_EXTENT,
+                expand=True,
+                on_scroll=on_record_scroll,
+                on_scroll_interval=100,
+            )
+            home_refs["empty"] = build_empty_records()
+            home_refs["no_match"] = build_empty_records("🔍", "没有找到相关记录", "换个关键词，或去掉金额、日期条件试试")
+            home_refs["list_title"] = ft.Text("今日记录", size=16, weight=ft.FontWeight.BOLD)
+            home_refs["search"] = ft.TextField(
+                hint_text="搜索备注或分类，可加 支出/收入、>100、<50、2025-03",
+                prefix=ft.Text("🔍 ", size=13),
+                border_radius=20,
+                height=40,
+                text_size=13,
+                content_padding=ft.Padding(12, 0, 12, 0),
+                bgcolor="white",
+                border_color="#EEE",
+                on_change=on_search_change,
+            )
+            home_refs["record_area"] = ft.Container(
+                padding=ft.Padding(15, 0, 15, 0),
+                expand=True,
+            )
+            update_home()
+            
+            return ft.Container(
+                ft.Column([
+                    # 顶部卡片区域
+                    ft.Container(
+                        ft.Column([
+                            # 安全区域占位
+                            ft.Container(height=safe_area_top),
+                            # 标题
+                            ft.Row([
+                                ft.Column([
+                                    ft.Text("Roro记账", size=24, weight=ft.FontWeight.BOLD, color="white"),
+                                    home_refs["title_month"],
+                                ], spacing=2),
+                            ]),
+                            ft.Container(height=20),
+                            # 汇总卡片
+                            ft.Container(
+                                ft.Row([
+                                    ft.Column([
+                                        ft.Text("支出", size=12, color="#888"),
+                                        ft.Container(height=5),
+                                        home_refs["expense"],
+                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                    ft.Container(width=1, height=40, bgcolor="#EEE"),
+                                    ft.Column([
+                                        ft.Text("收入", size=12, color="#888"),
+                                        ft.Container(height=5),
+                                        home_refs["income"],
+                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                    ft.Container(width=1, height=40, bgcolor="#EEE"),
+                                    ft.Column([
+                                        ft.Text("结余", size=12, color="#888"),
+                                        ft.Container(height=5),
+                                        home_refs["balance"],
+                                    ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                ]),
+                                bgcolor="white",
+                                padding=ft.Padding(15, 20, 15, 20),
+                                border_radius=16,
+                            ),
+                        ]),
+                        gradient=ft.LinearGradient(
+                            colors=[PRIMARY, "#A29BFE"],
+                            begin=ft.Alignment(-1, -1),
+                            end=ft.Alignment(1, 1),
+                        ),
+                        padding=ft.Padding(20, 0, 20, 25),
+                        border_radius=ft.BorderRadius(0, 0, 30, 30),
+                    ),
+                    # 搜索框
+                    ft.Container(home_refs["search"], padding=ft.Padding(15, 15, 15, 0)),
+                    # 今日记录 / 搜索结果标题
+                    ft.Container(
+                        ft.Row([
+                            home_refs["list_title"],
+                            home_refs["today"],
+                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                        padding=ft.Padding(20, 15, 20, 10),
+                    ),
+                    # 记录列表
+                    home_refs["record_area"],
+                    # 底部占位（导航栏高度 + 安全区域）
+                    ft.Container(height=70 + safe_area_bottom),
+                ], spacing=0),
+                expand=True,
+                bgcolor="#F5F5F5",
+            )
+        
+        def update_home():
+            # 只改依赖数据的几个控件，页面其余部分原样保留；本月收支走按天的前缀和
+            now = datetime.now()
+            month_start = now.replace(day=1)
+            month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            summary = dm.get_range_summary(month_start.strftime("%Y-%m-%d"), month_end.strftime("%Y-%m-%d"))
+            home_refs["title_month"].value = now.strftime("%Y年%m月")
+            home_refs["today"].value = now.strftime("%m/%d")
+            home_refs["expense"].value = f"¥{summary['expense']:.2f}"
+            home_refs["income"].value = f"¥{summary['income']:.2f}"
+            home_refs["balance"].value = f"¥{summary['balance']:.2f}"
+            home_refs["balance"].color = INCOME if summary['balance'] >= 0 else EXPENSE
+            refresh_records()
+        
+        def refresh_records():
+            # 搜索框有内容时列表换成搜索结果，结果同样按页从游标里取
+            query = (home_refs["search"].value or "").strip()
+            if query:
+                home_refs["list_title"].value = "搜索结果"
+                home_refs["today"].visible = False
+                home_refs["cursor"] = {"cursor": dm.search_records(**parse_search_query(query)), "last_date": None, "done": False}
+                empty = home_refs["no_match"]
+            else:
+                today = datetime.now().strftime("%Y-%m-%d")
+                home_refs["list_title"].value = "今日记录"
+                home_refs["today"].visible = True
+                # 首页只列今天，今天的日期标题已经在上面了
+                home_refs["cursor"] = {"cursor": dm.iter_records(today, today), "last_date": today, "done": False}
+                empty = home_refs["empty"]
+            home_refs["records"].controls = []
+            load_more_records(home_refs["cursor"], home_refs["records"])
+            has_records = bool(home_refs["records"].controls)
+            home_refs["record_area"].content = home_refs["records"] if has_records else empty
+        
+        # ========== 记账页 ==========
+        add_refs = {}
+        
+        def build_add():
+            nonlocal current_type, current_cat, current_icon, current_date
+            
+            amount_field = ft.TextField(
+                hint_text="0.00",
+                text_align=ft.TextAlign.CENTER,
+                text_size=36,
+                keyboard_type=ft.KeyboardType.NUMBER,
+                border=ft.InputBorder.NONE,
+                color="white",
+                hint_style=ft.TextStyle(color="#FFFFFF66", size=36),
+            )
+            note_field = ft.TextField(
+                hint_text="添加备注...",
+                border_radius=12,
+                bgcolor="white",
+                border_color="#EEE",
+            )
+            repeat_field = ft.Dropdown(
+                value="none",
+                options=[ft.dropdown.Option("none", "不重复")] + [
+                    ft.dropdown.Option(freq, label) for freq, label in RECURRING_FREQS.items()
+                ],
+                width=110,
+                border_radius=12,
+                bgcolor="white",
+                border_color="#EEE",
+            )
+            date_text = ft.Text(current_date, color="white", size=14)
+            
+            exp_text = ft.Text("支出", size=16, weight=ft.FontWeight.BOLD, color="white")
+            inc_text = ft.Text("收入", size=16, color="#FFFFFF88")
+            
+            # 每种类型的分类网格只建一次；切换类型直接换网格，选中只改前后两个格子
+            cat_area = ft.Container(expand=True)
+            cat_grids = {}
+            
+            def build_cat_grid(cats):
+                grid = ft.GridView(
+                    runs_count=4,
+                    spacing=15,
+                    run_spacing=15,
+                    child_aspect_ratio=0.85,
+                    expand=True,
+                    padding=10,
+                )
+                tiles = {}
+                for c in cats:
+                    icon_box = ft.Container(
+                        ft.Text(c.get("icon", "💰"), size=28),
+                        width=55,
+                        height=55,
+                        border_radius=15,
+                        alignment=ft.Alignment(0, 0),
+                    )
+                    label = ft.Text(c.get("name", ""), size=12)
+                    tile = ft.Container(
+                        ft.Column([
+                            icon_box,
+                            ft.Container(height=5),
+                            label,
+                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=0),
+                        on_click=lambda e, cat=c: select_cat(cat),
+                    )
+                    tiles[c.get("name")] = (tile, icon_box, label, c.get("color", "#999"))
+                    style_tile(tiles[c.get("name")], False)
+                    grid.controls.append(tile)
+                return {"grid": grid, "tiles": tiles, "names": [c.get("name") for c in cats]}
+            
+            def style_tile(entry, selected):
+                tile, icon_box, label, color = entry
+                icon_box.bgcolor = color if selected else color + "25"
+                label.color = "#333" if selected else "#888"
+                label.weight = ft.FontWeight.W_500 if selected else None
+            
+            def get_cat_grid(t):
+                cats = [c for c in dm.data["categories"].get(t, []) if isinstance(c, dict)]
+                cached = cat_grids.get(t)
+                # 分类表变了（比如导入时新增了分类）才重建
+                if cached is None or cached["names"] != [c.get("name") for c in cats]:
+                    cached = cat_grids[t] = build_cat_grid(cats)
+                return cached
+            
+            def set_selected(name):
+                # 返回状态有变化的格子，调用方只需要刷新它们
+                tiles = get_cat_grid(current_type)["tiles"]
+                changed = []
+                if current_cat in tiles and current_cat != name:
+                    style_tile(tiles[current_cat], False)
+                    changed.append(tiles[current_cat][0])
+                if name in tiles:
+                    style_tile(tiles[name], True)
+                    changed.append(tiles[name][0])
+                return changed
+            
+            def switch_type(t):
+                nonlocal current_type, current_cat, current_icon
+                set_selected(None)
+                current_type = t
+                current_cat = None
+                current_icon = None
+                if t == "支出":
+                    exp_text.color = "white"
+                    exp_text.weight = ft.FontWeight.BOLD
+                    inc_text.color = "#FFFFFF88"
+                    inc_text.weight = None
+                else:
+                    inc_text.color = "white"
+                    inc_text.weight = ft.FontWeight.BOLD
+                    exp_text.color = "#FFFFFF88"
+                    exp_text.weight = None
+                load_categories()
+                page.update()
+            
+            def load_categories():
+                cat_area.content = get_cat_grid(current_type)["grid"]
+            
+            def refresh_categories():
+                # 分类表在别处变了（导入、同步、别的会话）：换成按新分类建的网格，已选的分类接着选中
+                load_categories()
+                set_selected(current_cat)
+            
+            add_refs["refresh_categories"] = refresh_categories
+            
+            def select_cat(c):
+                nonlocal current_cat, current_icon
+                changed = set_selected(c.get("name"))
+                current_cat = c.get("name")
+                current_icon = c.get("icon")
+                for tile in changed:
+                    tile.update()
+            
+            def save_record(e):
+                nonlocal current_cat, current_icon
+                if not amount_field.value:
+                    page.snack_bar = ft.SnackBar(ft.Text("请输入金额", color="white"), bgcolor=EXPENSE)
+                    page.snack_bar.open = True
+                    page.update()
+                    return
+                if not current_cat:
+                    page.snack_bar = ft.SnackBar(ft.Text("请选择分类", color="white"), bgcolor=EXPENSE)
+                    page.snack_bar.open = True
+                    page.update()
+                    return
+                try:
+                    amt = float(amount_field.value)
+                except:
+                    page.snack_bar = ft.SnackBar(ft.Text("金额无效", color="white"), bgcolor=EXPENSE)
+                    page.snack_bar.open = True
+                    page.update()
+                    return
+                
+                freq = repeat_field.value
+                if freq in RECURRING_FREQS:
+                    # 周期记账存成规则，从所选日期起到今天该记的（包括这一笔）马上补齐，以后启动时自动补
+                    dm.add_recurring(current_type, amt, current_cat, current_icon or "💰", note_field.value or "", freq, current_date)
+                    dm.materialize_recurring()
+                    message = f"✓ 已设为{RECURRING_FREQS[freq]}自动记账"
+                else:
+                    dm.add_record(current_type, amt, current_cat, current_icon or "💰", note_field.value or "", current_date)
+                    message = "✓ 保存成功"
+                
+                amount_field.value = ""
+                repeat_field.value = "none"
+                note_field.value = ""
+                set_selected(None)
+                current_cat = None
+                current_icon = None
+                
+                page.snack_bar = ft.SnackBar(ft.Text(message, color="white"), bgcolor=INCOME)
+                page.snack_bar.open = True
+                page.update()
+            
+            # 快捷金额按钮
+            quick_amounts = [10, 20, 50, 100, 200]
+            
+            def add_quick(amt):
+                try:
+                    current = float(amount_field.value or 0)
+                    amount_field.value = str(current + amt)
+                except:
+                    amount_field.value = str(amt)
+                page.update()
+            
+            quick_btns = ft.Row(
+                [
+                    ft.Container(
+                        ft.Text(f"+{a}", size=13, color="white"),
+                        bgcolor="#FFFFFF30",
+                        padding=ft.Padding(12, 6, 12, 6),
+                        border_radius=15,
+                        on_click=lambda e, amt=a: add_quick(amt),
+                    ) for a in quick_amounts
+                ],
+                alignment=ft.MainAxisAlignment.CENTER,
+                spacing=8,
+            )
+            
+            load_categories()
+            
+            return ft.Container(
+                ft.Column([
+                    # 顶部输入区域
+                    ft.Container(
+                        ft.Column([
+                            ft.Container(height=safe_area_top),
+                            # 类型切换
+                            ft.Row([
+                                ft.Container(exp_text, on_click=lambda e: switch_type("支出"), padding=10),
+                                ft.Container(inc_text, on_click=lambda e: switch_type("收入"), padding=10),
+                            ], alignment=ft.MainAxisAlignment.CENTER, spacing=30),
+                            ft.Container(height=20),
+                            # 金额输入
+                            ft.Row([
+                                ft.Text("¥", size=30, color="#FFFFFF88"),
+                                ft.Container(amount_field, expand=True),
+                            ], alignment=ft.MainAxisAlignment.CENTER),
+                            ft.Container(height=15),
+                            # 快捷金额
+                            quick_btns,
+                            ft.Container(height=15),
+                            # 日期显示
+                            ft.Container(
+                                ft.Row([
+                                    ft.Icon("event", size=18, color="#FFFFFF88"),
+                                    ft.Container(width=8),
+                                    date_text,
+                                ], alignment=ft.MainAxisAlignment.CENTER),
+                                bgcolor="#FFFFFF20",
+                                padding=ft.Padding(20, 10, 20, 10),
+                                border_radius=12,
+                            ),
+                        ]),
+                        gradient=ft.LinearGradient(
+                            colors=[PRIMARY, "#A29BFE"],
+                            begin=ft.Alignment(0, -1),
+                            end=ft.Alignment(0, 1),
+                        ),
+                        padding=ft.Padding(20, 0, 20, 25),
+                        border_radius=ft.BorderRadius(0, 0, 30, 30),
+                    ),
+                    # 分类选择
+                    ft.Container(
+                        ft.Column([
+                            ft.Text("选择分类", size=15, weight=ft.FontWeight.BOLD),
+                            ft.Container(height=10),
+                            cat_area,
+                        ]),
+                        padding=ft.Padding(15, 20, 15, 0),
+                        expand=True,
+                    ),
+                    # 备注和保存
+                    ft.Container(
+                        ft.Column([
+                            ft.Row([ft.Container(note_field, expand=True), repeat_field], spacing=10),
+                            ft.Container(height=15),
+                            ft.ElevatedButton(
+                                "保存",
+                                width=float("inf"),
+                                height=50,
+                                bgcolor=PRIMARY,
+                                color="white",
+                                style=ft.ButtonStyle(
+                                    shape=ft.RoundedRectangleBorder(radius=12),
+                                ),
+                                on_click=save_record,
+                            ),
+                        ]),
+                        padding=ft.Padding(20, 10, 20, 80 + safe_area_bottom),
+                    ),
+                ], spacing=0),
+                expand=True,
+                bgcolor="#F5F5F5",
+            )
+        
+        # ========== 设置页 ==========
+        settings_refs = {}
+        
+        def build_settings():
+            settings_refs["count"] = ft.Text("", size=26, weight=ft.FontWeight.BOLD, color=PRIMARY)
+            settings_refs["expense"] = ft.Text("", size=26, weight=ft.FontWeight.BOLD, color=EXPENSE)
+            settings_refs["income"] = ft.Text("", size=26, weight=ft.FontWeight.BOLD, color=INCOME)
+            update_settings()
+            
+            # 周期规则列表：每条一行，可以删掉，已经记下的账保留
+            recurring_list = ft.Column([], spacing=8, tight=True, scroll=ft.ScrollMode.AUTO)
+            
+            def fill_recurring():
+                recurring_list.controls = [
+                    ft.Row([
+                        ft.Text(
+                            f"{r['icon']} {RECURRING_FREQS.get(r['freq'], r['freq'])} · {r['category']} · ¥{r['amount']:.2f}"
+                            + (f" · {r['note']}" if r["note"] else ""),
+                            size=14,
+                            expand=True,
+                        ),
+                        ft.IconButton("delete_outline", icon_color=EXPENSE, on_click=lambda e, rid=r["id"]: remove_recurring(rid)),
+                    ])
+                    for r in dm.recurring_rules()
+                ] or [ft.Text("还没有周期记账。记账时把“不重复”改成“每月”等就会自动记", size=13, color="#999")]
+            
+            def show_recurring(e):
+                fill_recurring()
+                recurring_dialog.open = True
+                page.update()
+            
+            def remove_recurring(rid):
+                dm.delete_recurring(rid)
+                fill_recurring()
+                page.update()
+            
+            def close_recurring(e):
+                recurring_dialog.open = False
+                page.update()
+            
+            recurring_dialog = ft.AlertDialog(
+                title=ft.Text("周期记账"),
+                content=recurring_list,
+                actions=[ft.TextButton("关闭", on_click=close_recurring)],
+            )
+            page.overlay.append(recurring_dialog)
+            
+            # 清空前先问一句：往年的记录可以压缩归档（总计不变，查历史时自动读回来），也可以全部删掉
+            def clear_data(e):
+                clear_dialog.open = True
+                page.update()
+            
+            def close_clear(e):
+                clear_dialog.open = False
+                page.update()
+            
+            def archive_old(e):
+                clear_dialog.open = False
+                try:
+                    count = dm.archive_years()
+                except (OSError, ValueError) as ex:
+                    finish_transfer(f"归档失败：{ex}", EXPENSE)
+                    return
+                finish_transfer(f"已归档 {count} 条往年记录" if count else "没有可以归档的往年记录", INCOME)
+            
+            def delete_all(e):
+                clear_dialog.open = False
+                dm.clear_records()
+                finish_transfer("数据已清空", "#F39C12")
+            
+            clear_dialog = ft.AlertDialog(
+                modal=True,
+                title=ft.Text("清空数据"),
+                content=ft.Text(
+                    "今年以前的记录可以压缩归档：总计和统计不变，查看历史时会自动读回来。"
+                    if dm.ARCHIVE else "将删除所有记账记录，无法恢复。",
+                    size=14,
+                ),
+                actions=[
+                    ft.TextButton("取消", on_click=close_clear),
+                    *([ft.TextButton("归档往年记录", on_click=archive_old)] if dm.ARCHIVE else []),
+                    ft.TextButton("全部删除", on_click=delete_all, style=ft.ButtonStyle(color=EXPENSE)),
+                ],
+            )
+            page.overlay.append(clear_dialog)
+            
+            # 导入/导出走文件选择器，进度条在设置项下面
+            transfer_bar = ft.ProgressBar(value=0, color=PRIMARY, bgcolor="#EEE", visible=False)
+            transfer_text = ft.Text("", size=12, color="#999", visible=False)
+            
+            def show_transfer(done, fraction):
+                transfer_bar.value = fraction
+                transfer_text.value = f"已处理 {done} 条"
+                transfer_bar.visible = transfer_text.visible = True
+                page.update()
+            
+            def finish_transfer(message, color):
+                transfer_bar.visible = transfer_text.visible = False
+                page.snack_bar = ft.SnackBar(ft.Text(message, color="white"), bgcolor=color)
+                page.snack_bar.open = True
+                page.update()
+            
+            def on_import_picked(e):
+                path = e.files[0].path if e.files else None
+                if not path:
+                    return
+                show_transfer(0, None)
+                try:
+                    result = dm.import_records(path, show_transfer)
+                except (OSError, ValueError, csv.Error, sqlite3.Error) as ex:
+                    finish_transfer(f"导入失败：{ex}", EXPENSE)
+                    return
+                message = f"导入 {result['added']} 条"
+                if result["duplicates"]:
+                    message += f"，跳过重复 {result['duplicates']} 条"
+                if result["invalid"]:
+                    line, reason = result["errors"][0]
+                    message += f"，无效 {result['invalid']} 条（第 {line} 行：{reason}）"
+                finish_transfer(message, INCOME)
+            
+            def on_export_picked(e):
+                if not e.path:
+                    return
+                show_transfer(0, None)
+                try:
+                    count = dm.export_records(e.path, progress=show_transfer)
+                except (OSError, sqlite3.Error) as ex:
+                    finish_transfer(f"导出失败：{ex}", EXPENSE)
+                    return
+                finish_transfer(f"已导出 {count} 条", INCOME)
+            
+            import_picker = ft.FilePicker(on_result=on_import_picked)
+            export_picker = ft.FilePicker(on_result=on_export_picked)
+            page.overlay.extend([import_picker, export_picker])
+            
+            # 开发者面板：连点版本号 5 次显示，看各热点的 p50/p95，可以导出到文件
+            perf_rows = ft.Column([], spacing=4)
+            perf_switch = ft.Switch(label="启用计时", value=perf.enabled)
+            perf_panel = ft.Container(
+                ft.Column([
+                    ft.Text("性能面板", size=15, weight=ft.FontWeight.W_500),
+                    perf_switch,
+                    perf_rows,
+                    ft.Row([
+                        ft.TextButton("刷新", on_click=lambda e: show_perf()),
+                        ft.TextButton("清空", on_click=lambda e: reset_perf()),
+                        ft.TextButton("导出到文件", on_click=lambda e: dump_perf()),
+                    ]),
+                ], spacing=6),
+                bgcolor="white",
+                margin=ft.Margin(15, 20, 15, 0),
+                padding=ft.Padding(15, 12, 15, 12),
+                border_radius=14,
+                visible=False,
+            )
+            version_taps = [0]
+            
+            def show_perf():
+                stats = perf.stats()
+                perf_rows.controls = [
+                    ft.Text(
+                        f"{name}  n={s['count']}  p50 {s['p50_ms']:.1f}ms  p95 {s['p95_ms']:.1f}ms"
+                        + "".join(f"  {k}={s[k]}" for k in ("controls", "records", "bytes") if k in s),
+                        size=11, color="#555", font_family="monospace",
+                    )
+                    for name, s in stats.items()
+                ] or [ft.Text("还没有数据", size=12, color="#999")]
+                page.update()
+            
+            def reset_perf():
+                perf.reset()
+                show_perf()
+            
+            def toggle_perf(e):
+                perf.enabled = perf_switch.value
+                show_perf()
+            
+            perf_switch.on_change = toggle_perf
+            
+            def dump_perf():
+                path = dm.get_data_path("roro_perf.json")
+                try:
+                    perf.dump(path)
+                except OSError as ex:
+                    finish_transfer(f"导出失败：{ex}", EXPENSE)
+                    return
+                finish_transfer(f"已写入 {path}", INCOME)
+            
+            def on_version_tap(e):
+                version_taps[0] += 1
+                if version_taps[0] % 5 == 0:
+                    perf_panel.visible = not perf_panel.visible
+                    show_perf()
+            
+            def build_setting_item(icon, color, title, subtitle, on_click):
+                return ft.Container(
+                    ft.Row([
+                        ft.Container(
+                            ft.Icon(icon, color=color, size=22),
+                            width=45,
+                            height=45,
+                            bgcolor=color + "15",
+                            border_radius=12,
+                            alignment=ft.Alignment(0, 0),
+                        ),
+                        ft.Container(width=15),
+                        ft.Column([
+                            ft.Text(title, size=15, weight=ft.FontWeight.W_500),
+                            ft.Text(subtitle, size=12, color="#999"),
+                        ], spacing=2, expand=True),
+                        ft.Icon("chevron_right", color="#CCC"),
+                    ]),
+                    bgcolor="white",
+                    padding=ft.Padding(15, 12, 10, 12),
+                    border_radius=14,
+                    on_click=on_click,
+                )
+            
+            return ft.Container(
+                ft.Column([
+                    # 顶部
+                    ft.Container(
+                        ft.Column([
+                            ft.Container(height=safe_area_top),
+                            ft.Text("设置", size=22, weight=ft.FontWeight.BOLD, color="white"),
+                        ]),
+                        gradient=ft.LinearGradient(
+                            colors=[PRIMARY, "#A29BFE"],
+                            begin=ft.Alignment(-1, -1),
+                            end=ft.Alignment(1, 1),
+                        ),
+                        padding=ft.Padding(20, 0, 20, 25),
+                        border_radius=ft.BorderRadius(0, 0, 30, 30),
+                        alignment=ft.Alignment(0, 0),
+                    ),
+                    # 统计卡片
+                    ft.Container(
+                        ft.Row([
+                            ft.Column([
+                                settings_refs["count"],
+                                ft.Text("总记录", size=12, color="#888"),
+                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                            ft.Container(width=1, height=50, bgcolor="#EEE"),
+                            ft.Column([
+                                settings_refs["expense"],
+                                ft.Text("总支出", size=12, color="#888"),
+                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                            ft.Container(width=1, height=50, bgcolor="#EEE"),
+                            ft.Column([
+                                settings_refs["income"],
+                                ft.Text("总收入", size=12, color="#888"),
+                            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                        ]),
+                        bgcolor="white",
+                        margin=ft.Margin(15, 20, 15, 0),
+                        padding=ft.Padding(15, 25, 15, 25),
+                        border_radius=16,
+                    ),
+                    # 设置项
+                    ft.Container(
+                        ft.Column([
+                            build_setting_item(
+                                "file_upload", PRIMARY, "导入数据", "从 CSV、JSON Lines 或 JSON 文件导入",
+                                lambda e: import_picker.pick_files(allowed_extensions=["csv", "jsonl", "json"]),
+                            ),
+                            build_setting_item(
+                                "file_download", INCOME, "导出数据", "导出全部记录为 CSV、JSON Lines 或 JSON",
+                                lambda e: export_picker.save_file(file_name="roro_export.csv", allowed_extensions=["csv", "jsonl", "json"]),
+                            ),
+                            transfer_bar,
+                            transfer_text,
+                            build_setting_item("event_repeat", PRIMARY, "周期记账", "房租、工资等按月自动记账", show_recurring),
+                            build_setting_item("delete_outline", EXPENSE, "清空数据", "归档往年记录或删除全部记录" if dm.ARCHIVE else "删除所有记账记录", clear_data),
+                        ], spacing=10),
+                        padding=ft.Padding(15, 20, 15, 0),
+                    ),
+                    perf_panel,
+                    # 关于
+                    ft.Container(
+                        ft.Column([
+                            ft.Text("🐰", size=50),
+                            ft.Container(height=10),
+                            ft.Text("Roro记账", size=18, weight=ft.FontWeight.BOLD),
+                            ft.Container(ft.Text("v2.0.0", size=12, color="#999"), on_click=on_version_tap),
+                            ft.Container(height=20),
+                            ft.Text("Made with ❤️", size=13, color="#999"),
+                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
+                        padding=ft.Padding(0, 40, 0, 0),
+                        alignment=ft.Alignment(0, 0),
+                    ),
+                    ft.Container(height=80 + safe_area_bottom),
+                ], spacing=0),
+                expand=True,
+                bgcolor="#F5F5F5",
+            )
+        
+        def update_settings():
+            totals = dm.get_totals()
+            settings_refs["count"].value = f"{totals['count']}"
+            settings_refs["expense"].value = f"¥{totals['expense']:.0f}"
+            settings_refs["income"].value = f"¥{totals['income']:.0f}"
+        
+        # ========== 统计页 ==========
+        stats_refs = {}
+        stats_state = {"range": 0}
+        
+        def stats_ranges():
+            # (名称, 开始, 结束)，日期都是包含的
+            today = datetime.now()
+            month_start = today.replace(day=1)
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+            quarter_start = (last_month_start - timedelta(days=1)).replace(day=1)
+            fmt = "%Y-%m-%d"
+            return [
+                ("本月", month_start.strftime(fmt), (next_month - timedelta(days=1)).strftime(fmt)),
+                ("上月", last_month_start.strftime(fmt), (month_start - timedelta(days=1)).strftime(fmt)),
+                ("近三月", quarter_start.strftime(fmt), today.strftime(fmt)),
+                ("今年", f"{today.year}-01-01", f"{today.year}-12-31"),
+                ("全部", None, None),
+            ]
+        
+        def select_range(index):
+            stats_state["range"] = index
+            update_stats()
+            page.update()
+        
+        def build_stats_section(title, controls):
+            return ft.Container(
+                ft.Column([ft.Text(title, size=16, weight=ft.FontWeight.BOLD)] + controls, spacing=10),
+                bgcolor="white",
+                margin=ft.Margin(15, 15, 15, 0),
+                padding=ft.Padding(15, 15, 15, 15),
+                border_radius=16,
+            )
+        
+        def build_share_row(label, amount, share, color):
+            return ft.Column([
+                ft.Row([
+                    ft.Text(label, size=14),
+                    ft.Text(f"¥{amount:.2f}  {share * 100:.0f}%", size=13, color="#888"),
+                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                ft.ProgressBar(value=share, color=color, bgcolor="#F0F0F0", bar_height=6),
+            ], spacing=4)
+        
+        def build_stats():
+            stats_refs["chips"] = ft.Row(spacing=8, scroll=ft.ScrollMode.AUTO)
+            stats_refs["expense"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD)
+            stats_refs["income"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD, color=INCOME)
+            stats_refs["balance"] = ft.Text("", size=20, weight=ft.FontWeight.BOLD)
+            stats_refs["overview"] = ft.Text("", size=12, color="#888")
+            stats_refs["body"] = ft.Column([], spacing=0)
+            update_stats()
+            
+            return ft.Container(
+                ft.Column([
+                    ft.Container(
+                        ft.Column([
+                            ft.Container(height=safe_area_top),
+                            ft.Text("统计", size=22, weight=ft.FontWeight.BOLD, color="white"),
+                            ft.Container(height=10),
+                            stats_refs["chips"],
+                            ft.Container(height=15),
+                            ft.Container(
+                                ft.Column([
+                                    ft.Row([
+                                        ft.Column([
+                                            ft.Text("支出", size=12, color="#888"),
+                                            stats_refs["expense"],
+                                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                        ft.Container(width=1, height=40, bgcolor="#EEE"),
+                                        ft.Column([
+                                            ft.Text("收入", size=12, color="#888"),
+                                            stats_refs["income"],
+                                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                        ft.Container(width=1, height=40, bgcolor="#EEE"),
+                                        ft.Column([
+                                            ft.Text("结余", size=12, color="#888"),
+                                            stats_refs["balance"],
+                                        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, expand=True),
+                                    ]),
+                                    stats_refs["overview"],
+                                ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=10),
+                                bgcolor="white",
+                                padding=ft.Padding(15, 15, 15, 15),
+                                border_radius=16,
+                            ),
+                        ]),
+                        gradient=ft.LinearGradient(
+                            colors=[PRIMARY, "#A29BFE"],
+                            begin=ft.Alignment(-1, -1),
+                            end=ft.Alignment(1, 1),
+                        ),
+                        padding=ft.Padding(20, 0, 20, 25),
+                        border_radius=ft.BorderRadius(0, 0, 30, 30),
+                    ),
+                    ft.Container(
+                        ft.ListView([stats_refs["body"], ft.Container(height=80 + safe_area_bottom)]),
+                        expand=True,
+                    ),
+                ], spacing=0),
+                expand=True,
+                bgcolor="#F5F5F5",
+            )
+        
+        def update_stats():
+            # 统计本身按范围缓存在 DataManager 里，这里只是把结果摆成控件
+            ranges = stats_ranges()
+            _, start, end = ranges[stats_state["range"]]
+            stats = dm.get_range_stats(start, end)
+            summary = dm.get_range_summary(start, end)
+            stats_refs["chips"].controls = [
+                ft.Container(
+                    ft.Text(name, size=13, color=PRIMARY if i == stats_state["range"] else "white"),
+                    bgcolor="white" if i == stats_state["range"] else "#FFFFFF33",
+                    padding=ft.Padding(12, 6, 12, 6),
+                    border_radius=14,
+                    on_click=lambda e, i=i: select_range(i),
+                )
+                for i, (name, _, _) in enumerate(ranges)
+            ]
+            stats_refs["expense"].value = f"¥{summary['expense']:.2f}"
+            stats_refs["income"].value = f"¥{summary['income']:.2f}"
+            stats_refs["balance"].value = f"¥{summary['balance']:.2f}"
+            stats_refs["overview"].value = f"共 {stats['count']} 笔 · 日均支出 ¥{stats['daily_expense']:.2f}"
+            
+            sections = []
+            for rtype, color in (("支出", EXPENSE), ("收入", INCOME)):
+                rows = [c for c in stats["categories"] if c["type"] == rtype]
+                if rows:
+                    sections.append(build_stats_section(
+                        f"{rtype}分类",
+                        [build_share_row(c["category"], c["amount"], c["share"], color) for c in rows],
+                    ))
+            if stats["months"]:
+                # 走势按月份倒序，和上个月比支出的涨跌
+                peak = max(m["expense"] for m in stats["months"]) or 1
+                rows = []
+                previous = None
+                for m in stats["months"]:
+                    change = ""
+                    if previous:
+                        change = f"{(m['expense'] - previous) / previous * 100:+.0f}%"
+                    previous = m["expense"]
+                    rows.append(ft.Column([
+                        ft.Row([
+                            ft.Text(m["month"], size=14),
+                            ft.Text(f"支出 ¥{m['expense']:.2f}  收入 ¥{m['income']:.2f}  {change}", size=12, color="#888"),
+                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                        ft.ProgressBar(value=m["expense"] / peak, color=PRIMARY, bgcolor="#F0F0F0", bar_height=6),
+                    ], spacing=4))
+                sections.append(build_stats_section("月度走势", rows[::-1]))
+            if stats["top"]:
+                sections.append(build_stats_section("最大支出", [
+                    ft.Row([
+                        ft.Column([
+                            ft.Text(f"{r['icon'] or ''} {r['category']}".strip(), size=14),
+                            ft.Text(f"{r['date']}  {r['note']}".strip(), size=12, color="#999"),
+                        ], spacing=2, expand=True),
+                        ft.Text(f"-¥{r['amount']:.2f}", size=14, weight=ft.FontWeight.BOLD, color=EXPENSE),
+                    ])
+                    for r in stats["top"]
+                ]))
+            if not sections:
+                sections.append(ft.Container(
+                    ft.Text("这段时间还没有记录", size=14, color="#999"),
+                    padding=ft.Padding(0, 40, 0, 0),
+                    alignment=ft.Alignment(0, 0),
+                ))
+            stats_refs["body"].controls = sections
+        
+        # ========== 导航 ==========
+        def build_skeleton():
+            # 数据读进来之前的占位：几块灰条，大致是首页的排布
+            def bar(height, width=None, radius=8):
+                return ft.Container(height=height, width=width, bgcolor="#E8E8EE", border_radius=radius)
+            
+            return ft.Container(
+                ft.Column([
+                    ft.Container(height=safe_area_top),
+                    bar(150, radius=20),
+                    bar(40, radius=20),
+                    *[
+                        ft.Row([
+                            bar(40, 40, 10),
+                            ft.Column([bar(12, 120), bar(10, 80)], spacing=6, expand=True),
+                            bar(14, 60),
+                        ])
+                        for _ in range(5)
+                    ],
+                ], spacing=14),
+                padding=ft.Padding(15, 0, 15, 0),
+                expand=True,
+            )
+        
+        home_page = ft.Container(build_skeleton(), expand=True)
+        add_page = ft.Container(build_skeleton(), expand=True)
+        stats_page = ft.Container(build_skeleton(), expand=True)
+        settings_page = ft.Container(build_skeleton(), expand=True)
+        
+        pages_list = [home_page, add_page, stats_page, settings_page]
+        content = ft.Container(pages_list[0], expand=True)
+        
+        # 每个页面只在依赖的数据变化时才更新；看不见的页面先记为脏，切过去时再更新
+        def update_add():
+            # 表单里正在填的内容不动，只刷新分类网格
+            add_refs["refresh_categories"]()
+        
+        page_updaters = [update_home, update_add, update_stats, update_settings]
+        dirty_pages = set()
+        current_index = 0
+        
+        def measure_tree(control):
+            return {"controls": count_controls(control)}
+        
+        build_home = perf.wrap("build_home", build_home, measure_tree)
+        build_add = perf.wrap("build_add", build_add, measure_tree)
+        build_stats = perf.wrap("build_stats", build_stats, measure_tree)
+        build_settings = perf.wrap("build_settings", build_settings, measure_tree)
+        page_builders = {"home": build_home, "add": build_add, "stats": build_stats, "settings": build_settings}
+        builders_list = list(page_builders.values())
+        # 已经建好的页面；后台加载线程和切页事件可能同时要建同一页，用锁串起来
+        built_pages = set()
+        build_lock = threading.RLock()
+        
+        def refresh_page(index):
+            dirty_pages.discard(index)
+            if page_updaters[index]:
+                page_updaters[index]()
+        
+        refresh_page = perf.wrap("refresh_page", refresh_page)
+        
+        def show_page(index):
+            # 第一次用到时才建，建过的只在数据变过时更新。先清脏标记再建，建的过程中来的改动会重新标脏
+            with build_lock:
+                if index not in built_pages:
+                    dirty_pages.discard(index)
+                    pages_list[index].content = builders_list[index]()
+                    built_pages.add(index)
+                elif index in dirty_pages:
+                    refresh_page(index)
+        
+        def on_data_change(kind, record):
+            # 改动可能来自别的会话，所以自己推一次界面。数据层在发起改动的线程里挨个通知各会话，
+            # 这里只标脏，重画放到本会话自己的线程里做，发起改动的一方不用等所有会话画完
+            # 单条增删不改分类表，记账页只在导入、同步、清空这类改动后才需要刷新分类网格
+            dirty_pages.update((0, 2, 3) if kind in ("add", "delete", "delete_many", "recurring") else (0, 1, 2, 3))
+            if run_thread:
+                run_thread(push_refresh)
+            else:
+                push_refresh()
+        
+        def push_refresh():
+            with build_lock:
+                if current_index in dirty_pages and current_index in built_pages:
+                    refresh_page(current_index)
+                    page.update()
+        
+        def nav_change(e):
+            nonlocal current_index
+            current_index = e.control.selected_index
+            # 数据还没读完就先停在骨架上，读完后台线程会把这一页建出来
+            if dm is not None:
+                show_page(current_index)
+            content.content = pages_list[current_index]
+            page.update()
+        
+        nav = ft.NavigationBar(
+            selected_index=0,
+            bgcolor="white",
+            on_change=nav_change,
+            height=65,
+            elevation=10,
+            shadow_color="#00000020",
+            indicator_color=PRIMARY + "20",
+            destinations=[
+                ft.NavigationBarDestination(icon="home_outlined", selected_icon="home", label="首页"),
+                ft.NavigationBarDestination(icon="add_circle_outline", selected_icon="add_circle", label="记账"),
+                ft.NavigationBarDestination(icon="bar_chart_outlined", selected_icon="bar_chart", label="统计"),
+                ft.NavigationBarDestination(icon="settings_outlined", selected_icon="settings", label="设置"),
+            ],
+        )
+        
+        page.add(
+            ft.Stack([
+                content,
+                ft.Container(
+                    nav,
+                    bottom=0,
+                    left=0,
+                    right=0,
+                ),
+            ], expand=True)
+        )
+        # 首帧：外壳和骨架已经发出去，还没碰数据
+        perf.record("first_frame", time.perf_counter() - startup, controls=count_controls(page))
+        
+        def load_app():
+            nonlocal dm
+            try:
+                # 网页模式下所有会话共用一份数据，改动经 subscribe 推给每个会话
+                manager = shared_data_manager()
+                manager.start_writer(on_save_error)
+                # 到期的周期记账（房租、工资）在建页面之前一次补齐
+                manager.materialize_recurring()
+                manager.subscribe(on_data_change)
+                dm = manager
+                page.on_app_lifecycle_state_change = on_lifecycle_change
+                page.on_disconnect = lambda e: dm.flush()
+                page.on_close = on_close
+                # 先建首页；加载期间已经切到别的页，就把那一页也建出来
+                show_page(0)
+                show_page(current_index)
+                page.update()
+                perf.record("startup", time.perf_counter() - startup, controls=count_controls(page))
+            except Exception as e:
+                show_error(f"{str(e)}\n\n{traceback.format_exc()}")
+        
+        # Flet 会话里放到后台线程；没有会话线程的脚本（基准测试）当场读完，返回时页面已经建好
+        run_thread = getattr(page, "run_thread", None)
+        if run_thread:
+            run_thread(load_app)
+        else:
+            load_app()
+        # 基准测试等脚本拿这些直接重建页面，不需要真的连上 Flet 会话
+        return dm, page_builders
+    
+    except Exception as e:
+        show_error(f"{str(e)}\n\n{traceback.format_exc()}")
+
+
+if __name__ == "__main__":
+    ft.app(target=main)
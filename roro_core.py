@@ -0,0 +1,3319 @@
+# Roro记账的数据层：不依赖 Flet，脚本、测试、命令行都可以直接导入
+# 命令行用法：python roro_core.py --help
+from array import array
+from collections import deque
+from collections.abc import Mapping
+import argparse
+import contextlib
+import csv
+from datetime import datetime, timedelta
+import functools
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import atexit
+import calendar
+import zlib
+
+# 统计页有 NumPy 就整列向量化计算，没有就退回逐行累加。导入 NumPy 要上百毫秒，
+# 放到第一次算统计时才做，命令行和首帧都不等它；None 表示还没试过，False 表示没装
+np = None
+
+
+def load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        np = numpy
+    return np or None
+
+# 跨进程的文件锁只在有 fcntl 的平台（Linux、macOS、Android）上启用
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 往年归档优先用 lzma（压得更小），个别精简过的 Python 没有它就用 gzip
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+class PerfMonitor:
+    # 热点计时：每一项一个环形缓冲，只留最近 SIZE 次；关着的时候每次调用只多一次判断
+    SIZE = 200
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.samples = {}
+        self.lock = threading.Lock()
+    
+    def record(self, name, seconds, **info):
+        if not self.enabled:
+            return
+        with self.lock:
+            buf = self.samples.get(name)
+            if buf is None:
+                buf = self.samples[name] = deque(maxlen=self.SIZE)
+            buf.append((seconds, info))
+    
+    def wrap(self, name, fn, measure=None):
+        # measure(返回值) 给出要一起记下的附加信息，比如控件数
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            self.record(name, elapsed, **(measure(result) if measure else {}))
+            return result
+        return timed
+    
+    def stats(self):
+        with self.lock:
+            items = {name: list(buf) for name, buf in self.samples.items()}
+        result = {}
+        for name, samples in sorted(items.items()):
+            ms = sorted(seconds * 1000 for seconds, _ in samples)
+            result[name] = {
+                "count": len(ms),
+                "p50_ms": round(ms[len(ms) // 2], 3),
+                "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+                "max_ms": round(ms[-1], 3),
+                **samples[-1][1],
+            }
+        return result
+    
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+    
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"time": datetime.now().isoformat(timespec="seconds"), "stats": self.stats()}, f, ensure_ascii=False, indent=2)
+
+
+# RORO_PERF=1 启动时就开始计时；设置页的隐藏面板里也能随时开关
+perf = PerfMonitor(os.environ.get("RORO_PERF") == "1")
+
+# 数据层自己不弹界面，出了不该让调用方中断的错（某个会话刷新失败）就记到这里
+logger = logging.getLogger("roro")
+
+
+def count_controls(control):
+    # 数控件树的节点数，只看 content / controls 两种子节点
+    seen = set()
+    stack = [control]
+    total = 0
+    while stack:
+        c = stack.pop()
+        if c is None or id(c) in seen:
+            continue
+        seen.add(id(c))
+        total += 1
+        for attr in ("content", "controls"):
+            value = getattr(c, attr, None)
+            if isinstance(value, list):
+                stack.extend(value)
+            elif value is not None and hasattr(value, "__dict__"):
+                stack.append(value)
+    return total
+
+
+def synchronized(fn):
+    # Flet 网页模式下每个会话在自己的线程里跑事件，多个会话共用一个实例时，改动和读索引的方法排队执行。
+    # 改动里发的通知先攒着，最外层放了锁再发：会话刷新界面时不占着锁，别的会话的改动不用排队等它
+    @functools.wraps(fn)
+    def locked(self, *args, **kwargs):
+        depth = getattr(self.lock_state, "depth", 0)
+        try:
+            with self.mutex:
+                self.lock_state.depth = depth + 1
+                try:
+                    return fn(self, *args, **kwargs)
+                finally:
+                    self.lock_state.depth = depth
+        finally:
+            if not depth:
+                self.dispatch()
+    return locked
+
+
+def to_cents(amount):
+    try:
+        return int(round(float(amount) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+class RecordView(Mapping):
+    # 列存里一行的只读字典视图，界面代码照旧用 r.get("amount")
+    __slots__ = ("store", "row")
+    
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+    
+    def __getitem__(self, key):
+        return self.store.value(self.row, key)
+    
+    def __iter__(self):
+        return iter(RecordStore.FIELDS)
+    
+    def __len__(self):
+        return len(RecordStore.FIELDS)
+    
+    def to_dict(self):
+        return {key: self.store.value(self.row, key) for key in RecordStore.FIELDS}
+
+
+class DaySums:
+    # 按天的收入/支出树状数组（Fenwick 树），下标是日期序数减去 base；
+    # 单点更新、任意区间求和、截至某天的累计结余都是 O(log n)。
+    # 树只覆盖日期最密的一段（跨度不超过 SPAN 天），离得太远的零星日期（比如写错的 0202 年）
+    # 放在 far 里单独加，免得为一两条记录把树撑到几十万天、每次扩容都重建一遍
+    MARGIN = 366
+    SPAN = 1 << 15
+    FAR_LIMIT = 32
+    
+    def __init__(self):
+        self.base = 0
+        self.income = array('q', [0])
+        self.expense = array('q', [0])
+        self.far = {}
+        self.far_limit = self.FAR_LIMIT
+    
+    def covers(self, ordinal):
+        return len(self.income) > 1 and 0 <= ordinal - self.base < len(self.income) - 1
+    
+    def add(self, ordinal, income, expense):
+        if not self.covers(ordinal):
+            # 扩出去的跨度还在 SPAN 以内就重建成更大的树，否则先零散存着
+            top = self.base + len(self.income) - 2
+            if len(self.income) == 1 or max(top, ordinal) - min(self.base, ordinal) + 2 * self.MARGIN < self.SPAN:
+                self.rebuild(ordinal)
+        if not self.covers(ordinal):
+            far_income, far_expense = self.far.pop(ordinal, (0, 0))
+            if far_income + income or far_expense + expense:
+                self.far[ordinal] = far_income + income, far_expense + expense
+            # 零散的越攒越多说明密的那段选错了（比如先读到的是离群的日期），重新挑一段
+            if len(self.far) > self.far_limit:
+                self.rebuild()
+            return
+        i = ordinal - self.base + 1
+        n = len(self.income)
+        while i < n:
+            self.income[i] += income
+            self.expense[i] += expense
+            i += i & -i
+    
+    def prefix(self, ordinal):
+        # 截至 ordinal（含）的 (收入, 支出)，单位分
+        income = expense = 0
+        for day, (far_income, far_expense) in self.far.items():
+            if day <= ordinal:
+                income += far_income
+                expense += far_expense
+        if len(self.income) == 1 or ordinal < self.base:
+            return income, expense
+        i = min(ordinal - self.base + 1, len(self.income) - 1)
+        while i > 0:
+            income += self.income[i]
+            expense += self.expense[i]
+            i -= i & -i
+        return income, expense
+    
+    def range(self, lo, hi):
+        if hi < lo:
+            return 0, 0
+        income, expense = self.prefix(hi)
+        before_income, before_expense = self.prefix(lo - 1)
+        return income - before_income, expense - before_expense
+    
+    def points(self):
+        # 还原出每天的 (收入, 支出)：树状数组逆着建树的顺序拆回单点，再并上零散的
+        points = dict(self.far)
+        values = []
+        for tree in (self.income, self.expense):
+            tree = array('q', tree)
+            for i in range(len(tree) - 1, 0, -1):
+                j = i + (i & -i)
+                if j < len(tree):
+                    tree[j] -= tree[i]
+            values.append(tree)
+        for i, (income, expense) in enumerate(zip(*values)):
+            if i and (income or expense):
+                points[self.base + i - 1] = income, expense
+        return points
+    
+    def rebuild(self, ordinal=None):
+        # 挑出跨度不超过 SPAN、日期最多的一段线性建树（ordinal 是马上要加进来的那天），其余的放 far
+        points = self.points()
+        days = sorted(set(points) | ({ordinal} if ordinal is not None else set()))
+        self.base = 0
+        self.income = array('q', [0])
+        self.expense = array('q', [0])
+        self.far = points
+        if not days:
+            return
+        first = last = start = 0
+        for end, day in enumerate(days):
+            while day - days[start] + 2 * self.MARGIN >= self.SPAN:
+                start += 1
+            if end - start > last - first:
+                first, last = start, end
+        lo = days[first] - self.MARGIN
+        hi = days[last] + self.MARGIN
+        size = 1
+        while size < hi - lo + 2:
+            size *= 2
+        self.base = lo
+        self.income = array('q', bytes(8 * size))
+        self.expense = array('q', bytes(8 * size))
+        for day in days[first:last + 1]:
+            income, expense = self.far.pop(day, (0, 0))
+            self.income[day - lo + 1] = income
+            self.expense[day - lo + 1] = expense
+        for tree in (self.income, self.expense):
+            for i in range(1, size):
+                j = i + (i & -i)
+                if j < size:
+                    tree[j] += tree[i]
+        self.far_limit = max(self.FAR_LIMIT, 2 * len(self.far))
+
+
+class SearchIndex:
+    # 备注和分类的倒排索引：中文不分词，单字和相邻两字各一条倒排，值是记录 id；
+    # 删除只把 id 的月份清零，倒排里留着的旧 id 查询时过滤掉
+    MAGIC = b"RORS"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHBxQ")
+    
+    def __init__(self):
+        self.postings = {}
+        # id -> 月份编号（month_names 下标 + 1），0 表示没有这条或者已删除
+        self.months = array('H')
+        self.month_names = []
+        self.month_codes = {}
+        self.dirty = True
+    
+    @staticmethod
+    def grams(text):
+        text = text.lower()
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        return {g for g in grams if not g.isspace() and "\n" not in g}
+    
+    def add(self, rid, month, text):
+        if rid < len(self.months) and self.months[rid]:
+            return
+        if rid >= len(self.months):
+            self.months.extend(array('H', bytes(2 * (rid + 1 - len(self.months)))))
+        code = self.month_codes.get(month)
+        if code is None:
+            self.month_names.append(month)
+            code = self.month_codes[month] = len(self.month_names)
+        self.months[rid] = code
+        for gram in self.grams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('q')
+            posting.append(rid)
+        self.dirty = True
+    
+    def remove(self, rid):
+        if rid < len(self.months) and self.months[rid]:
+            self.months[rid] = 0
+            self.dirty = True
+    
+    def month_of(self, rid):
+        return self.month_names[self.months[rid] - 1]
+    
+    def lookup(self, term):
+        # 候选 id：查询词相邻两字的倒排求交集，单字查询直接用单字倒排；命中后还要按原文核对
+        term = term.lower()
+        grams = [term] if len(term) == 1 else [term[i:i + 2] for i in range(len(term) - 1)]
+        postings = sorted((self.postings.get(g, ()) for g in grams), key=len)
+        if not postings[0]:
+            return set()
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids.intersection_update(posting)
+            if not ids:
+                break
+        months = self.months
+        return {rid for rid in ids if months[rid]}
+    
+    def to_binary(self, seq):
+        big = sys.byteorder == "big"
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, big, seq)]
+        names = "\x00".join(self.month_names).encode('utf-8')
+        months = self.months.tobytes()
+        parts += [struct.pack("<I", len(names)), names, struct.pack("<I", len(months)), months]
+        # 先拷一份条目列表，写线程序列化时界面线程还可能在加新词
+        postings = list(self.postings.items())
+        parts.append(struct.pack("<I", len(postings)))
+        for gram, ids in postings:
+            encoded = gram.encode('utf-8')
+            parts += [struct.pack("<BI", len(encoded), len(ids)), encoded, ids.tobytes()]
+        body = b"".join(parts)
+        return body + struct.pack("<I", zlib.crc32(body))
+    
+    @classmethod
+    def from_binary(cls, buf, seq):
+        # 校验不过、版本不对或者和清单里记的序号对不上都抛 ValueError，调用方会整份重建
+        view = memoryview(buf)
+        if len(view) < cls.HEADER.size + 4 or zlib.crc32(view[:-4]) != struct.unpack("<I", view[-4:])[0]:
+            raise ValueError("搜索索引校验失败")
+        magic, version, big, saved = cls.HEADER.unpack_from(view)
+        if magic != cls.MAGIC or version != cls.VERSION or saved != seq:
+            raise ValueError("搜索索引已过期")
+        swap = big != (sys.byteorder == "big")
+        index = cls()
+        offset = cls.HEADER.size
+        (size,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        names = bytes(view[offset:offset + size]).decode('utf-8')
+        index.month_names = names.split("\x00") if names else []
+        index.month_codes = {m: i + 1 for i, m in enumerate(index.month_names)}
+        offset += size
+        (size,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        index.months.frombytes(view[offset:offset + size])
+        offset += size
+        (count,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        for _ in range(count):
+            length, ids = struct.unpack_from("<BI", view, offset)
+            offset += 5
+            gram = bytes(view[offset:offset + length]).decode('utf-8')
+            offset += length
+            posting = array('q')
+            posting.frombytes(view[offset:offset + 8 * ids])
+            offset += 8 * ids
+            if swap:
+                posting.byteswap()
+            index.postings[gram] = posting
+        if swap:
+            index.months.byteswap()
+        index.dirty = False
+        return index
+
+
+def parse_search_query(text):
+    # 搜索框里的写法：普通词按备注/分类匹配；"支出"/"收入" 过滤类型；
+    # ">100" / "<50" 过滤金额；"2025-03" / "2025-03-05" 过滤日期
+    query = {"query": [], "rtype": None, "min_amount": None, "max_amount": None, "start": None, "end": None}
+    for token in text.split():
+        if token in ("支出", "收入"):
+            query["rtype"] = token
+        elif token[0] in "<>" and token.lstrip("<>=").replace(".", "", 1).isdigit():
+            query["min_amount" if token[0] == ">" else "max_amount"] = float(token.lstrip("<>="))
+        elif len(token) in (7, 10) and token[4] == "-" and token.replace("-", "").isdigit():
+            if len(token) == 7:
+                last = calendar.monthrange(int(token[:4]), int(token[5:]))[1] if 1 <= int(token[5:]) <= 12 else 31
+                query["start"], query["end"] = token + "-01", f"{token}-{last:02d}"
+            else:
+                query["start"] = query["end"] = token
+        else:
+            query["query"].append(token)
+    query["query"] = " ".join(query["query"])
+    return query
+
+
+# 周期记账的重复方式和界面上的叫法
+RECURRING_FREQS = {"daily": "每天", "weekly": "每周", "monthly": "每月", "yearly": "每年"}
+
+
+def recurring_dates(rule, until):
+    # 规则在 (last, until] 之间该记账的日期，按时间排好。跳过的周期直接算出来，离线几个月再补也不用一天天数。
+    # interval 是隔几个周期一次；days 是每周的星期几（0 是周一）或每月的几号，超过月底的按月底算
+    start = datetime.strptime(rule["start"], "%Y-%m-%d").date()
+    stop = datetime.strptime(min(until, rule.get("end") or until), "%Y-%m-%d").date()
+    after = start - timedelta(days=1)
+    if rule.get("last"):
+        after = max(after, datetime.strptime(rule["last"], "%Y-%m-%d").date())
+    interval = max(int(rule.get("interval") or 1), 1)
+    freq = rule.get("freq")
+    dates = []
+    if freq == "daily":
+        day = start + timedelta(days=((after - start).days // interval + 1) * interval)
+        while day <= stop:
+            dates.append(day)
+            day += timedelta(days=interval)
+    elif freq == "weekly":
+        weekdays = sorted(set(rule.get("days") or [start.weekday()]))
+        week = start - timedelta(days=start.weekday())
+        week += timedelta(weeks=max((after - week).days // 7 // interval, 0) * interval)
+        while week <= stop:
+            for weekday in weekdays:
+                day = week + timedelta(days=weekday)
+                if start <= day <= stop and day > after:
+                    dates.append(day)
+            week += timedelta(weeks=interval)
+    elif freq in ("monthly", "yearly"):
+        step = interval * 12 if freq == "yearly" else interval
+        monthdays = [start.day] if freq == "yearly" else sorted(set(rule.get("days") or [start.day]))
+        first = start.year * 12 + start.month - 1
+        index = first + max((after.year * 12 + after.month - 1 - first) // step, 0) * step
+        while index <= stop.year * 12 + stop.month - 1:
+            year, month = divmod(index, 12)
+            last = calendar.monthrange(year, month + 1)[1]
+            for monthday in sorted({min(d, last) for d in monthdays}):
+                day = datetime(year, month + 1, monthday).date()
+                if start <= day <= stop and day > after:
+                    dates.append(day)
+            index += step
+    return [day.isoformat() for day in dates]
+
+
+class ChangeLog:
+    # 设备间增量同步用的变更日志（roro_data.changes，一行一条）：每条改动带 (设备号 dev, 序号 seq)，
+    # 对方按向量时钟只要缺的那一段。记录的全局编号 uid 是 "设备号:本机 id"；
+    # 从别的设备合并来的记录在本机另发 id，对应关系记在它那条 add 里
+    def __init__(self, manager):
+        self.manager = manager
+        self.path = manager.get_data_path("roro_data.changes")
+        self.state_path = manager.get_data_path("roro_data.sync.json")
+        self.state = None
+        self.state_stat = None
+        # 还没写进日志的改动，由 manager.lock 保护
+        self.pending = []
+        # 外来记录的 uid <-> 本机 id、删过的 uid；只有合并过别的设备才用得上，第一次用到时扫一遍日志
+        self.uids = None
+        self.ids = None
+        self.deleted = None
+        self.indexed_stat = None
+    
+    def load_state(self):
+        # 状态文件很小，别的进程改过（stat 变了）就重读
+        try:
+            st = os.stat(self.state_path)
+            stat = st.st_mtime_ns, st.st_size
+        except OSError:
+            stat = None
+        if self.state is None or stat != self.state_stat:
+            try:
+                state = self.manager.read_json(self.state_path)
+            except ValueError:
+                state = None
+            if not isinstance(state, dict) or not state.get("device"):
+                state = {"device": os.urandom(6).hex(), "clock": 0, "vector": {}, "peers": {}, "merged": False}
+            self.state = state
+            self.state_stat = stat
+        return self.state
+    
+    def save_state(self):
+        self.manager.write_json_atomic(self.state_path, self.state)
+        st = os.stat(self.state_path)
+        self.state_stat = st.st_mtime_ns, st.st_size
+    
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+    
+    def stat(self):
+        # 瘦身是整份重写（换了个文件），只看大小可能正好一样，连 inode 一起比
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size
+    
+    def read(self, start=0):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+    
+    def ensure_index(self):
+        # 别的进程往日志里追加过就整份重扫
+        if self.uids is not None and self.indexed_stat == self.stat():
+            return
+        device = self.load_state()["device"]
+        self.uids, self.ids, self.deleted = {}, {}, set()
+        self.indexed_stat = self.stat()
+        for entry in self.read():
+            self.index(entry, device)
+    
+    def index(self, entry, device):
+        uid = entry.get("uid")
+        if entry.get("op") == "add" and not uid.startswith(device + ":"):
+            self.uids[uid] = entry["id"]
+            self.ids[entry["id"]] = uid
+        elif entry.get("op") == "delete":
+            self.deleted.add(uid)
+    
+    def uid_of(self, rid):
+        state = self.load_state()
+        if state["merged"]:
+            self.ensure_index()
+            uid = self.ids.get(rid)
+            if uid is not None:
+                return uid
+        return f"{state['device']}:{rid}"
+    
+    def local_id(self, uid):
+        device = self.load_state()["device"]
+        if uid.startswith(device + ":"):
+            return int(uid.split(":", 1)[1])
+        self.ensure_index()
+        return self.uids.get(uid)
+    
+    def record(self, entries):
+        # 本机改动先排队，uid 和序号在真正写盘（持独占锁）时才定，多个进程发号不会撞
+        with self.manager.lock:
+            self.pending.extend(entries)
+    
+    def record_add(self, record):
+        self.record([{"op": "add", "id": record["id"], "record": record}])
+    
+    def record_deletes(self, targets):
+        # targets: [(id, 月份)]；月份让对方不用读全部月份就能找到记录
+        self.record([{"op": "delete", "id": rid, "month": month} for rid, month in targets])
+    
+    def renumber(self, mapping):
+        # 跨进程撞号时本机还没落盘的记录换了 id，排队的条目跟着换
+        with self.manager.lock:
+            for entry in self.pending:
+                if "dev" not in entry and entry.get("id") in mapping:
+                    entry["id"] = mapping[entry["id"]]
+                    if "record" in entry:
+                        entry["record"] = dict(entry["record"], id=entry["id"])
+    
+    def take(self):
+        # 调用方拿着 manager.lock：跟账本的积压一起取走，之后再排队的条目可能还会被换号
+        entries, self.pending = self.pending, []
+        return entries
+    
+    def write(self, entries=None):
+        # 调用方已经拿着数据目录的独占锁。还没同步过就不写日志，排队的条目直接丢掉：
+        # 第一次同步时 start_sync 会把那时的记录补记一遍，平时不同步的人不用多付每次 fsync。
+        # entries 是 take() 取走的那一批，不给就写整个队列
+        if entries is None:
+            with self.manager.lock:
+                entries = self.take()
+        if not entries:
+            return
+        try:
+            state = self.load_state()
+            if not state.get("baseline"):
+                return
+            vector = state["vector"]
+            for entry in entries:
+                if "dev" not in entry:
+                    if "uid" not in entry and "id" in entry:
+                        entry["uid"] = self.uid_of(entry["id"])
+                    state["clock"] += 1
+                    entry["dev"], entry["seq"] = state["device"], state["clock"]
+                vector[entry["dev"]] = max(vector.get(entry["dev"], 0), entry["seq"])
+            fresh = self.uids is not None and self.indexed_stat == self.stat()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+            self.save_state()
+        except (OSError, ValueError, TypeError):
+            with self.manager.lock:
+                self.pending[:0] = entries
+            raise
+        if fresh:
+            for entry in entries:
+                self.index(entry, state["device"])
+            self.indexed_stat = self.stat()
+    
+    def bundle(self, peer, vector):
+        # 给 peer 的增量：对方向量时钟里没有的条目。记着上次发到日志的哪个位置，
+        # 对方的时钟证明收全了就从那里往后读，同步的开销跟改动条数走，不跟账本大小走
+        state = self.load_state()
+        known = state["peers"].setdefault(peer, {"vector": {}, "offset": 0})
+        sent = known.get("sent")
+        if sent and all(vector.get(dev, 0) >= seq for dev, seq in sent["vector"].items()):
+            known["offset"] = sent["size"]
+        changes = [
+            entry for entry in self.read(known["offset"])
+            if entry.get("seq", 0) > vector.get(entry.get("dev"), 0)
+        ]
+        known["sent"] = {"size": self.size(), "vector": dict(state["vector"])}
+        self.save_state()
+        return {"device": state["device"], "vector": dict(state["vector"]), "changes": self.fill(changes)}
+    
+    def fill(self, changes):
+        # 瘦身过的新增只剩 uid/id/月份，发给还没有它的设备前从账本里把记录取回来；
+        # 本机已经删掉的就不发了（删除条目会跟着发过去）
+        filled = []
+        for entry in changes:
+            if entry.get("op") == "add" and "record" not in entry:
+                month = entry.get("month") or None
+                self.manager.ensure_months(month, month)
+                record = self.manager.get_record(entry.get("id"))
+                if record is None:
+                    continue
+                entry = dict(entry, record=dict(record))
+            filled.append(entry)
+        return filled
+    
+    def trim(self):
+        # 所有已知设备都确认收到的条目（seq 不超过各设备时钟里的最小值）瘦身：新增去掉记录本身，
+        # 只留 uid/id/月份（去重、对号删除还要用）；删掉了的新增整条丢，删除只留墓碑；
+        # 分类每个设备只留最新一条。整份重写，各设备读到的位置归零。调用方拿着独占锁
+        state = self.load_state()
+        vectors = [known.get("vector", {}) for peer, known in state["peers"].items() if peer]
+        if not vectors:
+            return False
+        floor = {dev: min(vector.get(dev, 0) for vector in vectors) for dev in state["vector"]}
+        entries = [entry for entry in self.read() if entry.get("seq", 0) <= floor.get(entry.get("dev"), 0)]
+        deleted = {entry.get("uid") for entry in entries if entry.get("op") == "delete"}
+        latest = {entry.get("dev"): entry.get("seq") for entry in entries if entry.get("op") == "categories"}
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in self.read():
+                if entry.get("seq", 0) <= floor.get(entry.get("dev"), 0):
+                    op = entry.get("op")
+                    if op == "add" and entry.get("uid") in deleted:
+                        continue
+                    if op == "add" and "record" in entry:
+                        month = str(entry["record"].get("date") or "")[:7]
+                        entry = {key: entry[key] for key in ("op", "dev", "seq", "uid", "id") if key in entry}
+                        entry["month"] = month
+                    elif op == "delete":
+                        entry = {key: entry[key] for key in ("op", "dev", "seq", "uid", "month") if key in entry}
+                    elif op == "categories" and latest.get(entry.get("dev")) != entry.get("seq"):
+                        continue
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        for known in state["peers"].values():
+            known["offset"] = 0
+            known.pop("sent", None)
+        state["trimmed"] = self.size()
+        self.uids = None
+        return True
+
+
+class RecordStore:
+    # 记录按列存：金额是整数分，日期是 toordinal() 的天数，
+    # 类型/分类/图标是符号表里的小整数编号，符号表先按分类表的顺序排好
+    FIELDS = ("id", "type", "amount", "category", "icon", "note", "date")
+    
+    # 二进制快照：魔数、版本、字节序、对应 JSON 的大小和修改时间、行数、块数，
+    # 后面是若干 (标签, 长度, 内容) 的列块，最后 4 字节是前面全部内容的 crc32
+    BINARY_MAGIC = b"RORB"
+    BINARY_VERSION = 1
+    BINARY_HEADER = struct.Struct("<4sHBxQQIH")
+    BINARY_BLOCK = struct.Struct("<4sI")
+    
+    def __init__(self, categories=None):
+        self.ids = array('q')
+        self.cents = array('q')
+        self.days = array('l')
+        self.types = array('H')
+        self.cats = array('H')
+        self.icons = array('H')
+        self.notes = []
+        # 1 = 有效，0 = 已删除（墓碑）
+        self.alive = bytearray()
+        self.symbols = []
+        self.codes = {}
+        self.day_ordinals = {}
+        self.day_names = {}
+        # 日期格式不对的旧数据原样保留，天数记为 0
+        self.raw_dates = {}
+        for rtype, cats in (categories or {}).items():
+            self.intern(rtype)
+            for c in cats:
+                if isinstance(c, dict):
+                    self.intern(c.get("name", ""))
+                    self.intern(c.get("icon", ""))
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def intern(self, text):
+        code = self.codes.get(text)
+        if code is None:
+            # 类型、分类、图标列是 uint16，编号用完就拒绝新符号
+            if len(self.symbols) > 0xFFFF:
+                raise OverflowError("类型、分类和图标加起来最多 65536 种")
+            code = self.codes[text] = len(self.symbols)
+            self.symbols.append(text)
+        return code
+    
+    def day_ordinal(self, date):
+        ordinal = self.day_ordinals.get(date)
+        if ordinal is None:
+            try:
+                ordinal = datetime.strptime(date, "%Y-%m-%d").toordinal()
+            except (TypeError, ValueError):
+                return 0
+            self.day_ordinals[date] = ordinal
+        return ordinal
+    
+    def day_name(self, ordinal):
+        name = self.day_names.get(ordinal)
+        if name is None:
+            name = self.day_names[ordinal] = datetime.fromordinal(ordinal).strftime("%Y-%m-%d")
+        return name
+    
+    def append(self, r):
+        # 先把每一列的值都算出来，任何一个出错（金额不是数、符号表满了）都不会只追加了一半的列
+        row = len(self.ids)
+        date = r.get("date", "") or ""
+        day = self.day_ordinal(date)
+        rid = int(r.get("id", 0))
+        cents = to_cents(r.get("amount", 0))
+        rtype = self.intern(r.get("type", "") or "")
+        cat = self.intern(r.get("category", "") or "")
+        icon = self.intern(r.get("icon", "") or "")
+        if not day:
+            self.raw_dates[row] = date
+        self.ids.append(rid)
+        self.cents.append(cents)
+        self.days.append(day)
+        self.types.append(rtype)
+        self.cats.append(cat)
+        self.icons.append(icon)
+        self.notes.append(r.get("note", "") or "")
+        self.alive.append(1)
+        return row
+    
+    def date(self, row):
+        day = self.days[row]
+        return self.day_name(day) if day else self.raw_dates.get(row, "")
+    
+    def value(self, row, key):
+        if key == "id":
+            return self.ids[row]
+        if key == "type":
+            return self.symbols[self.types[row]]
+        if key == "amount":
+            return self.cents[row] / 100
+        if key == "category":
+            return self.symbols[self.cats[row]]
+        if key == "icon":
+            return self.symbols[self.icons[row]]
+        if key == "note":
+            return self.notes[row]
+        if key == "date":
+            return self.date(row)
+        raise KeyError(key)
+    
+    def view(self, row):
+        return RecordView(self, row)
+    
+    def to_dicts(self, alive=None):
+        # alive 传入某一时刻的墓碑快照，后台写盘时不受之后改动影响
+        alive = self.alive if alive is None else alive
+        return [self.view(row).to_dict() for row in range(len(alive)) if alive[row]]
+    
+    def to_binary(self, rows, json_stat):
+        # 把指定的行写成二进制列块；类型/分类/图标编号换成文件自己的小符号表
+        symbols = []
+        local = {}
+        
+        def code(c):
+            if c not in local:
+                local[c] = len(symbols)
+                symbols.append(self.symbols[c])
+            return local[c]
+        
+        notes = [self.notes[row] for row in rows]
+        offsets = array('I', [0])
+        for note in notes:
+            offsets.append(offsets[-1] + len(note))
+        raw_dates = {str(i): self.raw_dates[row] for i, row in enumerate(rows) if row in self.raw_dates}
+        blocks = [
+            (b"IDS_", array('q', (self.ids[row] for row in rows)).tobytes()),
+            (b"CENT", array('q', (self.cents[row] for row in rows)).tobytes()),
+            (b"DAYS", array('i', (self.days[row] for row in rows)).tobytes()),
+            (b"TYPE", array('H', (code(self.types[row]) for row in rows)).tobytes()),
+            (b"CATS", array('H', (code(self.cats[row]) for row in rows)).tobytes()),
+            (b"ICON", array('H', (code(self.icons[row]) for row in rows)).tobytes()),
+            (b"SYMS", "\x00".join(symbols).encode('utf-8')),
+            (b"NOFF", offsets.tobytes()),
+            (b"NTXT", "".join(notes).encode('utf-8')),
+        ]
+        if raw_dates:
+            blocks.append((b"RAWD", json.dumps(raw_dates, ensure_ascii=False).encode('utf-8')))
+        parts = [self.BINARY_HEADER.pack(
+            self.BINARY_MAGIC, self.BINARY_VERSION, sys.byteorder == "big",
+            json_stat.st_size, json_stat.st_mtime_ns, len(rows), len(blocks),
+        )]
+        for tag, payload in blocks:
+            parts.append(self.BINARY_BLOCK.pack(tag, len(payload)))
+            parts.append(payload)
+        body = b"".join(parts)
+        return body + struct.pack("<I", zlib.crc32(body))
+    
+    def extend_binary(self, buf, json_stat):
+        # 整列读入，不逐条解析；校验不过或者和 JSON 对不上就抛 ValueError，调用方退回 JSON
+        view = memoryview(buf)
+        if len(view) < self.BINARY_HEADER.size + 4:
+            raise ValueError("快照太短")
+        body, (crc,) = view[:-4], struct.unpack("<I", view[-4:])
+        if zlib.crc32(body) != crc:
+            raise ValueError("快照校验失败")
+        magic, version, big, size, mtime, count, nblocks = self.BINARY_HEADER.unpack_from(body)
+        if magic != self.BINARY_MAGIC or version != self.BINARY_VERSION:
+            raise ValueError("快照版本不对")
+        if json_stat is None or (size, mtime) != (json_stat.st_size, json_stat.st_mtime_ns):
+            raise ValueError("快照已过期")
+        blocks = {}
+        offset = self.BINARY_HEADER.size
+        for _ in range(nblocks):
+            tag, length = self.BINARY_BLOCK.unpack_from(body, offset)
+            offset += self.BINARY_BLOCK.size
+            blocks[tag] = body[offset:offset + length]
+            offset += length
+        
+        def column(tag, typecode):
+            values = array(typecode)
+            values.frombytes(blocks[tag])
+            if big != (sys.byteorder == "big"):
+                values.byteswap()
+            if len(values) != count:
+                raise ValueError("快照列长度不对")
+            return values
+        
+        try:
+            ids = column(b"IDS_", 'q')
+            cents = column(b"CENT", 'q')
+            days = column(b"DAYS", 'i')
+            types = column(b"TYPE", 'H')
+            cats = column(b"CATS", 'H')
+            icons = column(b"ICON", 'H')
+            offsets = array('I')
+            offsets.frombytes(blocks[b"NOFF"])
+            if big != (sys.byteorder == "big"):
+                offsets.byteswap()
+            text = bytes(blocks[b"NTXT"]).decode('utf-8')
+            symbols = bytes(blocks[b"SYMS"]).decode('utf-8').split("\x00")
+            raw_dates = json.loads(bytes(blocks[b"RAWD"]).decode('utf-8')) if b"RAWD" in blocks else {}
+        except (KeyError, UnicodeDecodeError) as e:
+            raise ValueError(f"快照内容损坏: {e}")
+        # 文件里的符号编号换成本列存的编号
+        trans = [self.intern(symbol) for symbol in symbols]
+        first = len(self.ids)
+        self.ids.extend(ids)
+        self.cents.extend(cents)
+        self.days.extend(array(self.days.typecode, days))
+        self.types.extend(array('H', map(trans.__getitem__, types)))
+        self.cats.extend(array('H', map(trans.__getitem__, cats)))
+        self.icons.extend(array('H', map(trans.__getitem__, icons)))
+        self.notes.extend(text[a:b] for a, b in zip(offsets, offsets[1:]))
+        self.alive.extend(b"\x01" * count)
+        for i, date in raw_dates.items():
+            self.raw_dates[first + int(i)] = date
+        return range(first, first + count)
+    
+    def compacted(self):
+        # 去掉墓碑后的新列存，符号表原样沿用
+        store = RecordStore()
+        store.symbols = self.symbols
+        store.codes = self.codes
+        store.day_ordinals = self.day_ordinals
+        store.day_names = self.day_names
+        for row in range(len(self.ids)):
+            if not self.alive[row]:
+                continue
+            if row in self.raw_dates:
+                store.raw_dates[len(store.ids)] = self.raw_dates[row]
+            store.ids.append(self.ids[row])
+            store.cents.append(self.cents[row])
+            store.days.append(self.days[row])
+            store.types.append(self.types[row])
+            store.cats.append(self.cats[row])
+            store.icons.append(self.icons[row])
+            store.notes.append(self.notes[row])
+            store.alive.append(1)
+        return store
+
+
+class DataManager:
+    # 日志超过这个大小（字节）就合并回快照
+    JOURNAL_LIMIT = 256 * 1024
+    # 后台写盘的防抖：最后一次改动后安静这么久再写
+    WRITE_DELAY = 0.3
+    # 写线程空闲时每隔这么久看一眼数据目录，发现别的进程写过就合进来
+    EXTERNAL_POLL = 2.0
+    # 连续改动时最多拖这么久也要写一次
+    WRITE_MAX_DELAY = 2.0
+    # 删除只打墓碑，墓碑超过这个数且占到四分之一时才真正压缩
+    TOMBSTONE_MIN = 64
+    # 每个月份分片旁边再写一份二进制列存快照，读月份时优先用它
+    BINARY_SNAPSHOT = True
+    # 能不能把往年记录压缩归档（清空数据时提供"归档往年"）
+    ARCHIVE = True
+    # 统计页列出的最大支出笔数
+    STATS_TOP = 10
+    # 导入/导出：每处理这么多行报告一次进度；错误只留前面这么多条
+    IMPORT_PROGRESS_EVERY = 500
+    IMPORT_ERROR_LIMIT = 50
+    # 局域网同步一次请求（或回复）最多这么多字节，超过的直接拒收
+    SYNC_BODY_LIMIT = 64 * 1024 * 1024
+    # 同步的变更日志长到这么大（且比上次瘦身后翻了一倍）就把各设备都确认过的部分瘦身
+    CHANGES_TRIM_SIZE = 1024 * 1024
+    # 别的记账软件导出的表头、类型写法映射到本地字段
+    IMPORT_ALIASES = {
+        "日期": "date", "时间": "date", "类型": "type", "收支": "type", "金额": "amount",
+        "分类": "category", "类别": "category", "图标": "icon", "备注": "note", "说明": "note",
+    }
+    TYPE_ALIASES = {
+        "支出": "支出", "expense": "支出", "out": "支出",
+        "收入": "收入", "income": "收入", "in": "收入",
+    }
+    
+    def __init__(self):
+        # roro_data.json 是旧的单文件格式，现在按月分片：
+        # roro_data.manifest.json 放分类和每月汇总，roro_data.YYYY-MM.json 放当月记录
+        self.data_file = "roro_data.json"
+        self.manifest_file = "roro_data.manifest.json"
+        self.journal_file = "roro_data.journal"
+        self.search_file = "roro_data.search.bin"
+        self.lock_file = "roro_data.lock"
+        self.lock_state = threading.local()
+        self.changes = ChangeLog(self)
+        # 上次读到或写出的清单 (mtime_ns, size)；日志读到的位置就是 journal_size
+        self.manifest_stat = None
+        self.journal_size = 0
+        self.journal_torn = False
+        self.ids_migrated = False
+        self.resharded = False
+        # 清单里有、但还没读进内存的月份；改过、下次快照要重写的月份
+        self.unloaded = set()
+        self.dirty_months = set()
+        # 已归档的年份：年 -> {"file", "months", "count"}，和清单里的 archives 是同一个字典
+        self.archives = {}
+        # 清单里已经不再引用、下次快照写完后要删的归档文件
+        self.stale_archives = set()
+        self.records = RecordStore()
+        self.by_id = {}
+        self.tombstones = 0
+        self.by_day = {}
+        self.by_month = {}
+        self.day_sums = DaySums()
+        self.totals = self.empty_totals()
+        self.month_totals = {}
+        # RORO_SELFCHECK=1 时每次改动后都用全量重算核对一遍汇总缓存
+        self.self_check = os.environ.get('RORO_SELFCHECK') == "1"
+        self.listeners = []
+        self.error_listeners = []
+        # 锁里发出、还没送到各会话的通知 [(kind, record)]，由 lock 保护
+        self.notices = []
+        # 可重入：改动里触发的通知会让各会话回头再来读
+        self.mutex = threading.RLock()
+        # 统计结果按 (start, end) 缓存，任何改动都会清空
+        self.stats_cache = {}
+        # 搜索用的倒排索引；None 表示还没有可信的索引，第一次搜索时整份重建
+        self.search = None
+        # 还没落盘的日志条目 / 是否需要整份快照，由 lock 保护
+        self.pending = []
+        self.needs_snapshot = False
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.write_lock = threading.RLock()
+        self.last_change = 0
+        self.writer = None
+        self.last_error = None
+        self.data = perf.wrap("load_data", self.load_data, lambda _: {"records": len(self.records)})()
+        # 日志有残行、已经过大，或者刚从旧格式迁移过来时，启动后立刻合并一次
+        if self.journal_torn or self.resharded or self.journal_size > self.JOURNAL_LIMIT:
+            self.save_data()
+    
+    def get_data_path(self, filename=None):
+        return self.storage_path(filename or self.data_file)
+    
+    def subscribe(self, listener, on_error=None):
+        # listener(kind, record)，kind 为 "add" / "delete" / "delete_many" / "clear"；on_error(e) 收写盘失败
+        self.listeners.append(listener)
+        if on_error is not None:
+            self.error_listeners.append(on_error)
+    
+    def unsubscribe(self, listener, on_error=None):
+        # 会话关闭时摘掉它的回调，共享实例不再往已经断开的页面推送
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+        if on_error in self.error_listeners:
+            self.error_listeners.remove(on_error)
+    
+    def notify(self, kind, record=None):
+        # 在锁里调用时只排队，由 synchronized 放锁后统一发；不在锁里（写线程发现别的进程写过）就直接发
+        self.stats_cache.clear()
+        with self.lock:
+            self.notices.append((kind, record))
+        if not getattr(self.lock_state, "depth", 0):
+            self.dispatch()
+    
+    def dispatch(self):
+        # 改动已经落进内存了，某个会话的回调出错只记日志，不挡住其他会话，也不抛回发起改动的一方
+        with self.lock:
+            notices, self.notices = self.notices, []
+        for kind, record in notices:
+            for listener in list(self.listeners):
+                try:
+                    listener(kind, record)
+                except Exception:
+                    logger.exception("数据变更通知失败：%s", kind)
+    
+    @staticmethod
+    def storage_path(filename):
+        try:
+            storage = os.environ.get('FLET_APP_STORAGE_DATA')
+            if storage:
+                os.makedirs(storage, exist_ok=True)
+                return os.path.join(storage, filename)
+        except:
+            pass
+        return filename
+    
+    def shard_file(self, month):
+        return f"roro_data.{month}.json"
+    
+    def binary_file(self, month):
+        return f"roro_data.{month}.bin"
+    
+    @staticmethod
+    def read_json(path):
+        # 文件不存在返回 None；存在却读不出来（被截断、编码坏了）就抛错，
+        # 不能当成空账本继续跑，否则下一次快照会把好好的分片和归档覆盖掉
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def load_data(self):
+        # 读盘期间拿共享锁，别的进程写到一半的快照不会被读进来
+        with self.file_lock(shared=True):
+            self.manifest_stat = self.stat_manifest()
+            manifest = self.read_json(self.get_data_path(self.manifest_file))
+            if isinstance(manifest, dict):
+                return self.load_sharded(manifest)
+            return self.load_legacy()
+    
+    @contextlib.contextmanager
+    def file_lock(self, shared=False):
+        # 数据目录的建议锁：写盘拿独占，读盘拿共享；每次单独打开，同进程的两个线程之间也互斥。
+        # 同一线程里嵌套（导入整段持独占锁，里面还要读写盘）时直接沿用外层的锁
+        if getattr(self.lock_state, "held", False):
+            yield
+            return
+        try:
+            f = open(self.get_data_path(self.lock_file), 'a') if fcntl is not None else None
+        except OSError:
+            f = None
+        if f is None:
+            yield
+            return
+        with f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self.lock_state.held = True
+            try:
+                yield
+            finally:
+                self.lock_state.held = False
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    
+    def stat_manifest(self):
+        try:
+            st = os.stat(self.get_data_path(self.manifest_file))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
+    def external_change(self):
+        # 只看两个 stat：清单换了说明别的进程写过快照，日志变长说明别的进程追加过。
+        # 返回 None / "journal" / "manifest"
+        manifest_stat = self.stat_manifest()
+        if manifest_stat != self.manifest_stat:
+            manifest = self.read_json(self.get_data_path(self.manifest_file))
+            if not isinstance(manifest, dict) or manifest.get("seq") != self.data.get("seq"):
+                return "manifest"
+            self.manifest_stat = manifest_stat
+        try:
+            size = os.path.getsize(self.get_data_path(self.journal_file))
+        except OSError:
+            size = 0
+        if size > self.journal_size:
+            return "journal"
+        if size < self.journal_size:
+            return "manifest"
+        return None
+    
+    @synchronized
+    def sync_external(self):
+        # 把别的进程（命令行、同步任务）写进数据目录的改动合进来，返回是否有变化。
+        # 只是日志变长就只读新增的那一段；清单被重写过才整份重读，再把自己还没落盘的改动补回去
+        if self.external_change() is None:
+            return False
+        with self.file_lock(shared=True):
+            # 拿到锁以后再看一次，别的进程可能正好写完快照、删掉了日志
+            kind = self.external_change()
+            if kind is None:
+                return False
+            with self.lock:
+                pending, self.pending = self.pending, []
+            entries = self.read_journal_tail() if kind == "journal" else []
+            if any(entry.get("op") == "clear" for entry in entries):
+                kind = "manifest"
+            if kind == "journal":
+                theirs = [entry["record"].get("id") for entry in entries if entry.get("op") == "add" and entry.get("record")]
+                self.data["next_id"] = max([self.data.get("next_id", 1)] + [int(rid or 0) + 1 for rid in theirs])
+                self.rebase_pending(pending, set(theirs))
+                for entry in entries:
+                    self.apply_entry(self.data, entry)
+            else:
+                self.dirty_months = set()
+                self.data = self.load_data()
+                self.rebase_pending(pending, None)
+                for entry in pending:
+                    self.apply_entry(self.data, entry)
+            with self.lock:
+                self.pending[:0] = pending
+        return True
+    
+    def rebase_pending(self, pending, clashes):
+        # 两个进程各自发号可能撞 id：自己还没落盘的新增换成新号，日志里的删除跟着改。
+        # clashes 为 None 时（整份重读后）全部换号
+        mapping = {}
+        for entry in pending:
+            if entry.get("op") == "add":
+                rid = entry["record"].get("id")
+                if clashes is None or rid in clashes:
+                    mapping[rid] = self.next_id()
+                    entry["record"] = dict(entry["record"], id=mapping[rid])
+        if not mapping:
+            return
+        self.changes.renumber(mapping)
+        for entry in pending:
+            if entry.get("op") == "delete":
+                entry["id"] = mapping.get(entry.get("id"), entry.get("id"))
+            elif entry.get("op") == "delete_many":
+                entry["ids"] = [mapping.get(rid, rid) for rid in entry.get("ids") or []]
+        if clashes is None:
+            return
+        # 内存里还活着的行就地改号，界面上的 RecordView 读的是列存，跟着就变了
+        for old, new in mapping.items():
+            row = self.by_id.pop(old, None)
+            if row is None:
+                continue
+            self.records.ids[row] = new
+            self.by_id[new] = row
+            if self.search is not None:
+                self.search.remove(old)
+                self.index_search(row)
+    
+    def read_journal_tail(self):
+        # 从上次读到的位置往后读；末尾的残行也算读过，下次快照会把日志整理掉
+        path = self.get_data_path(self.journal_file)
+        with open(path, 'rb') as f:
+            f.seek(self.journal_size)
+            chunk = f.read()
+        self.journal_size += len(chunk)
+        entries = []
+        for line in chunk.splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                self.journal_torn = True
+        if self.journal_torn:
+            with self.lock:
+                self.needs_snapshot = True
+        return entries
+    
+    def check_external(self):
+        # 界面回到前台、写线程空闲时调用：别的进程写过就合进来并通知各页面刷新
+        if self.sync_external():
+            self.notify("sync")
+            return True
+        return False
+    
+    def load_sharded(self, data):
+        # 启动只读清单和本月分片，其他月份用清单里的汇总顶着，用到时再读
+        months = data.pop("months", None) or {}
+        data.setdefault("categories", self.default_categories())
+        data.setdefault("next_id", 1)
+        self.archives = data.setdefault("archives", {})
+        self.stale_archives = set()
+        self.records = RecordStore(data["categories"])
+        # 搜索索引要在重放日志之前读进来，之后的增删才会同步进去
+        self.search = self.read_search_index(data.get("search_seq"))
+        if self.search is None:
+            data.pop("search_seq", None)
+        self.unloaded = set(months)
+        self.month_totals = {month: self.totals_from_json(t) for month, t in months.items()}
+        self.reindex()
+        now = datetime.now()
+        self.load_month(f"{now.year}-{now.month:02d}")
+        self.apply_journal(data)
+        return data
+    
+    def load_legacy(self):
+        # 旧的单文件格式：整份读进来、重放日志、迁移 id，然后马上按月重写成分片
+        legacy = self.read_json(self.get_data_path())
+        data = legacy if isinstance(legacy, dict) else {}
+        if "records" not in data:
+            data["records"] = []
+        if "categories" not in data:
+            data["categories"] = self.default_categories()
+        self.archives = data.setdefault("archives", {})
+        self.replay_journal(data)
+        self.migrate_ids(data)
+        # 记录搬进列存，data 里只剩分类等小字段
+        self.search = SearchIndex()
+        self.build_index(data.pop("records"), data["categories"])
+        self.dirty_months = set(self.by_month)
+        # 真有旧文件（或者日志里有记录）才需要马上重写成分片；全新的数据目录什么都不用写
+        self.resharded = legacy is not None or bool(self.by_month)
+        return data
+    
+    @synchronized
+    def load_month(self, month):
+        if month not in self.unloaded:
+            return
+        archive = self.archives.get(month[:4])
+        if archive and month in archive["months"]:
+            self.load_archive(month[:4], month)
+            return
+        # 先读分片，读不出来就抛错，月份保持未读、清单汇总不动，下次快照也不会拿空月份覆盖它。
+        # 清单里有的月份至少有一条记录（记录删光的月份会从清单里去掉），分片不见了就是丢了数据
+        rows = self.read_binary_shard(month)
+        if rows is None:
+            shard = self.read_json(self.get_data_path(self.shard_file(month)))
+            if not isinstance(shard, dict):
+                raise ValueError(f"月份分片缺失或不完整：{self.shard_file(month)}")
+            rows = [self.records.append(r) for r in shard.get("records", [])]
+        self.unloaded.discard(month)
+        # 清单里的月汇总换成真实记录算出来的
+        cached = self.month_totals.pop(month, None)
+        if cached:
+            self.add_totals(self.totals, cached, -1)
+        for row in rows:
+            self.index_row(row)
+    
+    def read_search_index(self, seq):
+        if seq is None:
+            return None
+        try:
+            with open(self.get_data_path(self.search_file), 'rb') as f:
+                return SearchIndex.from_binary(f.read(), seq)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            return None
+    
+    def read_binary_shard(self, month):
+        # 二进制快照缺失、损坏或比 JSON 旧时返回 None，由调用方读 JSON
+        if not self.BINARY_SNAPSHOT:
+            return None
+        path = self.get_data_path(self.binary_file(month))
+        try:
+            json_stat = os.stat(self.get_data_path(self.shard_file(month)))
+            with open(path, 'rb') as f:
+                buf = f.read()
+            return self.records.extend_binary(buf, json_stat)
+        except (OSError, ValueError, struct.error):
+            return None
+    
+    def load_archive(self, year, month):
+        # 归档按年存，读一个月就把这一年还没读进来的月份一起读进来；只在内存里，不改动归档
+        archive = self.read_archive(self.archives[year]["file"])
+        months = {m for m in self.archives[year]["months"] if m in self.unloaded}
+        for m in months:
+            self.unloaded.discard(m)
+            cached = self.month_totals.pop(m, None)
+            if cached:
+                self.add_totals(self.totals, cached, -1)
+        months.add(month)
+        for r in archive.get("records", []):
+            if str(r.get("date", ""))[:7] in months:
+                self.index_row(self.records.append(r))
+    
+    def read_archive(self, name):
+        # 归档读不出来（丢了、被截断）就抛错：这一年保持未读，清单里的汇总照旧
+        path = self.get_data_path(name)
+        opener = lzma.open if name.endswith(".xz") else gzip.open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except EOFError as e:
+            raise ValueError(f"归档文件不完整：{name}") from e
+        if not isinstance(data, dict):
+            raise ValueError(f"归档文件格式不对：{name}")
+        return data
+    
+    def write_archive(self, name, data):
+        path = self.get_data_path(name)
+        opener = lzma.open if name.endswith(".xz") else gzip.open
+        with opener(path + ".tmp", 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        with open(path + ".tmp", 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return os.path.getsize(path)
+    
+    def archived_months(self):
+        return {m for archive in self.archives.values() for m in archive["months"]}
+    
+    @synchronized
+    def archive_years(self, before=None):
+        # 把 before 年（默认今年）以前的记录按年压缩进归档文件，分片和二进制快照随之删掉；
+        # 清单里照旧留着逐月、逐分类的汇总，总计不变。历史、统计、搜索用到这些月份时再从归档读回来。
+        # 返回归档的记录条数
+        before = f"{before or datetime.now().year:04d}"
+        with self.file_lock():
+            self.sync_external()
+            self.ensure_months(None, f"{int(before) - 1:04d}-12-31")
+            store = self.records
+            years = {}
+            for month, rows in self.by_month.items():
+                if month < before:
+                    years.setdefault(month[:4], []).extend(row for row in rows if store.alive[row])
+            count = 0
+            for year, rows in sorted(years.items()):
+                if not rows:
+                    continue
+                rows.sort(key=lambda row: (store.days[row], store.ids[row]))
+                name = f"roro_data.archive.{year}.json.{'xz' if lzma is not None else 'gz'}"
+                start = time.perf_counter()
+                size = self.write_archive(name, {"year": year, "records": [store.view(row).to_dict() for row in rows]})
+                months = sorted({store.date(row)[:7] for row in rows})
+                if year in self.archives and self.archives[year]["file"] != name:
+                    self.stale_archives.add(self.archives[year]["file"])
+                self.archives[year] = {"file": name, "months": months, "count": len(rows)}
+                # 行直接标死但不扣汇总，这些月份回到"没读进来"的状态，汇总就是归档的 rollup
+                for row in rows:
+                    store.alive[row] = 0
+                self.unloaded |= set(months)
+                self.dirty_months |= set(months)
+                count += len(rows)
+                perf.record("archive", time.perf_counter() - start, year=year, records=len(rows), bytes=size)
+            if not count:
+                return 0
+            self.records = store.compacted()
+            self.reindex()
+            self.save_data()
+            self.flush()
+        self.notify("archive")
+        return count
+    
+    def known_months(self):
+        return set(self.month_totals) | self.unloaded | set(self.by_month)
+    
+    @synchronized
+    def ensure_months(self, start=None, end=None):
+        # 把 [start, end] 日期范围涉及的月份都读进来，不给范围就是全部
+        for month in sorted(self.unloaded):
+            if (start is None or month >= start[:7]) and (end is None or month <= end[:7]):
+                self.load_month(month)
+    
+    def migrate_ids(self, data):
+        # 旧版本用时间戳浮点数当 id，可能重复；按现有顺序重新编成递增整数
+        records = data["records"]
+        ids = [r.get("id") for r in records]
+        if all(type(rid) is int for rid in ids) and len(set(ids)) == len(ids):
+            data["next_id"] = max(data.get("next_id", 1), max(ids, default=0) + 1)
+            return
+        for i, r in enumerate(records, 1):
+            r["id"] = i
+        data["next_id"] = len(records) + 1
+        self.ids_migrated = True
+    
+    def build_index(self, records, categories):
+        self.records = RecordStore(categories)
+        for r in records:
+            self.records.append(r)
+        self.reindex()
+    
+    def reindex(self):
+        # 按 id 建索引（id -> 行号），按天、按月分桶（行号数组），今日/本月查询只看对应的桶
+        self.by_id = {}
+        self.tombstones = 0
+        self.by_day = {}
+        self.by_month = {}
+        self.day_sums = DaySums()
+        # 还没读进来的月份只有清单里的汇总，原样保留
+        self.month_totals = {m: t for m, t in self.month_totals.items() if m in self.unloaded}
+        self.totals = self.empty_totals()
+        for t in self.month_totals.values():
+            self.add_totals(self.totals, t)
+        alive = self.records.alive
+        for row in range(len(self.records)):
+            if alive[row]:
+                self.index_row(row)
+    
+    def index_row(self, row):
+        date = self.records.date(row)
+        self.by_id[self.records.ids[row]] = row
+        self.by_day.setdefault(date, array('l')).append(row)
+        self.by_month.setdefault(date[:7], array('l')).append(row)
+        self.apply_totals(row, 1)
+        if self.search is not None:
+            self.index_search(row)
+    
+    def index_search(self, row):
+        store = self.records
+        self.search.add(store.ids[row], store.date(row)[:7], f"{store.notes[row]}\n{store.symbols[store.cats[row]]}")
+    
+    def live_records(self, rows=None):
+        store = self.records
+        if rows is None:
+            rows = range(len(store))
+        return [store.view(row) for row in rows if store.alive[row]]
+    
+    def compact_tombstones(self, force=False):
+        if not self.tombstones:
+            return
+        if force or (self.tombstones > self.TOMBSTONE_MIN and self.tombstones * 4 > len(self.records)):
+            self.records = self.records.compacted()
+            self.reindex()
+    
+    @synchronized
+    def compact(self):
+        # 读入全部月份、清掉墓碑，重写所有分片和清单，日志随之清空
+        with self.file_lock():
+            self.sync_external()
+            self.ensure_months()
+            self.compact_tombstones(force=True)
+            # 倒排里攒下的已删除 id 也顺便清掉
+            self.search = None
+            self.ensure_search()
+            # 归档年份读进来只是为了重建索引，分片不用重写
+            self.dirty_months |= self.known_months() - self.archived_months()
+            self.save_data()
+            self.flush()
+    
+    @staticmethod
+    def empty_totals():
+        return {"count": 0, "type": {}, "category": {}}
+    
+    @staticmethod
+    def add_totals(target, totals, sign=1):
+        target["count"] += totals["count"] * sign
+        for field in ("type", "category"):
+            for key, cents in totals[field].items():
+                target[field][key] = target[field].get(key, 0) + cents * sign
+    
+    @staticmethod
+    def totals_to_json(totals):
+        return {
+            "count": totals["count"],
+            "type": dict(totals["type"]),
+            "category": [[rtype, name, cents] for (rtype, name), cents in totals["category"].items()],
+        }
+    
+    @staticmethod
+    def totals_from_json(data):
+        return {
+            "count": data.get("count", 0),
+            "type": dict(data.get("type") or {}),
+            "category": {(rtype, name): cents for rtype, name, cents in data.get("category") or []},
+        }
+    
+    def apply_totals(self, row, sign):
+        # 汇总缓存按增量维护（单位：分）：全部记录一份，每个月一份
+        store = self.records
+        rtype = store.symbols[store.types[row]]
+        amount = store.cents[row] * sign
+        month = store.date(row)[:7]
+        month_totals = self.month_totals.get(month)
+        if month_totals is None:
+            month_totals = self.month_totals[month] = self.empty_totals()
+        for totals in (self.totals, month_totals):
+            totals["count"] += sign
+            totals["type"][rtype] = totals["type"].get(rtype, 0) + amount
+            key = (rtype, store.symbols[store.cats[row]])
+            totals["category"][key] = totals["category"].get(key, 0) + amount
+        if month_totals["count"] == 0:
+            del self.month_totals[month]
+        # 日期无效的记录序数为 0，不进按天的树
+        if store.days[row]:
+            if rtype == "收入":
+                self.day_sums.add(store.days[row], amount, 0)
+            elif rtype == "支出":
+                self.day_sums.add(store.days[row], 0, amount)
+    
+    def verify_totals(self):
+        # 自检：全量重算一遍，和缓存对不上就报错（会把所有月份都读进来）
+        self.ensure_months()
+        expected = self.empty_totals()
+        expected_months = {}
+        for r in self.live_records():
+            month = r["date"][:7]
+            cents = to_cents(r["amount"])
+            for totals in (expected, expected_months.setdefault(month, self.empty_totals())):
+                rtype = r["type"]
+                totals["count"] += 1
+                totals["type"][rtype] = totals["type"].get(rtype, 0) + cents
+                key = (rtype, r["category"])
+                totals["category"][key] = totals["category"].get(key, 0) + cents
+        
+        def same(a, b):
+            # 整数分，没有浮点误差，直接比
+            if a["count"] != b["count"]:
+                return False
+            for field in ("type", "category"):
+                for key in set(a[field]) | set(b[field]):
+                    if a[field].get(key, 0) != b[field].get(key, 0):
+                        return False
+            return True
+        
+        if not same(expected, self.totals):
+            raise AssertionError(f"汇总缓存不一致: {self.totals} != {expected}")
+        for month in set(expected_months) | set(self.month_totals):
+            cached = self.month_totals.get(month, self.empty_totals())
+            if not same(expected_months.get(month, self.empty_totals()), cached):
+                raise AssertionError(f"{month} 汇总缓存不一致: {cached}")
+        # 按天的树状数组只收日期有效的记录
+        income = expense = 0
+        for r in self.live_records():
+            if self.records.day_ordinal(r["date"]):
+                if r["type"] == "收入":
+                    income += to_cents(r["amount"])
+                elif r["type"] == "支出":
+                    expense += to_cents(r["amount"])
+        if self.day_sums.range(1, datetime.max.toordinal()) != (income, expense):
+            raise AssertionError(f"按天收支索引不一致: {self.day_sums.range(1, datetime.max.toordinal())} != {(income, expense)}")
+    
+    def replay_journal(self, data):
+        # 快照之后的增删都记在日志里，启动时按顺序重放
+        path = self.get_data_path(self.journal_file)
+        if not os.path.exists(path):
+            self.journal_size = 0
+            return
+        records = data["records"]
+        seen = {r.get("id") for r in records}
+        deleted = set()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写到一半崩溃留下的残行，直接跳过
+                        self.journal_torn = True
+                        continue
+                    op = entry.get("op")
+                    if op == "add":
+                        record = entry.get("record") or {}
+                        # 快照已经包含这条（合并后没来得及删日志）
+                        if record.get("id") in seen:
+                            continue
+                        records.append(record)
+                        seen.add(record.get("id"))
+                    elif op == "delete":
+                        deleted.add(entry.get("id"))
+                    elif op == "delete_many":
+                        deleted.update(entry.get("ids") or [])
+                    elif op == "clear":
+                        records.clear()
+                        seen.clear()
+                        deleted.clear()
+            # id 不会复用，删除可以攒到最后一次性过滤
+            if deleted:
+                records[:] = [r for r in records if r.get("id") not in deleted]
+            self.journal_size = os.path.getsize(path)
+        except:
+            self.journal_size = 0
+    
+    def apply_journal(self, data):
+        # 分片格式下的日志重放：直接作用在列存上，涉及的月份先读进来
+        path = self.get_data_path(self.journal_file)
+        if not os.path.exists(path):
+            self.journal_size = 0
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写到一半崩溃留下的残行，直接跳过
+                        self.journal_torn = True
+                        continue
+                    self.apply_entry(data, entry)
+            self.journal_size = os.path.getsize(path)
+        except OSError:
+            self.journal_size = 0
+    
+    def apply_entry(self, data, entry):
+        op = entry.get("op")
+        if op == "add":
+            record = entry.get("record") or {}
+            month = str(record.get("date", ""))[:7]
+            self.load_month(month)
+            # 分片已经包含这条（合并后没来得及删日志）
+            if record.get("id") in self.by_id:
+                return
+            self.index_row(self.records.append(record))
+            self.dirty_months.add(month)
+            data["next_id"] = max(data.get("next_id", 1), int(record.get("id", 0)) + 1)
+        elif op in ("delete", "delete_many"):
+            months = entry.get("months") or ([entry["month"]] if "month" in entry else None)
+            if months is None:
+                self.ensure_months()
+            for month in months or []:
+                self.load_month(month)
+            ids = entry.get("ids") if op == "delete_many" else [entry.get("id")]
+            for rid in ids or []:
+                row = self.by_id.get(rid)
+                if row is not None:
+                    self.drop_row(row)
+        elif op == "clear":
+            self.reset_records(data["categories"])
+    
+    def default_categories(self):
+        return {
+            "支出": [
+                {"name": "餐饮", "icon": "🍜", "color": "#FF6B6B"},
+                {"name": "交通", "icon": "🚗", "color": "#4ECDC4"},
+                {"name": "购物", "icon": "🛒", "color": "#45B7D1"},
+                {"name": "娱乐", "icon": "🎮", "color": "#96CEB4"},
+                {"name": "居住", "icon": "🏠", "color": "#FFEAA7"},
+                {"name": "其他", "icon": "💡", "color": "#95A5A6"},
+            ],
+            "收入": [
+                {"name": "工资", "icon": "💰", "color": "#4ECDC4"},
+                {"name": "奖金", "icon": "🎁", "color": "#F39C12"},
+                {"name": "兼职", "icon": "💼", "color": "#3498DB"},
+                {"name": "其他", "icon": "💡", "color": "#95A5A6"},
+            ]
+        }
+    
+    def save_data(self):
+        # 要求写一份完整快照；实际写盘由 flush 完成
+        with self.lock:
+            self.needs_snapshot = True
+        self.schedule_write()
+    
+    def append_journal(self, entry):
+        with self.lock:
+            self.pending.append(entry)
+        self.schedule_write()
+    
+    def schedule_write(self):
+        # 没有后台写线程（脚本、迁移）时当场写；否则叫醒写线程
+        if self.writer is None:
+            self.flush()
+            return
+        with self.changed:
+            self.last_change = time.monotonic()
+            self.changed.notify()
+    
+    def start_writer(self, on_error=None):
+        # 之后的改动都由一个后台线程合并写盘，事件处理里不再等磁盘；共享实例只起一个写线程
+        if on_error is not None and on_error not in self.error_listeners:
+            self.error_listeners.append(on_error)
+        if self.writer is not None:
+            return
+        self.writer = threading.Thread(target=self.writer_loop, name="roro-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)
+    
+    def writer_loop(self):
+        failed_at = None
+        while True:
+            with self.changed:
+                # 写失败后等到下一次改动再重试，免得反复报错；一直没有改动就去看看别的进程
+                idle = False
+                while not (self.pending or self.needs_snapshot) or self.last_change == failed_at:
+                    if not self.changed.wait(self.EXTERNAL_POLL):
+                        idle = True
+                        break
+                if not idle:
+                    first = time.monotonic()
+                    while True:
+                        deadline = min(self.last_change + self.WRITE_DELAY, first + self.WRITE_MAX_DELAY)
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.changed.wait(remaining)
+                    stamp = self.last_change
+            try:
+                if idle:
+                    self.check_external()
+                else:
+                    failed_at = None if self.flush() else stamp
+            except Exception as e:
+                self.report_error(e)
+    
+    def flush(self):
+        # 先把别的进程写的改动合进来，再拿独占锁写自己的；两步之间又被人写了就重来。
+        # 锁的顺序到处都是 mutex → 文件锁 → write_lock（改动方法里也会 flush），这里也先拿 mutex，
+        # write_pending 把快照要用的东西复制完就放掉，写盘期间界面不用等
+        changed = False
+        while True:
+            changed = self.sync_external() or changed
+            self.mutex.acquire()
+            released = []
+            
+            def release():
+                if not released:
+                    released.append(True)
+                    self.mutex.release()
+            try:
+                with self.file_lock(), self.write_lock:
+                    if self.external_change() is not None:
+                        continue
+                    ok = self.write_pending(release)
+            finally:
+                release()
+            # 日志写过了上限就马上再来一次，这回会合并成快照
+            if not ok or self.journal_size <= self.JOURNAL_LIMIT:
+                break
+        if changed:
+            self.notify("sync")
+        return ok
+    
+    def write_pending(self, release=None):
+        # 把积压的改动一次写掉：要快照就写快照（它已经包含积压的日志），否则批量追加日志。
+        # 调用方拿着 mutex、文件锁和 write_lock；release 在输入复制完后放掉 mutex
+        try:
+            with self.lock:
+                entries = self.pending
+                snapshot = self.needs_snapshot or self.journal_size > self.JOURNAL_LIMIT
+                if snapshot:
+                    # 清单的序号每次快照加一，别的进程据此判断清单是不是被重写过
+                    manifest = dict(self.data)
+                    manifest["seq"] = self.data.get("seq", 0) + 1
+                    # 搜索索引有改动时跟快照一起重写，清单里记下它的序号，启动时据此判断索引是否可信
+                    search = None
+                    if self.search is not None and self.search.dirty:
+                        manifest["search_seq"] = self.data.get("search_seq", 0) + 1
+                        search = self.search.to_binary(manifest["search_seq"])
+                    manifest["categories"] = json.loads(json.dumps(self.data["categories"]))
+                    manifest["months"] = {m: self.totals_to_json(t) for m, t in self.month_totals.items()}
+                    # 只重写改过的月份；记下此刻的列存和行号，记录字典在锁外生成
+                    months = set(self.dirty_months)
+                    # 读回来又改过的归档年份整年恢复成普通分片，归档文件在快照写完后删掉
+                    restored = [
+                        year for year in {m[:4] for m in months} & set(self.archives)
+                        if not set(self.archives[year]["months"]) & self.unloaded
+                    ]
+                    for year in restored:
+                        months |= set(self.archives[year]["months"])
+                    manifest["archives"] = json.loads(json.dumps(
+                        {year: archive for year, archive in self.archives.items() if year not in restored}
+                    ))
+                    retired = self.stale_archives | {self.archives[year]["file"] for year in restored}
+                    store = self.records
+                    shards = {
+                        m: [row for row in self.by_month.get(m, ()) if store.alive[row]]
+                        for m in months
+                    }
+                # 输入都复制好了才清队列、改状态；上面哪一步出错，积压的改动都原样留着下次再写。
+                # 变更日志只写跟这批数据一起取走的条目，放掉 mutex 后新排的还可能被 sync_external 换号
+                self.pending = []
+                logged = self.changes.take()
+                self.needs_snapshot = False
+                if snapshot:
+                    self.data["seq"] = manifest["seq"]
+                    if search is not None:
+                        self.data["search_seq"] = manifest["search_seq"]
+                        self.search.dirty = False
+                    self.dirty_months = set()
+                    for year in restored:
+                        self.archives.pop(year)
+                    self.stale_archives = set()
+        finally:
+            if release is not None:
+                release()
+        try:
+            start = time.perf_counter()
+            if snapshot:
+                size = self.write_snapshot(manifest, store, shards, search, retired)
+                perf.record("save_data", time.perf_counter() - start, months=len(shards), bytes=size)
+            elif entries:
+                size = self.write_journal(entries)
+                perf.record("journal", time.perf_counter() - start, entries=len(entries), bytes=size)
+        except (OSError, ValueError, TypeError, RuntimeError) as e:
+            with self.lock:
+                if snapshot:
+                    self.dirty_months |= months
+                    self.stale_archives |= retired
+                    if search is not None and self.search is not None:
+                        self.search.dirty = True
+                else:
+                    self.pending[:0] = entries
+                self.changes.pending[:0] = logged
+                self.needs_snapshot = self.needs_snapshot or snapshot
+            self.report_error(e)
+            return False
+        # 同步用的变更日志跟在数据后面写；写失败的留在队列里下次再写，数据不会重复落盘
+        try:
+            self.changes.write(logged)
+        except (OSError, ValueError, TypeError) as e:
+            self.report_error(e)
+            return False
+        self.last_error = None
+        return True
+    
+    def report_error(self, e):
+        self.last_error = e
+        if not self.error_listeners:
+            raise e
+        for on_error in list(self.error_listeners):
+            on_error(e)
+    
+    @staticmethod
+    def write_json_atomic(path, data):
+        # 先写临时文件再原子替换，崩溃时旧文件仍然完整
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    
+    def write_snapshot(self, manifest, store, shards, search=None, retired=()):
+        # 先写改过的月份分片和搜索索引，最后写清单；中途崩溃时日志还在，重放是幂等的。返回写出的字节数
+        size = 0
+        for month, rows in shards.items():
+            path = self.get_data_path(self.shard_file(month))
+            binary = self.get_data_path(self.binary_file(month))
+            if rows:
+                records = [store.view(row).to_dict() for row in rows]
+                self.write_json_atomic(path, {"month": month, "records": records})
+                if self.BINARY_SNAPSHOT:
+                    # 快照里记着 JSON 的大小和修改时间，JSON 被别的程序改过就会被当作过期
+                    tmp = binary + ".tmp"
+                    with open(tmp, 'wb') as f:
+                        f.write(store.to_binary(rows, os.stat(path)))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, binary)
+                    size += os.path.getsize(binary)
+                size += os.path.getsize(path)
+            else:
+                for stale in (path, binary):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+        if search is not None:
+            path = self.get_data_path(self.search_file)
+            with open(path + ".tmp", 'wb') as f:
+                f.write(search)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            size += len(search)
+        self.write_json_atomic(self.get_data_path(self.manifest_file), manifest)
+        self.manifest_stat = self.stat_manifest()
+        size += self.manifest_stat[1]
+        # 快照已包含日志里的全部改动，日志可以清掉
+        journal = self.get_data_path(self.journal_file)
+        if os.path.exists(journal):
+            os.remove(journal)
+        self.journal_size = 0
+        # 只删这次快照确实替换掉的归档（改回分片的年份、清空前的归档），清单里还引用的不动
+        archives = {archive["file"] for archive in manifest.get("archives", {}).values()}
+        for name in retired:
+            path = self.get_data_path(name)
+            if name not in archives and os.path.exists(path):
+                os.remove(path)
+        # 旧的单文件已经拆成分片，改名留作备份
+        legacy = self.get_data_path()
+        if os.path.exists(legacy):
+            os.replace(legacy, legacy + ".bak")
+        return size
+    
+    def write_journal(self, entries):
+        path = self.get_data_path(self.journal_file)
+        text = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        size = len(text.encode('utf-8'))
+        self.journal_size += size
+        return size
+    
+    def next_id(self):
+        rid = self.data.get("next_id", 1)
+        self.data["next_id"] = rid + 1
+        return rid
+    
+    @synchronized
+    def get_record(self, rid):
+        row = self.by_id.get(rid)
+        return None if row is None else self.records.view(row)
+    
+    @synchronized
+    def add_record(self, rtype, amount, category, icon, note, date):
+        # 先把那个月读进来，免得落盘时用不完整的记录覆盖分片
+        self.load_month(date[:7])
+        row = self.records.append({
+            "id": self.next_id(),
+            "type": rtype,
+            "amount": amount,
+            "category": category,
+            "icon": icon,
+            "note": note,
+            "date": date,
+        })
+        self.index_row(row)
+        self.dirty_months.add(self.records.date(row)[:7])
+        if self.self_check:
+            self.verify_totals()
+        record = self.records.view(row)
+        self.changes.record_add(record.to_dict())
+        self.append_journal({"op": "add", "record": record.to_dict()})
+        self.notify("add", record)
+    
+    def drop_row(self, row):
+        # 只摘掉 id 索引、扣掉汇总，列存和日期桶里的行留作墓碑
+        del self.by_id[self.records.ids[row]]
+        self.records.alive[row] = 0
+        self.apply_totals(row, -1)
+        if self.search is not None:
+            self.search.remove(self.records.ids[row])
+        self.tombstones += 1
+        self.dirty_months.add(self.records.date(row)[:7])
+    
+    @synchronized
+    def delete_record(self, rid):
+        row = self.by_id.get(rid)
+        if row is None:
+            return
+        removed = self.records.view(row)
+        self.changes.record_deletes([(rid, removed["date"][:7])])
+        self.drop_row(row)
+        if self.self_check:
+            self.verify_totals()
+        self.append_journal({"op": "delete", "id": rid, "month": removed["date"][:7]})
+        self.compact_tombstones()
+        self.notify("delete", removed)
+    
+    @synchronized
+    def delete_records(self, start=None, end=None, category=None, rtype=None):
+        # 批量删除：一条日志、一次通知，返回删掉的条数
+        self.ensure_months(start, end)
+        store = self.records
+        days = [d for d in self.by_day if (start is None or d >= start) and (end is None or d <= end)]
+        category = None if category is None else store.codes.get(category, -1)
+        rtype = None if rtype is None else store.codes.get(rtype, -1)
+        removed = [
+            row for d in days for row in self.by_day[d]
+            if store.alive[row]
+            and (category is None or store.cats[row] == category)
+            and (rtype is None or store.types[row] == rtype)
+        ]
+        return self.remove_rows(removed)
+    
+    @synchronized
+    def delete_ids(self, targets, log=True):
+        # 按 (id, 月份) 批量删除，合并别的设备的删除时用；不知道月份的只好把全部月份读进来
+        for month in {month for _, month in targets}:
+            if month:
+                self.load_month(month)
+            else:
+                self.ensure_months()
+        return self.remove_rows([self.by_id[rid] for rid, _ in targets if rid in self.by_id], log)
+    
+    def remove_rows(self, removed, log=True):
+        # 一条日志、一次通知，返回删掉的条数
+        if not removed:
+            return 0
+        store = self.records
+        ids = [store.ids[row] for row in removed]
+        if log:
+            self.changes.record_deletes([(rid, store.date(row)[:7]) for rid, row in zip(ids, removed)])
+        months = sorted({store.date(row)[:7] for row in removed})
+        for row in removed:
+            self.drop_row(row)
+        if self.self_check:
+            self.verify_totals()
+        self.append_journal({"op": "delete_many", "ids": ids, "months": months})
+        self.compact_tombstones()
+        self.notify("delete_many")
+        return len(removed)
+    
+    def reset_records(self, categories):
+        # 清空全部记录：已知的月份都记为脏，落盘时删掉对应分片
+        self.dirty_months |= self.known_months()
+        self.unloaded = set()
+        self.month_totals = {}
+        self.stale_archives |= {archive["file"] for archive in self.archives.values()}
+        self.archives.clear()
+        self.search = SearchIndex()
+        self.build_index([], categories)
+    
+    @synchronized
+    def clear_records(self):
+        # 清空也要让别的设备知道，按条记成删除
+        self.ensure_months()
+        self.changes.record_deletes([(r["id"], r["date"][:7]) for r in self.live_records()])
+        self.reset_records(self.data["categories"])
+        self.append_journal({"op": "clear"})
+        self.save_data()
+        self.notify("clear")
+    
+    @staticmethod
+    def read_csv(f):
+        reader = csv.DictReader(f)
+        if reader.fieldnames:
+            reader.fieldnames = [
+                DataManager.IMPORT_ALIASES.get(name.strip(), name.strip().lower()) for name in reader.fieldnames
+            ]
+        for raw in reader:
+            yield reader.line_num, raw
+    
+    @staticmethod
+    def read_jsonl(f):
+        for line, text in enumerate(f, 1):
+            if text.strip():
+                yield line, text
+    
+    @staticmethod
+    def read_json_file(f):
+        # 单文件 JSON（export_records 的 .json、旧版的 roro_data.json）：{"records": [...]} 或直接是列表；
+        # 序号当行号报错
+        data = json.load(f)
+        records = data.get("records") if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            raise ValueError("JSON 文件里没有记录列表")
+        yield from enumerate(records, 1)
+    
+    @staticmethod
+    def export_format(path):
+        lower = path.lower()
+        return "csv" if lower.endswith(".csv") else "json" if lower.endswith(".json") else "jsonl"
+    
+    def parse_import_row(self, raw):
+        # 校验并规整一行导入数据，不合格抛 ValueError
+        if isinstance(raw, str):
+            raw = json.loads(raw)
+        if not isinstance(raw, dict):
+            raise ValueError("不是一条记录")
+        raw = {self.IMPORT_ALIASES.get(k, k): v for k, v in raw.items()}
+        try:
+            amount = float(str(raw.get("amount", "")).replace(",", "").replace("¥", "").strip())
+        except ValueError:
+            raise ValueError(f"金额无效: {raw.get('amount')!r}")
+        if amount != amount or amount in (float("inf"), float("-inf")):
+            raise ValueError(f"金额无效: {raw.get('amount')!r}")
+        rtype = str(raw.get("type") or "").strip()
+        if rtype:
+            rtype = self.TYPE_ALIASES.get(rtype.lower())
+            if rtype is None:
+                raise ValueError(f"类型无效: {raw.get('type')!r}")
+        else:
+            rtype = "支出" if amount < 0 else "收入"
+        date = str(raw.get("date") or "").strip().replace("/", "-")[:10]
+        try:
+            date = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"日期无效: {raw.get('date')!r}")
+        return {
+            "type": rtype,
+            "amount": abs(to_cents(amount)) / 100,
+            "category": str(raw.get("category") or "").strip() or "其他",
+            "icon": str(raw.get("icon") or "").strip(),
+            "note": str(raw.get("note") or ""),
+            "date": date,
+        }
+    
+    @staticmethod
+    def record_key(r):
+        return (r["date"], r["type"], to_cents(r["amount"]), r["category"], r["note"])
+    
+    def record_keys(self):
+        # 已有记录的去重键：日期、类型、金额、分类、备注都一样就算重复
+        self.ensure_months()
+        store = self.records
+        symbols = store.symbols
+        return {
+            (store.date(row), symbols[store.types[row]], store.cents[row], symbols[store.cats[row]], store.notes[row])
+            for row in range(len(store)) if store.alive[row]
+        }
+    
+    def map_category(self, r):
+        # 分类按名字对上已有的；没有就加进 data["categories"]，记账页会跟着出现
+        cats = self.data["categories"].setdefault(r["type"], [])
+        for c in cats:
+            if c["name"] == r["category"]:
+                r["icon"] = r["icon"] or c["icon"]
+                return
+        r["icon"] = r["icon"] or "💡"
+        cats.append({"name": r["category"], "icon": r["icon"], "color": "#95A5A6"})
+    
+    @synchronized
+    def insert_records(self, records, log=True):
+        # 整批进列存，最后写一次快照，不逐条记日志；整段持独占锁，别的进程插不进来抢号。
+        # 插入后每条 r 里带上新发的 id；log=False 时（合并别的设备）不算本机改动
+        with self.file_lock():
+            self.sync_external()
+            added = 0
+            for r in records:
+                self.load_month(r["date"][:7])
+                r["id"] = self.next_id()
+                row = self.records.append(r)
+                self.index_row(row)
+                self.dirty_months.add(self.records.date(row)[:7])
+                if log:
+                    self.changes.record_add(self.records.view(row).to_dict())
+                added += 1
+            if added:
+                if self.self_check:
+                    self.verify_totals()
+                self.save_data()
+                self.flush()
+    
+    def import_records(self, path, progress=None):
+        # 流式导入 CSV（按表头）或 JSON Lines；progress(已处理行数, 0~1 的进度)
+        result = {"added": 0, "duplicates": 0, "invalid": 0, "errors": []}
+        seen = self.record_keys()
+        size = os.path.getsize(path) or 1
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            rows = {"csv": self.read_csv, "json": self.read_json_file, "jsonl": self.read_jsonl}[self.export_format(path)](f)
+            
+            def accepted():
+                for done, (line, raw) in enumerate(rows, 1):
+                    if progress and done % self.IMPORT_PROGRESS_EVERY == 0:
+                        progress(done, min(f.buffer.tell() / size, 1.0))
+                    try:
+                        r = self.parse_import_row(raw)
+                    except ValueError as e:
+                        result["invalid"] += 1
+                        if len(result["errors"]) < self.IMPORT_ERROR_LIMIT:
+                            result["errors"].append((line, str(e)))
+                        continue
+                    key = self.record_key(r)
+                    if key in seen:
+                        result["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                    self.map_category(r)
+                    result["added"] += 1
+                    yield r
+            
+            categories = json.dumps(self.data["categories"], sort_keys=True)
+            self.insert_records(accepted())
+            if json.dumps(self.data["categories"], sort_keys=True) != categories:
+                self.changes.record([{"op": "categories", "categories": self.data["categories"]}])
+                self.write_changes()
+        if progress:
+            progress(result["added"] + result["duplicates"] + result["invalid"], 1.0)
+        if result["added"]:
+            self.notify("import")
+        return result
+    
+    def recurring_rules(self):
+        # 周期规则和分类一样存在清单里
+        return self.data.setdefault("recurring", [])
+    
+    def save_recurring(self):
+        # 规则放在清单里，这里只标记要写快照；调用方随后 flush，和同一次操作插入的记录合成一次落盘
+        with self.lock:
+            self.needs_snapshot = True
+    
+    @synchronized
+    def add_recurring(self, rtype, amount, category, icon, note, freq, start, interval=1, days=None, end=None):
+        # 新建一条周期规则，从 start 那天起按 freq 重复；记录本身由 materialize_recurring 补出来
+        if freq not in RECURRING_FREQS:
+            raise ValueError(f"不支持的重复方式：{freq}")
+        with self.file_lock():
+            self.sync_external()
+            rules = self.recurring_rules()
+            rule = {
+                "id": max((r["id"] for r in rules), default=0) + 1,
+                "type": rtype,
+                "amount": amount,
+                "category": category,
+                "icon": icon,
+                "note": note,
+                "freq": freq,
+                "interval": max(int(interval), 1),
+                "days": sorted(set(days)) if days else None,
+                "start": start,
+                "end": end,
+                "last": None,
+            }
+            rules.append(rule)
+            self.save_recurring()
+            self.flush()
+        self.notify("recurring")
+        return dict(rule)
+    
+    @synchronized
+    def delete_recurring(self, rule_id):
+        # 只删规则，已经记下的账保留
+        with self.file_lock():
+            self.sync_external()
+            rules = self.recurring_rules()
+            kept = [r for r in rules if r["id"] != rule_id]
+            if len(kept) == len(rules):
+                return False
+            rules[:] = kept
+            self.save_recurring()
+            self.flush()
+        self.notify("recurring")
+        return True
+    
+    @synchronized
+    def materialize_recurring(self, today=None):
+        # 把各条规则到今天为止该记的账一次补齐：一次批量插入、一次落盘，不逐条 add_record。
+        # 规则里 last 记着补到哪天；同一天已经有一模一样的记录（上次写到一半崩了、别的设备同步过来）就算已经记过，
+        # 所以重复调用、多个会话或进程同时调用都不会记重。返回补记的条数
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        # 启动和回到前台都会调，大多数时候没有到期的，不拿锁直接返回
+        if not any(recurring_dates(rule, today) for rule in self.recurring_rules()):
+            return 0
+        start = time.perf_counter()
+        with self.file_lock():
+            self.sync_external()
+            records = []
+            existing = {}
+            for rule in self.recurring_rules():
+                dates = recurring_dates(rule, today)
+                for day in dates:
+                    if day not in existing:
+                        existing[day] = {}
+                        for r in self.get_records(day):
+                            key = self.record_key(r)
+                            existing[day][key] = existing[day].get(key, 0) + 1
+                    r = {key: rule[key] for key in ("type", "amount", "category", "icon", "note")}
+                    r["date"] = day
+                    key = self.record_key(r)
+                    if existing[day].get(key):
+                        existing[day][key] -= 1
+                    else:
+                        records.append(r)
+                if dates:
+                    rule["last"] = dates[-1]
+            # 先把改过 last 的规则标脏，插入记录时那一次快照就把它们一起带上
+            self.save_recurring()
+            if records:
+                self.insert_records(records)
+            self.flush()
+        perf.record("recurring", time.perf_counter() - start, records=len(records))
+        if records:
+            self.notify("recurring")
+        return len(records)
+    
+    @synchronized
+    def ensure_search(self):
+        # 没有可信的索引就把全部月份读进来整份重建，下次快照时一起落盘
+        if self.search is None:
+            self.ensure_months()
+            self.search = SearchIndex()
+            store = self.records
+            for row in range(len(store)):
+                if store.alive[row]:
+                    self.index_search(row)
+            self.save_data()
+        return self.search
+    
+    def search_records(self, query="", rtype=None, min_amount=None, max_amount=None, start=None, end=None):
+        # 生成器：新的在前，按月份一批批给出结果，列表可以边搜边显示
+        terms = query.lower().split()
+        low = None if min_amount is None else to_cents(min_amount)
+        high = None if max_amount is None else to_cents(max_amount)
+        for r in (self.iter_search(terms, start, end) if terms else self.iter_records(start, end)):
+            if rtype is not None and r["type"] != rtype:
+                continue
+            if low is not None or high is not None:
+                cents = to_cents(r["amount"])
+                if (low is not None and cents < low) or (high is not None and cents > high):
+                    continue
+            yield r
+    
+    def iter_search(self, terms, start=None, end=None):
+        with self.mutex:
+            index = self.ensure_search()
+            ids = None
+            for term in terms:
+                found = index.lookup(term)
+                ids = found if ids is None else ids & found
+                if not ids:
+                    return
+            months = {}
+            for rid in ids:
+                months.setdefault(index.month_of(rid), []).append(rid)
+        for month in sorted(months, reverse=True):
+            if (start is not None and month < start[:7]) or (end is not None and month > end[:7]):
+                continue
+            yield from self.match_month(month, months[month], terms, start, end)
+    
+    @synchronized
+    def match_month(self, month, ids, terms, start, end):
+        # 一个月的候选在锁里核对完再交出去，期间别的会话压缩列存也不会错行
+        self.load_month(month)
+        store = self.records
+        rows = [self.by_id[rid] for rid in ids if rid in self.by_id]
+        rows.sort(key=lambda row: (store.days[row], store.ids[row]), reverse=True)
+        matched = []
+        for row in rows:
+            date = store.date(row)
+            if (start is not None and date < start) or (end is not None and date > end):
+                continue
+            # 两字索引只能保证每一对相邻字都出现过，这里按原文确认
+            text = f"{store.notes[row]}\n{store.symbols[store.cats[row]]}".lower()
+            if all(term in text for term in terms):
+                matched.append(store.view(row))
+        return matched
+    
+    def write_changes(self):
+        # 变更日志单独落盘（SQLite、导入后的分类变化）；JSON 后端平时跟着 flush 一起写
+        with self.file_lock():
+            self.changes.write()
+    
+    def merge_categories(self, categories):
+        # 分类按名字取并集，两边谁先谁后合出来都一样；返回是否有新增
+        changed = False
+        for rtype, cats in categories.items():
+            mine = self.data["categories"].setdefault(rtype, [])
+            names = {c.get("name") for c in mine if isinstance(c, dict)}
+            for c in cats:
+                if isinstance(c, dict) and c.get("name") not in names:
+                    mine.append(dict(c))
+                    names.add(c.get("name"))
+                    changed = True
+        return changed
+    
+    @synchronized
+    def start_sync(self):
+        # 变更日志从第一次同步（发包或收包）才开始记：把那时已有、日志里还没有的记录和分类补记一遍
+        self.flush()
+        with self.file_lock():
+            state = self.changes.load_state()
+            if state.get("baseline"):
+                return
+            # 别的进程在此之前落盘的记录也没记过日志，先合进来一起补
+            self.sync_external()
+            logged = {entry.get("id") for entry in self.changes.read() if entry.get("op") == "add"}
+            self.changes.record(
+                [{"op": "categories", "categories": self.data["categories"]}]
+                + [{"op": "add", "id": r["id"], "record": dict(r)} for r in self.iter_records() if r["id"] not in logged]
+            )
+            state["baseline"] = True
+            self.changes.write()
+    
+    @synchronized
+    def sync_bundle(self, peer=None, vector=None):
+        # 发给 peer 的增量 {"device", "vector", "changes"}；不给 vector 就用上次从 peer 那里听到的时钟
+        self.start_sync()
+        with self.file_lock():
+            state = self.changes.load_state()
+            if vector is None:
+                vector = state["peers"].get(peer or "", {}).get("vector", {})
+            return self.changes.bundle(peer or "", vector)
+    
+    def check_sync_bundle(self, bundle):
+        # 同步包先整包校验、规整，一条不合格就整包拒收（ValueError），不会改了一半
+        if not isinstance(bundle, dict) or not isinstance(bundle.get("changes"), list):
+            raise ValueError("不是同步包")
+        peer, vector = bundle.get("device"), bundle.get("vector") or {}
+        if peer is not None and (not isinstance(peer, str) or not peer):
+            raise ValueError(f"设备号无效：{peer!r}")
+        if not isinstance(vector, dict) or not all(
+            isinstance(dev, str) and type(seq) is int and seq >= 0 for dev, seq in vector.items()
+        ):
+            raise ValueError("同步包的时钟格式不对")
+        changes = []
+        for entry in bundle["changes"]:
+            if not isinstance(entry, dict):
+                raise ValueError("同步条目不是对象")
+            dev, seq, op, uid = entry.get("dev"), entry.get("seq"), entry.get("op"), entry.get("uid")
+            if not isinstance(dev, str) or not dev or type(seq) is not int or seq < 1:
+                raise ValueError(f"同步条目缺少设备号或序号：{dev!r} {seq!r}")
+            if op in ("add", "delete") and (not isinstance(uid, str) or ":" not in uid):
+                raise ValueError(f"同步条目的记录编号无效：{uid!r}")
+            if op == "add":
+                entry = dict(entry, record=self.parse_import_row(entry.get("record")))
+            elif op == "categories":
+                categories = entry.get("categories")
+                if not isinstance(categories, dict) or not all(
+                    isinstance(rtype, str) and isinstance(cats, list)
+                    and all(isinstance(c, dict) and isinstance(c.get("name"), str) for c in cats)
+                    for rtype, cats in categories.items()
+                ):
+                    raise ValueError("同步包里的分类格式不对")
+            elif op != "delete":
+                raise ValueError(f"不认识的同步操作：{op!r}")
+            changes.append(entry)
+        return dict(bundle, vector=vector, changes=changes)
+    
+    @synchronized
+    def apply_changes(self, bundle):
+        # 合并别的设备发来的增量，返回 {"added", "deleted"}。记录只增删不修改：同一个 uid 只进一次，
+        # 删除留墓碑、先到的删除挡住后到的新增，分类取并集，所以结果和到达顺序无关
+        bundle = self.check_sync_bundle(bundle)
+        log = self.changes
+        added = deleted = 0
+        self.start_sync()
+        with self.file_lock():
+            state = log.load_state()
+            vector = state["vector"]
+            fresh = [entry for entry in bundle["changes"] if entry["seq"] > vector.get(entry["dev"], 0)]
+            if fresh:
+                log.ensure_index()
+                adds, deletes, relay, categories = {}, [], [], False
+                for entry in fresh:
+                    uid, op = entry.get("uid"), entry.get("op")
+                    if op == "add":
+                        if uid in log.deleted or uid in adds or log.local_id(uid) is not None:
+                            continue
+                        adds[uid] = entry
+                        continue
+                    if op == "delete":
+                        log.deleted.add(uid)
+                        if adds.pop(uid, None) is None:
+                            rid = log.local_id(uid)
+                            if rid is not None:
+                                deletes.append((rid, entry.get("month")))
+                    elif op == "categories":
+                        categories = self.merge_categories(entry["categories"]) or categories
+                    relay.append(entry)
+                records = [dict(entry["record"]) for entry in adds.values()]
+                if records:
+                    state["merged"] = True
+                    self.insert_records(records, log=False)
+                # 合并进来的条目原样（带原设备的 dev/seq）记进本机日志，再转给第三台设备
+                relay += [dict(entry, id=r["id"]) for entry, r in zip(adds.values(), records)]
+                deleted = self.delete_ids(deletes, log=False)
+                added = len(records)
+                if categories:
+                    self.save_data()
+                log.record(relay)
+                self.flush()
+                self.changes.write()
+                state = log.load_state()
+                for entry in fresh:
+                    state["vector"][entry["dev"]] = max(state["vector"].get(entry["dev"], 0), entry["seq"])
+            peer = bundle.get("device")
+            if peer:
+                known = state["peers"].setdefault(peer, {"vector": {}, "offset": 0})
+                for dev, seq in bundle["vector"].items():
+                    known["vector"][dev] = max(known["vector"].get(dev, 0), seq)
+                if log.size() > max(self.CHANGES_TRIM_SIZE, 2 * state.get("trimmed", 0)):
+                    log.trim()
+            log.save_state()
+        if fresh:
+            self.notify("sync")
+        return {"added": added, "deleted": deleted}
+    
+    def export_sync_bundle(self, path, peer=None):
+        # 文件方式：把 peer 还没有的改动写成一个 JSON 包，拷到另一台设备上 import_sync_bundle
+        bundle = self.sync_bundle(peer)
+        self.write_json_atomic(path, bundle)
+        return len(bundle["changes"])
+    
+    def import_sync_bundle(self, path):
+        try:
+            bundle = self.read_json(path)
+        except ValueError:
+            bundle = None
+        if not isinstance(bundle, dict) or "changes" not in bundle:
+            raise ValueError(f"不是同步包：{path}")
+        return self.apply_changes(bundle)
+    
+    def sync_token(self, token=None):
+        # 配对码：sync-serve 第一次启动时随机生成并记在同步状态里，对方 sync 时要带上它
+        with self.file_lock():
+            state = self.changes.load_state()
+            if token or not state.get("token"):
+                state["token"] = token or os.urandom(16).hex()
+                self.changes.save_state()
+            return state["token"]
+    
+    def serve_sync(self, host="127.0.0.1", port=8765, token=None):
+        # 局域网方式：POST /sync 收对方的增量、回自己的增量。返回服务器对象（server.token 是配对码），
+        # 调用方 serve_forever()。默认只听本机；要让别的设备连进来得显式给 host="0.0.0.0"
+        import hmac
+        import http.server
+        
+        manager = self
+        token = self.sync_token(token)
+        expected = f"Bearer {token}".encode('utf-8')
+        
+        class SyncHandler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.rstrip("/") != "/sync":
+                    self.send_error(404)
+                    return
+                # 配对码对不上一律 401，不回任何账本内容
+                if not hmac.compare_digest(self.headers.get("Authorization", "").encode('utf-8'), expected):
+                    self.send_error(401)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", ""))
+                except ValueError:
+                    self.send_error(411)
+                    return
+                if length > manager.SYNC_BODY_LIMIT:
+                    self.send_error(413)
+                    return
+                try:
+                    # apply_changes 先整包校验，设备号和时钟能走到下一行就是合格的
+                    bundle = json.loads(self.rfile.read(length))
+                    manager.apply_changes(bundle)
+                    reply = manager.sync_bundle(bundle.get("device"), bundle.get("vector") or {})
+                except (ValueError, TypeError, KeyError) as e:
+                    # 说明放在响应体里：状态行只能是 latin-1
+                    self.send_error(400, "Bad sync bundle", str(e))
+                    return
+                body = json.dumps(reply, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = http.server.ThreadingHTTPServer((host, port), SyncHandler)
+        server.token = token
+        return server
+    
+    def sync_with(self, url, token, timeout=30):
+        # 和另一台设备的 serve_sync 交换一次，token 是对方 sync-serve 显示的配对码；返回 {"sent", "added", "deleted"}
+        import urllib.request
+        
+        url = url.rstrip("/")
+        with self.file_lock():
+            peer = self.changes.load_state().get("remotes", {}).get(url)
+        bundle = self.sync_bundle(peer)
+        request = urllib.request.Request(
+            url + "/sync",
+            data=json.dumps(bundle, ensure_ascii=False).encode('utf-8'),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read(self.SYNC_BODY_LIMIT + 1)
+        if len(body) > self.SYNC_BODY_LIMIT:
+            raise ValueError("对方回的同步包太大")
+        reply = json.loads(body)
+        result = self.apply_changes(reply)
+        with self.file_lock():
+            state = self.changes.load_state()
+            state.setdefault("remotes", {})[url] = reply.get("device")
+            self.changes.save_state()
+        result["sent"] = len(bundle["changes"])
+        return result
+    
+    def export_records(self, path, start=None, end=None, progress=None, fmt=None):
+        # 流式导出，fmt 不给就看后缀：.csv 带表头（带 BOM，Excel 能直接打开）；
+        # .json 是带分类表的单文件 {"categories", "records"}（旧版 roro_data.json 的格式，拷到别处最方便）；
+        # 其他写 JSON Lines。三种都能再导入。返回条数
+        fmt = fmt or self.export_format(path)
+        if fmt not in ("csv", "json", "jsonl"):
+            raise ValueError(f"不支持的导出格式：{fmt}")
+        tmp = path + ".tmp"
+        count = 0
+        with open(tmp, 'w', encoding='utf-8-sig' if fmt == "csv" else 'utf-8', newline='') as f:
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=RecordStore.FIELDS, extrasaction='ignore')
+                writer.writeheader()
+            elif fmt == "json":
+                categories = json.dumps(self.data["categories"], ensure_ascii=False)
+                f.write(f'{{"categories": {categories}, "records": [')
+            for r in self.iter_records(start, end):
+                if fmt == "csv":
+                    writer.writerow(r)
+                elif fmt == "json":
+                    f.write(("," if count else "") + "\n" + json.dumps(dict(r), ensure_ascii=False))
+                else:
+                    f.write(json.dumps(dict(r), ensure_ascii=False) + "\n")
+                count += 1
+                if progress and count % self.IMPORT_PROGRESS_EVERY == 0:
+                    progress(count, None)
+            if fmt == "json":
+                f.write("\n]}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if progress:
+            progress(count, 1.0)
+        return count
+    
+    @synchronized
+    def get_records(self, date):
+        self.load_month(date[:7])
+        return self.live_records(self.by_day.get(date, []))
+    
+    def get_today_records(self):
+        return self.get_records(datetime.now().strftime("%Y-%m-%d"))
+    
+    def get_month_records(self, month):
+        self.load_month(month)
+        return self.live_records(self.by_month.get(month, []))
+    
+    def iter_records(self, start=None, end=None):
+        # 新的在前，一天一个桶地往外给；列表按需取，不一次性建出全部记录
+        with self.mutex:
+            self.ensure_months(start, end)
+            days = sorted(
+                (d for d in self.by_day if (start is None or d >= start) and (end is None or d <= end)),
+                reverse=True,
+            )
+        for day in days:
+            for r in reversed(self.get_records(day)):
+                yield r
+    
+    def get_month_summary(self, month=None):
+        if month is None:
+            now = datetime.now()
+            month = f"{now.year}-{now.month:02d}"
+        by_type = self.month_totals.get(month, self.empty_totals())["type"]
+        income = by_type.get("收入", 0)
+        expense = by_type.get("支出", 0)
+        return {"income": income / 100, "expense": expense / 100, "balance": (income - expense) / 100}
+    
+    @synchronized
+    def get_range_summary(self, start=None, end=None):
+        # 任意日期区间（含两端）的收支：按天树状数组上两次前缀和
+        self.ensure_months(start, end)
+        store = self.records
+        lo = store.day_ordinal(start) if start else 1
+        hi = store.day_ordinal(end) if end else datetime.max.toordinal()
+        income, expense = self.day_sums.range(lo, hi)
+        return {"income": income / 100, "expense": expense / 100, "balance": (income - expense) / 100}
+    
+    @synchronized
+    def get_balance(self, date):
+        # 截至某天（含）的累计结余，画结余曲线时每个点一次查询
+        self.ensure_months(None, date)
+        income, expense = self.day_sums.prefix(self.records.day_ordinal(date))
+        return (income - expense) / 100
+    
+    def get_totals(self):
+        by_type = self.totals["type"]
+        return {
+            "count": self.totals["count"],
+            "expense": by_type.get("支出", 0) / 100,
+            "income": by_type.get("收入", 0) / 100,
+        }
+    
+    def get_category_totals(self, month=None):
+        # {(类型, 分类): 金额}，month 为空时是全部记录
+        totals = self.totals if month is None else self.month_totals.get(month, self.empty_totals())
+        return {key: cents / 100 for key, cents in totals["category"].items()}
+    
+    @synchronized
+    def get_range_stats(self, start=None, end=None):
+        # 任意日期范围的统计：分类占比、逐月走势、日均和最大几笔支出
+        key = (start, end)
+        stats = self.stats_cache.get(key)
+        if stats is None:
+            stats = self.stats_cache[key] = self.compute_stats(start, end)
+        return stats
+    
+    def compute_stats(self, start, end):
+        self.ensure_months(start, end)
+        store = self.records
+        lo = store.day_ordinal(start) if start else 1
+        hi = store.day_ordinal(end) if end else datetime.max.toordinal()
+        if len(store) and load_numpy() is not None:
+            count, categories, months, top, span = self.stats_numpy(lo, hi)
+        else:
+            count, categories, months, top, span = self.stats_python(start, end)
+        symbols = store.symbols
+        return self.stats_result(
+            start, end, count,
+            {(symbols[t], symbols[c]): cents for (t, c), cents in categories.items()},
+            months,
+            [store.view(row).to_dict() for row in top],
+            span and (store.day_name(span[0]), store.day_name(span[1])),
+        )
+    
+    def stats_numpy(self, lo, hi):
+        # 直接在列存的缓冲区上筛选和分组，不为每条记录建字典
+        store = self.records
+        
+        def column(values):
+            # 大写类型码是无符号整数
+            return np.frombuffer(values, dtype=f"{'u' if values.typecode.isupper() else 'i'}{values.itemsize}")
+        
+        days = column(store.days)
+        sel = np.flatnonzero((days >= lo) & (days <= hi) & (np.frombuffer(store.alive, dtype=np.uint8) != 0))
+        days = days[sel]
+        cents = column(store.cents)[sel]
+        types = column(store.types)[sel].astype(np.int64)
+        cats = column(store.cats)[sel].astype(np.int64)
+        ids = column(store.ids)[sel]
+        if not len(sel):
+            return 0, {}, {}, [], None
+        
+        keys, inverse = np.unique((types << 16) | cats, return_inverse=True)
+        sums = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse, cents)
+        categories = {(int(k) >> 16, int(k) & 0xFFFF): int(v) for k, v in zip(keys, sums)}
+        
+        # 先对去重后的日期求月份，再把月份下标映射回每一行
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        labels = sorted({store.day_name(int(d))[:7] for d in unique_days})
+        position = {m: i for i, m in enumerate(labels)}
+        month_index = np.array([position[store.day_name(int(d))[:7]] for d in unique_days])[day_index]
+        months = {m: [0, 0] for m in labels}
+        for slot, rtype in ((0, "收入"), (1, "支出")):
+            mask = types == store.codes.get(rtype, -1)
+            per_month = np.zeros(len(labels), dtype=np.int64)
+            np.add.at(per_month, month_index[mask], cents[mask])
+            for m, value in zip(labels, per_month):
+                months[m][slot] = int(value)
+        
+        # 最大几笔：先用第 N 大的金额筛掉大部分，再按金额降序、id 升序排
+        expense = np.flatnonzero(types == store.codes.get("支出", -1))
+        if len(expense) > self.STATS_TOP:
+            kth = np.partition(cents[expense], -self.STATS_TOP)[-self.STATS_TOP]
+            expense = expense[cents[expense] >= kth]
+        expense = expense[np.lexsort((ids[expense], -cents[expense]))][:self.STATS_TOP]
+        top = [int(row) for row in sel[expense]]
+        return len(sel), categories, months, top, (int(unique_days[0]), int(unique_days[-1]))
+    
+    def stats_python(self, start, end):
+        store = self.records
+        expense = store.codes.get("支出", -1)
+        income = store.codes.get("收入", -1)
+        count = 0
+        categories = {}
+        months = {}
+        spent = []
+        span = None
+        days = sorted(d for d in self.by_day if (start is None or d >= start) and (end is None or d <= end))
+        for day in days:
+            for row in self.by_day[day]:
+                # 日期解析不了的旧数据天数是 0，跟 NumPy 那条路一样不算进统计
+                if not store.alive[row] or not store.days[row]:
+                    continue
+                count += 1
+                ordinal = store.days[row]
+                span = (span[0], ordinal) if span else (ordinal, ordinal)
+                sums = months.setdefault(day[:7], [0, 0])
+                key = (store.types[row], store.cats[row])
+                categories[key] = categories.get(key, 0) + store.cents[row]
+                if key[0] == income:
+                    sums[0] += store.cents[row]
+                elif key[0] == expense:
+                    sums[1] += store.cents[row]
+                    spent.append((-store.cents[row], store.ids[row], row))
+        top = [row for _, _, row in sorted(spent)[:self.STATS_TOP]]
+        return count, categories, months, top, span
+    
+    @staticmethod
+    def stats_result(start, end, count, categories, months, top, span):
+        # 两种存储算出的分组结果在这里统一成界面要的格式，金额单位换回元
+        type_totals = {}
+        for (rtype, _), cents in categories.items():
+            type_totals[rtype] = type_totals.get(rtype, 0) + cents
+        income = type_totals.get("收入", 0)
+        expense = type_totals.get("支出", 0)
+        # 日均按范围内已经过去的天数算，本月还没过完的日子不摊进去
+        days = 0
+        first, last = span or (None, None)
+        begin = start or first
+        finish = end or last
+        if begin and finish:
+            finish = min(finish, datetime.now().strftime("%Y-%m-%d"))
+            days = max((datetime.strptime(finish, "%Y-%m-%d") - datetime.strptime(begin, "%Y-%m-%d")).days + 1, 0)
+        return {
+            "start": start,
+            "end": end,
+            "count": count,
+            "income": income / 100,
+            "expense": expense / 100,
+            "balance": (income - expense) / 100,
+            "days": days,
+            "daily_expense": round(expense / 100 / days, 2) if days else 0.0,
+            "categories": [
+                {
+                    "type": rtype,
+                    "category": category,
+                    "amount": cents / 100,
+                    "share": cents / type_totals[rtype] if type_totals[rtype] else 0.0,
+                }
+                for (rtype, category), cents in sorted(categories.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            "months": [
+                {"month": m, "income": inc / 100, "expense": exp / 100}
+                for m, (inc, exp) in sorted(months.items())
+            ],
+            "top": top,
+        }
+
+
+class SqliteDataManager(DataManager):
+    # 记录存在 SQLite 里，查询直接走 date/type/category 索引上的聚合
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            amount REAL NOT NULL DEFAULT 0,
+            category TEXT NOT NULL DEFAULT '',
+            icon TEXT NOT NULL DEFAULT '',
+            note TEXT NOT NULL DEFAULT '',
+            date TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_date ON records(date);
+        CREATE INDEX IF NOT EXISTS idx_records_type ON records(type, amount);
+        CREATE INDEX IF NOT EXISTS idx_records_category ON records(category);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+    COLUMNS = ("id", "type", "amount", "category", "icon", "note", "date")
+    # 按整数分求和再换回元，避免 REAL 累加的浮点误差
+    SUM_CENTS = "SUM(CAST(ROUND(amount * 100) AS INTEGER))"
+    # 全部汇总都是按日期索引现算的，往年记录不占内存，不需要归档
+    ARCHIVE = False
+    
+    def __init__(self):
+        self.db_file = "roro_data.db"
+        self.conn = None
+        self.data_version = None
+        super().__init__()
+    
+    def load_data(self):
+        self.conn = sqlite3.connect(self.get_data_path(self.db_file), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        if self.get_meta("migrated") is None:
+            self.migrate_from_json()
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        categories = self.get_meta("categories")
+        try:
+            categories = json.loads(categories)
+        except:
+            categories = self.default_categories()
+        return {"categories": categories}
+    
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def migrate_from_json(self):
+        # 一次性把旧的 roro_data.json（连同日志）导进来，旧文件原样保留作备份
+        data = DataManager.load_data(self)
+        self.ensure_months()
+        rows = (
+            (r["type"] or "支出", r["amount"], r["category"], r["icon"], r["note"], r["date"])
+            for r in self.live_records()
+        )
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO records (type, amount, category, icon, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.set_meta("categories", json.dumps(data["categories"], ensure_ascii=False))
+            self.set_meta("migrated", datetime.now().isoformat())
+        self.build_index([], {})
+        self.journal_size = 0
+        self.journal_torn = False
+    
+    @synchronized
+    def save_data(self):
+        start = time.perf_counter()
+        try:
+            with self.conn:
+                self.set_meta("categories", json.dumps(self.data["categories"], ensure_ascii=False))
+        except sqlite3.Error as e:
+            self.report_error(e)
+            return
+        perf.record("save_data", time.perf_counter() - start)
+    
+    def start_writer(self, on_error=None):
+        # SQLite 每次改动本身就是一个小事务，不需要后台写线程
+        if on_error is not None and on_error not in self.error_listeners:
+            self.error_listeners.append(on_error)
+    
+    def flush(self):
+        return True
+    
+    def sync_external(self):
+        # 别的连接提交过事务 data_version 就会变，跨进程的锁和日志都由 SQLite 自己管
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = self.data_version is not None and version != self.data_version
+        self.data_version = version
+        return changed
+    
+    def row_to_record(self, row):
+        return dict(zip(self.COLUMNS, row))
+    
+    @synchronized
+    def compact(self):
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.execute("VACUUM")
+    
+    def archive_years(self, before=None):
+        return 0
+    
+    def recurring_rules(self):
+        # 规则存在 meta 表里，每次现读，别的进程刚补记过也能看到它推进过的 last
+        try:
+            rules = json.loads(self.get_meta("recurring") or "[]")
+        except ValueError:
+            rules = []
+        self.data["recurring"] = rules
+        return rules
+    
+    def save_recurring(self):
+        with self.conn:
+            self.set_meta("recurring", json.dumps(self.data["recurring"], ensure_ascii=False))
+    
+    def record_keys(self):
+        rows = self.conn.execute("SELECT date, type, CAST(ROUND(amount * 100) AS INTEGER), category, note FROM records")
+        return set(rows)
+    
+    @synchronized
+    def insert_records(self, records, log=True):
+        # 一个事务插完，分类表也在同一个事务里更新；逐条执行是为了拿到新 id 写进 r
+        inserted = []
+        with self.conn:
+            for r in records:
+                r["id"] = self.conn.execute(
+                    "INSERT INTO records (type, amount, category, icon, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                    (r["type"], r["amount"], r["category"], r["icon"], r["note"], r["date"]),
+                ).lastrowid
+                inserted.append(r)
+            self.set_meta("categories", json.dumps(self.data["categories"], ensure_ascii=False))
+        if log and inserted:
+            for r in inserted:
+                self.changes.record_add({key: r[key] for key in self.COLUMNS})
+            self.write_changes()
+    
+    @synchronized
+    def add_record(self, rtype, amount, category, icon, note, date):
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO records (type, amount, category, icon, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                (rtype, amount, category, icon, note, date),
+            )
+        record = self.row_to_record((cur.lastrowid, rtype, amount, category, icon, note, date))
+        self.changes.record_add(dict(record))
+        self.write_changes()
+        self.notify("add", record)
+    
+    @synchronized
+    def delete_record(self, rid):
+        record = self.get_record(rid)
+        if record is None:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE id = ?", (rid,))
+        self.changes.record_deletes([(rid, record["date"][:7])])
+        self.write_changes()
+        self.notify("delete", record)
+    
+    def get_record(self, rid):
+        row = self.conn.execute(
+            "SELECT id, type, amount, category, icon, note, date FROM records WHERE id = ?", (rid,)
+        ).fetchone()
+        return self.row_to_record(row) if row else None
+    
+    @synchronized
+    def delete_records(self, start=None, end=None, category=None, rtype=None):
+        where = " WHERE 1"
+        params = []
+        for clause, value in (("date >= ?", start), ("date <= ?", end), ("category = ?", category), ("type = ?", rtype)):
+            if value is not None:
+                where += " AND " + clause
+                params.append(value)
+        targets = [(rid, date[:7]) for rid, date in self.conn.execute("SELECT id, date FROM records" + where, params)]
+        return self.delete_ids(targets)
+    
+    @synchronized
+    def delete_ids(self, targets, log=True):
+        ids = [rid for rid, _ in targets]
+        count = 0
+        with self.conn:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                count += self.conn.execute(
+                    f"DELETE FROM records WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).rowcount
+        if log and targets:
+            self.changes.record_deletes(targets)
+            self.write_changes()
+        if count:
+            self.notify("delete_many")
+        return count
+    
+    @synchronized
+    def clear_records(self):
+        targets = [(rid, date[:7]) for rid, date in self.conn.execute("SELECT id, date FROM records")]
+        with self.conn:
+            self.conn.execute("DELETE FROM records")
+        self.changes.record_deletes(targets)
+        self.write_changes()
+        self.notify("clear")
+    
+    def get_records(self, date):
+        rows = self.conn.execute(
+            "SELECT id, type, amount, category, icon, note, date FROM records WHERE date = ? ORDER BY id",
+            (date,),
+        )
+        return [self.row_to_record(row) for row in rows]
+    
+    def get_month_records(self, month):
+        rows = self.conn.execute(
+            "SELECT id, type, amount, category, icon, note, date FROM records"
+            " WHERE date >= ? AND date < ? ORDER BY id",
+            (month, month + "~"),
+        )
+        return [self.row_to_record(row) for row in rows]
+    
+    def iter_records(self, start=None, end=None):
+        sql = "SELECT id, type, amount, category, icon, note, date FROM records WHERE 1"
+        params = []
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(end)
+        cur = self.conn.execute(sql + " ORDER BY date DESC, id DESC", params)
+        while True:
+            rows = cur.fetchmany(100)
+            if not rows:
+                return
+            for row in rows:
+                yield self.row_to_record(row)
+    
+    def get_month_summary(self, month=None):
+        if month is None:
+            now = datetime.now()
+            month = f"{now.year}-{now.month:02d}"
+        # "~" 排在数字和 "-" 之后，前缀区间能直接用上 date 索引
+        sums = dict(self.conn.execute(
+            f"SELECT type, {self.SUM_CENTS} FROM records WHERE date >= ? AND date < ? GROUP BY type",
+            (month, month + "~"),
+        ).fetchall())
+        income = sums.get("收入") or 0
+        expense = sums.get("支出") or 0
+        return {"income": income / 100, "expense": expense / 100, "balance": (income - expense) / 100}
+    
+    def get_category_totals(self, month=None):
+        if month is None:
+            rows = self.conn.execute(
+                f"SELECT type, category, {self.SUM_CENTS} FROM records GROUP BY type, category"
+            )
+        else:
+            rows = self.conn.execute(
+                f"SELECT type, category, {self.SUM_CENTS} FROM records WHERE date >= ? AND date < ?"
+                " GROUP BY type, category",
+                (month, month + "~"),
+            )
+        return {(rtype, category): cents / 100 for rtype, category, cents in rows}
+    
+    def search_records(self, query="", rtype=None, min_amount=None, max_amount=None, start=None, end=None):
+        # 备注和分类直接用 instr 子串匹配，其余条件走索引
+        sql = "SELECT id, type, amount, category, icon, note, date FROM records WHERE 1"
+        params = []
+        for term in query.lower().split():
+            sql += " AND instr(lower(note || char(10) || category), ?) > 0"
+            params.append(term)
+        for clause, value in (
+            ("type = ?", rtype), ("amount >= ?", min_amount), ("amount <= ?", max_amount),
+            ("date >= ?", start), ("date <= ?", end),
+        ):
+            if value is not None:
+                sql += " AND " + clause
+                params.append(value)
+        cur = self.conn.execute(sql + " ORDER BY date DESC, id DESC", params)
+        while True:
+            rows = cur.fetchmany(100)
+            if not rows:
+                return
+            for row in rows:
+                yield self.row_to_record(row)
+    
+    def get_range_summary(self, start=None, end=None):
+        sql = f"SELECT type, {self.SUM_CENTS} FROM records WHERE 1"
+        params = []
+        if start is not None:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND date <= ?"
+            params.append(end)
+        sums = dict(self.conn.execute(sql + " GROUP BY type", params).fetchall())
+        income = sums.get("收入") or 0
+        expense = sums.get("支出") or 0
+        return {"income": income / 100, "expense": expense / 100, "balance": (income - expense) / 100}
+    
+    def get_balance(self, date):
+        summary = self.get_range_summary(None, date)
+        return summary["balance"]
+    
+    def compute_stats(self, start, end):
+        # 分组都交给 SQLite，结果和列存版本走同一个格式化
+        where = " WHERE 1"
+        params = []
+        if start is not None:
+            where += " AND date >= ?"
+            params.append(start)
+        if end is not None:
+            where += " AND date <= ?"
+            params.append(end)
+        count, first, last = self.conn.execute(f"SELECT COUNT(*), MIN(date), MAX(date) FROM records{where}", params).fetchone()
+        categories = {
+            (rtype, category): cents
+            for rtype, category, cents in self.conn.execute(
+                f"SELECT type, category, {self.SUM_CENTS} FROM records{where} GROUP BY type, category", params
+            )
+        }
+        months = {}
+        for month, rtype, cents in self.conn.execute(
+            f"SELECT substr(date, 1, 7), type, {self.SUM_CENTS} FROM records{where} GROUP BY 1, 2", params
+        ):
+            sums = months.setdefault(month, [0, 0])
+            if rtype == "收入":
+                sums[0] = cents
+            elif rtype == "支出":
+                sums[1] = cents
+        top = [
+            self.row_to_record(row)
+            for row in self.conn.execute(
+                f"SELECT id, type, amount, category, icon, note, date FROM records{where} AND type = '支出'"
+                " ORDER BY amount DESC, id LIMIT ?",
+                params + [self.STATS_TOP],
+            )
+        ]
+        return self.stats_result(start, end, count, categories, months, top, count and (first, last))
+    
+    def get_totals(self):
+        totals = {"count": 0, "expense": 0, "income": 0}
+        for rtype, count, cents in self.conn.execute(
+            f"SELECT type, COUNT(*), {self.SUM_CENTS} FROM records GROUP BY type"
+        ):
+            totals["count"] += count
+            if rtype == "支出":
+                totals["expense"] = (cents or 0) / 100
+            elif rtype == "收入":
+                totals["income"] = (cents or 0) / 100
+        return totals
+
+
+def create_data_manager():
+    # RORO_STORAGE=sqlite 切到 SQLite；已经迁移过的数据库会被自动沿用
+    backend = os.environ.get('RORO_STORAGE', '').lower()
+    if backend == "sqlite" or (backend != "json" and os.path.exists(DataManager.storage_path("roro_data.db"))):
+        return SqliteDataManager()
+    return DataManager()
+
+
+# 进程内共享的实例，按 (后端, 数据目录) 区分
+shared_managers = {}
+shared_lock = threading.Lock()
+
+
+def shared_data_manager():
+    # 网页模式下每个浏览器会话都会跑一遍 main(page)；同一个数据目录只读一次、只有一个写线程，
+    # 各会话通过 subscribe 收到别的会话的改动，不用重新读盘
+    backend = os.environ.get('RORO_STORAGE', '').lower()
+    key = (backend, os.path.abspath(DataManager.storage_path("")))
+    with shared_lock:
+        dm = shared_managers.get(key)
+        if dm is None:
+            dm = shared_managers[key] = create_data_manager()
+        return dm
+
+
+def cli(argv=None):
+    # 不启动界面，直接在数据文件上做汇总、导入、导出和压缩
+    parser = argparse.ArgumentParser(prog="roro_core", description="Roro记账数据命令行")
+    parser.add_argument("--data", help="数据目录，默认和 App 一样（FLET_APP_STORAGE_DATA 或当前目录）")
+    parser.add_argument("--backend", choices=["json", "sqlite"], help="存储后端，默认自动判断")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="总计、某月汇总和分类汇总")
+    summary.add_argument("--month", help="YYYY-MM，默认本月")
+    importing = commands.add_parser("import", help="导入 CSV、JSON Lines 或单文件 JSON（看后缀）")
+    importing.add_argument("path")
+    exporting = commands.add_parser("export", help="导出为 CSV、JSON Lines 或单文件 JSON")
+    exporting.add_argument("path")
+    exporting.add_argument("--format", choices=["csv", "jsonl", "json"], help="默认看后缀：.csv、.json，其他是 JSON Lines")
+    exporting.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    exporting.add_argument("--end", help="结束日期 YYYY-MM-DD")
+    commands.add_parser("compact", help="合并日志、清掉已删除的记录并重写数据文件")
+    archiving = commands.add_parser("archive", help="把往年的记录压缩归档，总计和汇总不变")
+    archiving.add_argument("--before", type=int, help="归档这一年之前的记录，默认今年")
+    searching = commands.add_parser("search", help="搜索记录，每行输出一条 JSON")
+    searching.add_argument("text", nargs="+", help="关键词，可以带 支出/收入、>100、<50、2025-03")
+    bundling = commands.add_parser("sync-export", help="把对方还没有的改动写成同步包")
+    bundling.add_argument("path")
+    bundling.add_argument("--peer", help="对方的设备号，默认导出全部改动")
+    unbundling = commands.add_parser("sync-import", help="合并另一台设备导出的同步包")
+    unbundling.add_argument("path")
+    serving = commands.add_parser("sync-serve", help="在局域网上等别的设备来同步")
+    serving.add_argument("--host", default="127.0.0.1", help="默认只听本机；给 0.0.0.0 才能让局域网里的设备连进来")
+    serving.add_argument("--port", type=int, default=8765)
+    serving.add_argument("--token", help="指定配对码，默认用上次生成的（第一次随机生成）")
+    syncing = commands.add_parser("sync", help="和 sync-serve 的设备交换一次改动")
+    syncing.add_argument("url", help="例如 http://192.168.1.5:8765")
+    syncing.add_argument("--token", required=True, help="对方 sync-serve 显示的配对码")
+    args = parser.parse_args(argv)
+    
+    if args.data:
+        os.environ["FLET_APP_STORAGE_DATA"] = args.data
+    if args.backend:
+        os.environ["RORO_STORAGE"] = args.backend
+    dm = create_data_manager()
+    if args.command == "summary":
+        month = args.month or datetime.now().strftime("%Y-%m")
+        result = {
+            "totals": dm.get_totals(),
+            "month": month,
+            "summary": dm.get_month_summary(month),
+            "categories": [[rtype, name, amount] for (rtype, name), amount in sorted(dm.get_category_totals(month).items())],
+        }
+    elif args.command == "import":
+        def progress(done, fraction):
+            print(f"\r已处理 {done} 行", end="", file=sys.stderr, flush=True)
+        result = dm.import_records(args.path, progress)
+        print(file=sys.stderr)
+    elif args.command == "export":
+        result = {"exported": dm.export_records(args.path, args.start, args.end, fmt=args.format)}
+    elif args.command == "search":
+        for r in dm.search_records(**parse_search_query(" ".join(args.text))):
+            print(json.dumps(dict(r), ensure_ascii=False))
+        dm.flush()
+        return 0
+    elif args.command == "sync-export":
+        result = {"changes": dm.export_sync_bundle(args.path, args.peer)}
+    elif args.command == "sync-import":
+        result = dm.import_sync_bundle(args.path)
+    elif args.command == "sync-serve":
+        server = dm.serve_sync(args.host, args.port, args.token)
+        print(f"同步服务已启动：http://{args.host}:{args.port}  配对码：{server.token}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        dm.flush()
+        return 0
+    elif args.command == "sync":
+        result = dm.sync_with(args.url, args.token)
+    elif args.command == "archive":
+        result = {"archived": dm.archive_years(args.before), "years": sorted(dm.archives), "totals": dm.get_totals()}
+    else:
+        dm.compact()
+        result = {"totals": dm.get_totals()}
+    dm.flush()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
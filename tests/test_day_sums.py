@@ -0,0 +1,45 @@
+# 按天收支树：离群日期零散存，树的大小不跟着被撑开，前缀和跟逐天累加对得上
+import random
+import unittest
+from datetime import date
+
+from roro_core import DaySums
+
+
+class DaySumsTest(unittest.TestCase):
+    def check(self, sums, points, probes):
+        for ordinal in probes:
+            expected = [0, 0]
+            for day, (income, expense) in points.items():
+                if day <= ordinal:
+                    expected[0] += income
+                    expected[1] += expense
+            self.assertEqual(sums.prefix(ordinal), tuple(expected), ordinal)
+    
+    def test_outlier_dates(self):
+        rng = random.Random(7)
+        sums, points = DaySums(), {}
+        
+        def add(day, income, expense):
+            sums.add(day, income, expense)
+            old = points.get(day, (0, 0))
+            points[day] = old[0] + income, old[1] + expense
+        # 写错年份的记录先读进来（分片按月份排序，0202 年排在最前），再是正常的几年
+        outliers = [date(202, 2, 2).toordinal(), date(9999, 12, 31).toordinal(), 1]
+        for day in outliers:
+            add(day, 5, 7)
+        start = date(2020, 1, 1).toordinal()
+        for k in range(4000):
+            add(start + k, k, 2 * k)
+        for k in range(0, 4000, 5):
+            add(start + k, -k, -2 * k)
+        self.assertLessEqual(len(sums.income), 2 * DaySums.SPAN)
+        self.assertEqual(sorted(sums.far), sorted(outliers))
+        probes = outliers + [0, start - 1, start, start + 1999, start + 4000, 10 ** 7]
+        probes += [rng.randint(1, date(9999, 12, 31).toordinal()) for _ in range(100)]
+        self.check(sums, points, probes)
+        self.assertEqual(sums.range(start, start + 3999), tuple(map(sum, zip(*[points[start + k] for k in range(4000)]))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# 两个进程同时往一个数据目录里记账：写盘要互相加锁、合并对方的日志，撞了 id 的换号
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from roro_core import create_data_manager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import sys, time, roro_core
+dm = roro_core.create_data_manager()
+dm.WRITE_DELAY, dm.WRITE_MAX_DELAY = 0.005, 0.02
+dm.start_writer()
+name, count = sys.argv[1], int(sys.argv[2])
+print("ready", flush=True)
+sys.stdin.readline()
+for i in range(count):
+    dm.add_record("支出", i + 1, "餐饮", "", f"{name}{i}", "2026-03-%02d" % (i % 28 + 1))
+    if i % 50 == 0:
+        time.sleep(0.01)
+dm.flush()
+print("done", flush=True)
+"""
+
+
+class ProcessesTest(unittest.TestCase):
+    COUNT = 300
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="roro_test_")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+    
+    def env(self, path, backend):
+        return mock.patch.dict(os.environ, {"FLET_APP_STORAGE_DATA": path, "RORO_STORAGE": backend})
+    
+    def run_workers(self, path, backend):
+        env = dict(os.environ, FLET_APP_STORAGE_DATA=path, RORO_STORAGE=backend)
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-c", WORKER, name, str(self.COUNT)], cwd=ROOT, env=env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            )
+            for name in ("p", "q")
+        ]
+        for proc in procs:
+            self.addCleanup(proc.kill)
+            self.assertEqual(proc.stdout.readline().strip(), "ready")
+        # 两个都准备好了再一起开始，让写盘交错起来
+        for proc in procs:
+            proc.stdin.write("go\n")
+            proc.stdin.flush()
+        for proc in procs:
+            out, _ = proc.communicate(timeout=120)
+            self.assertEqual((proc.returncode, out.strip()), (0, "done"))
+    
+    def test_two_writers(self):
+        for backend in ("json", "sqlite"):
+            with self.subTest(backend=backend):
+                path = os.path.join(self.dir, backend)
+                os.makedirs(path)
+                with self.env(path, backend):
+                    dm = create_data_manager()
+                    dm.add_record("支出", 1, "餐饮", "", "base", "2026-03-01")
+                    dm.start_sync()
+                    dm.flush()
+                self.run_workers(path, backend)
+                expected = ["base"] + [f"{name}{i}" for name in "pq" for i in range(self.COUNT)]
+                with self.env(path, backend):
+                    dm.sync_external()
+                    records = list(dm.iter_records())
+                    self.assertEqual(sorted(r["note"] for r in records), sorted(expected))
+                    self.assertEqual(len({r["id"] for r in records}), len(expected))
+                    # 重新打开读到的是同一份，同步日志里的 id 也跟着换过号，导给新设备一条不少
+                    fresh = create_data_manager()
+                    self.assertEqual(fresh.get_totals()["count"], len(expected))
+                    self.assertEqual(sorted(r["id"] for r in fresh.iter_records()), sorted(r["id"] for r in records))
+                    bundle = os.path.join(self.dir, f"{backend}.sync.json")
+                    fresh.export_sync_bundle(bundle)
+                target = os.path.join(self.dir, f"{backend}-target")
+                os.makedirs(target)
+                with self.env(target, "json"):
+                    other = create_data_manager()
+                    self.assertEqual(other.import_sync_bundle(bundle)["added"], len(expected))
+                    self.assertEqual(len({r["id"] for r in other.iter_records()}), len(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+# 设备间同步：两三个数据目录互相交换增量，检查合并、删除墓碑、撞号、瘦身后再同步和配对码
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import urllib.error
+from unittest import mock
+
+from roro_core import DataManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Device:
+    # 数据目录取自环境变量，每次调用都切到这台设备自己的目录
+    def __init__(self, path):
+        self.path = path
+        with self.env():
+            self.dm = DataManager()
+    
+    @contextlib.contextmanager
+    def env(self):
+        with mock.patch.dict(os.environ, {"FLET_APP_STORAGE_DATA": self.path}):
+            yield
+    
+    def __getattr__(self, name):
+        attr = getattr(self.dm, name)
+        if not callable(attr):
+            return attr
+        
+        def call(*args, **kwargs):
+            with self.env():
+                return attr(*args, **kwargs)
+        return call
+    
+    @property
+    def device(self):
+        return self.changes.load_state()["device"]
+    
+    def notes(self):
+        with self.env():
+            return sorted(r["note"] for r in self.dm.iter_records())
+    
+    def ids(self):
+        with self.env():
+            return [r["id"] for r in self.dm.iter_records()]
+    
+    def find(self, note):
+        with self.env():
+            return next(r["id"] for r in self.dm.iter_records() if r["note"] == note)
+    
+    def add(self, *notes):
+        for note in notes:
+            self.add_record("支出", len(note), "餐饮", "", note, "2026-03-01")
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="roro_test_")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+    
+    def device(self, name):
+        return Device(os.path.join(self.dir, name))
+    
+    def send(self, source, target, peer=None):
+        # 文件方式：source 导出 target 还没有的改动，target 合并
+        path = os.path.join(self.dir, "bundle.json")
+        source.export_sync_bundle(path, peer and peer.device)
+        return target.import_sync_bundle(path)
+    
+    def exchange(self, a, b):
+        self.send(a, b, b)
+        self.send(b, a, a)
+    
+    def test_exchange_both_ways(self):
+        a, b, c = self.device("a"), self.device("b"), self.device("c")
+        a.add("a0", "a1", "a2")
+        b.add("b0", "b1")
+        self.assertEqual(self.send(a, b), {"added": 3, "deleted": 0})
+        self.assertEqual(self.send(b, a, a), {"added": 2, "deleted": 0})
+        self.assertEqual(a.notes(), b.notes())
+        # 重复合并同一批改动不会记重
+        self.assertEqual(self.send(b, a), {"added": 0, "deleted": 0})
+        # 第三台经 b 转手拿到 a 的记录，再直接和 a 同步也不会重复
+        self.send(b, c)
+        self.send(a, c)
+        self.assertEqual(c.notes(), ["a0", "a1", "a2", "b0", "b1"])
+    
+    def test_delete_tombstone(self):
+        a, b, c = self.device("a"), self.device("b"), self.device("c")
+        a.add("a0", "a1")
+        b.add("b0")
+        self.exchange(a, b)
+        old = os.path.join(self.dir, "old.json")
+        a.export_sync_bundle(old)
+        # 各自删对方的记录
+        b.delete_record(b.find("a1"))
+        a.delete_record(a.find("b0"))
+        self.exchange(a, b)
+        self.assertEqual(a.notes(), ["a0"])
+        self.assertEqual(b.notes(), ["a0"])
+        # 先收到删除、后收到旧的新增：墓碑挡住，记录不会复活
+        self.send(b, c)
+        self.assertEqual(c.import_sync_bundle(old)["added"], 0)
+        self.assertEqual(c.notes(), ["a0"])
+    
+    def test_id_clash(self):
+        # 两台新设备的本机 id 都从 1 开始；合并来的记录另发 id，删除按全局 uid 找回对方的原记录
+        a, b = self.device("a"), self.device("b")
+        a.add("a0", "a1")
+        b.add("b0", "b1")
+        self.assertEqual(a.ids(), b.ids())
+        self.exchange(a, b)
+        for d in (a, b):
+            self.assertEqual(len(set(d.ids())), 4)
+        a.delete_record(a.find("b1"))
+        self.send(a, b, b)
+        self.assertEqual(b.notes(), ["a0", "a1", "b0"])
+    
+    def test_renumbered_pending_records(self):
+        # 同一个数据目录里两个实例各自发了同一个 id，后落盘的换号，日志里排队的条目跟着换
+        a = self.device("a")
+        a.add("a0")
+        self.send(a, self.device("z"))
+        other = Device(a.path)
+        # 先压住写盘，两边都排上队再各自落盘
+        with mock.patch.object(a.dm, "schedule_write"), mock.patch.object(other.dm, "schedule_write"):
+            a.add("x")
+            other.add("y")
+        self.assertEqual(a.dm.pending[0]["record"]["id"], other.dm.pending[0]["record"]["id"])
+        a.flush()
+        other.flush()
+        self.assertEqual(sorted(other.ids()), sorted(set(other.ids())))
+        z = self.device("z")
+        self.send(other, z)
+        self.assertEqual(z.notes(), ["a0", "x", "y"])
+        other.delete_record(other.find("y"))
+        other.flush()
+        self.send(other, z)
+        self.assertEqual(z.notes(), ["a0", "x"])
+    
+    def test_resync_after_trim(self):
+        a, b = self.device("a"), self.device("b")
+        for d in (a, b):
+            d.dm.CHANGES_TRIM_SIZE = 1
+        a.add(*[f"a{i}" for i in range(20)])
+        b.add("b0")
+        self.exchange(a, b)
+        a.delete_record(a.find("a3"))
+        self.exchange(a, b)
+        self.exchange(a, b)
+        with open(a.changes.path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        self.assertTrue(a.changes.load_state().get("trimmed"))
+        self.assertFalse([e for e in entries if "record" in e and e.get("dev") == a.device])
+        # 瘦身后的日志还能给新设备全量，也还能继续增量同步
+        c = self.device("c")
+        self.send(a, c)
+        self.assertEqual(c.notes(), a.notes())
+        b.add("b1")
+        b.delete_record(b.find("a5"))
+        self.exchange(a, b)
+        self.assertEqual(a.notes(), b.notes())
+        self.assertNotIn("a5", a.notes())
+        self.assertIn("b1", a.notes())
+    
+    def test_bad_bundle_changes_nothing(self):
+        a, b = self.device("a"), self.device("b")
+        a.add("a0")
+        path = os.path.join(self.dir, "bundle.json")
+        a.export_sync_bundle(path)
+        with open(path, encoding="utf-8") as f:
+            bundle = json.load(f)
+        good = [e for e in bundle["changes"] if e["op"] == "add"][0]
+        bundle["changes"].append(dict(good, seq=good["seq"] + 100, uid=good["uid"] + "0", record={"type": 5}))
+        with self.assertRaises(ValueError):
+            b.apply_changes(bundle)
+        self.assertEqual(b.notes(), [])
+        self.assertTrue(b.flush())
+    
+    def test_server_rejects_bad_token(self):
+        server = self.device("server")
+        server.add("s0")
+        server.flush()
+        code = (
+            "import sys, roro_core\n"
+            "server = roro_core.DataManager().serve_sync('127.0.0.1', 0, sys.argv[1])\n"
+            "print(server.server_address[1], flush=True)\n"
+            "server.serve_forever()\n"
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-c", code, "secret"], cwd=ROOT, stdout=subprocess.PIPE, text=True,
+            env=dict(os.environ, FLET_APP_STORAGE_DATA=server.path),
+        )
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        url = f"http://127.0.0.1:{proc.stdout.readline().strip()}"
+        client = self.device("client")
+        client.add("c0")
+        with self.assertRaises(urllib.error.HTTPError) as caught:
+            client.sync_with(url, "wrong", timeout=10)
+        self.assertEqual(caught.exception.code, 401)
+        self.assertEqual(client.notes(), ["c0"])
+        result = client.sync_with(url, "secret", timeout=10)
+        self.assertEqual((result["added"], result["sent"] > 0), (1, True))
+        self.assertEqual(client.notes(), ["c0", "s0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+# 导出的三种格式（CSV、JSON Lines、单文件 JSON）都要能原样导回另一个账本
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from roro_core import DataManager
+
+
+class TransferTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="roro_test_")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.source = self.manager("source")
+        for i in range(12):
+            self.source.add_record(
+                "收入" if i % 4 == 0 else "支出", i + 0.25, "餐饮", "🍜", f'备注, "{i}"', f"2025-{i % 3 + 1:02d}-{i + 1:02d}"
+            )
+        self.source.flush()
+    
+    def manager(self, name):
+        path = os.path.join(self.dir, name)
+        env = mock.patch.dict(os.environ, {"FLET_APP_STORAGE_DATA": path})
+        env.start()
+        self.addCleanup(env.stop)
+        return DataManager()
+    
+    @staticmethod
+    def rows(dm):
+        return sorted((r["date"], r["type"], r["amount"], r["category"], r["icon"], r["note"]) for r in dm.iter_records())
+    
+    def test_round_trip(self):
+        for name, fmt in (("out.csv", None), ("out.jsonl", None), ("out.json", None), ("out.txt", "json")):
+            with self.subTest(name=name):
+                path = os.path.join(self.dir, name)
+                self.assertEqual(self.source.export_records(path, fmt=fmt), 12)
+                if fmt:
+                    shutil.copy(path, path + ".json")
+                    path += ".json"
+                target = self.manager(name + ".data")
+                self.assertEqual(target.import_records(path)["added"], 12)
+                self.assertEqual(self.rows(target), self.rows(self.source))
+                self.assertEqual(target.import_records(path)["duplicates"], 12)
+    
+    def test_json_range_and_bad_format(self):
+        path = os.path.join(self.dir, "empty.json")
+        self.assertEqual(self.source.export_records(path, start="2030-01-01"), 0)
+        with self.assertRaises(ValueError):
+            self.source.export_records(path, fmt="xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"records": 5}')
+        with self.assertRaises(ValueError):
+            self.source.import_records(path)
+
+
+if __name__ == "__main__":
+    unittest.main()